@@ -0,0 +1,180 @@
+"""
+ITMS Cross-Run Alignment
+Estimates the chainage offset and scale between two runs over the same
+section and produces per-channel difference series
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from sqlmodel import Session
+
+from app.config import settings
+from app.db import engine
+from app.models import DataSession, Measurement
+
+Channel = Tuple[str, str]
+
+def load_session_channels(
+    session: Session, data_session: DataSession
+) -> Dict[Channel, Tuple[np.ndarray, np.ndarray]]:
+    """Load (chainage, value) arrays per (sensor_id, type) for a session"""
+    end_time = data_session.end_time or datetime.utcnow()
+    rows = session.query(
+        Measurement.sensor_id, Measurement.type, Measurement.chainage, Measurement.value
+    ).filter(
+        Measurement.timestamp >= data_session.start_time,
+        Measurement.timestamp <= end_time
+    ).all()
+
+    grouped: Dict[Channel, Tuple[List[float], List[float]]] = {}
+    for sensor_id, measurement_type, chainage, value in rows:
+        key = (sensor_id, getattr(measurement_type, "value", measurement_type))
+        chainages, values = grouped.setdefault(key, ([], []))
+        chainages.append(chainage)
+        values.append(value)
+
+    return {
+        key: (np.asarray(chainages, dtype=np.float64), np.asarray(values, dtype=np.float64))
+        for key, (chainages, values) in grouped.items()
+    }
+
+def resample(chainages: np.ndarray, values: np.ndarray, step: float) -> Tuple[float, np.ndarray]:
+    """Average samples into uniform chainage bins, interpolating empty bins.
+
+    Returns the chainage of the first bin and the binned values.
+    """
+    origin = float(np.floor(chainages.min() / step) * step)
+    bins = np.round((chainages - origin) / step).astype(np.int64)
+    counts = np.bincount(bins)
+    sums = np.bincount(bins, weights=values)
+    filled = counts > 0
+    grid = np.arange(len(counts))
+    binned = np.interp(grid, grid[filled], sums[filled] / counts[filled])
+    return origin, binned
+
+def cross_correlation_lag(
+    reference: np.ndarray, other: np.ndarray, min_lag: int, max_lag: int
+) -> float:
+    """Get the lag L (in samples) maximising sum(reference[i] * other[i - L]).
+
+    Computed with an FFT over zero-padded, mean-removed signals and limited
+    to min_lag <= L <= max_lag. The peak is refined to a fraction of a
+    sample by fitting a parabola through it and its neighbours.
+    """
+    reference = reference - reference.mean()
+    other = other - other.mean()
+    size = 1 << int(np.ceil(np.log2(len(reference) + len(other))))
+    correlation = np.fft.irfft(
+        np.fft.rfft(reference, size) * np.conj(np.fft.rfft(other, size)), size
+    )
+    # Circular correlation: negative lags wrap around to the tail
+    lags = np.arange(
+        max(min_lag, 1 - len(other)), min(max_lag, len(reference) - 1) + 1
+    )
+    if len(lags) == 0:
+        raise ValueError("Sessions do not overlap within the maximum offset")
+    peak = int(np.argmax(correlation[lags % size]))
+    lag = float(lags[peak])
+    if 0 < peak < len(lags) - 1:
+        before, at, after = correlation[lags[peak - 1:peak + 2] % size]
+        curvature = before - 2 * at + after
+        if curvature < 0:
+            lag += 0.5 * (before - after) / curvature
+    return lag
+
+def estimate_offset(
+    reference: Tuple[float, np.ndarray], other: Tuple[float, np.ndarray],
+    step: float, max_offset: float
+) -> float:
+    """Get the offset d such that chainage c in reference matches c + d in other"""
+    reference_origin, reference_values = reference
+    other_origin, other_values = other
+    # Lag at which equal chainages line up, searched within +/- max_offset
+    nominal_lag = (other_origin - reference_origin) / step
+    spread = max_offset / step
+    lag = cross_correlation_lag(
+        reference_values, other_values,
+        int(np.floor(nominal_lag - spread)), int(np.ceil(nominal_lag + spread))
+    )
+    return other_origin - reference_origin - lag * step
+
+def align_sessions(
+    channels_a: Dict[Channel, Tuple[np.ndarray, np.ndarray]],
+    channels_b: Dict[Channel, Tuple[np.ndarray, np.ndarray]],
+    step: float = settings.alignment_grid_step,
+    max_offset: float = settings.alignment_max_offset
+) -> Dict[str, Any]:
+    """Align session B onto session A and compute B - A per channel.
+
+    The mapping chainage_b = scale * chainage_a + offset is fitted from the
+    offsets of the two halves of the reference channel, which is the common
+    channel with the most samples in session A.
+    """
+    common = sorted(set(channels_a) & set(channels_b))
+    if not common:
+        raise ValueError("Sessions have no sensor channels in common")
+
+    reference_channel = max(common, key=lambda key: len(channels_a[key][0]))
+    origin_a, grid_a = resample(*channels_a[reference_channel], step)
+    grid_b = resample(*channels_b[reference_channel], step)
+
+    # Offsets of both halves give the drift in chainage scale
+    half = len(grid_a) // 2
+    if half >= 2:
+        offset_first = estimate_offset((origin_a, grid_a[:half]), grid_b, step, max_offset)
+        offset_second = estimate_offset(
+            (origin_a + half * step, grid_a[half:]), grid_b, step, max_offset
+        )
+        center_first = origin_a + (half / 2) * step
+        center_second = origin_a + (half + (len(grid_a) - half) / 2) * step
+        scale = 1.0 + (offset_second - offset_first) / (center_second - center_first)
+        offset = center_first + offset_first - scale * center_first
+    else:
+        scale = 1.0
+        offset = estimate_offset((origin_a, grid_a), grid_b, step, max_offset)
+
+    channels = []
+    for sensor_id, measurement_type in common:
+        origin, values_a = resample(*channels_a[(sensor_id, measurement_type)], step)
+        origin_b, values_b = resample(*channels_b[(sensor_id, measurement_type)], step)
+        chainage_a = origin + np.arange(len(values_a)) * step
+        chainage_b = origin_b + np.arange(len(values_b)) * step
+
+        mapped = scale * chainage_a + offset
+        inside = (mapped >= chainage_b[0]) & (mapped <= chainage_b[-1])
+        if not inside.any():
+            continue
+
+        delta = np.interp(mapped[inside], chainage_b, values_b) - values_a[inside]
+        channels.append({
+            "sensor_id": sensor_id,
+            "type": measurement_type,
+            "samples": int(inside.sum()),
+            "mean_delta": float(delta.mean()),
+            "rms_delta": float(np.sqrt(np.mean(delta ** 2))),
+            "max_abs_delta": float(np.abs(delta).max()),
+            "chainage": np.round(chainage_a[inside], 4).tolist(),
+            "delta": delta.tolist()
+        })
+
+    return {
+        "reference_channel": {"sensor_id": reference_channel[0], "type": reference_channel[1]},
+        "offset": offset,
+        "scale": scale,
+        "grid_step": step,
+        "channels": channels
+    }
+
+def compare_sessions(session_a: DataSession, session_b: DataSession) -> Dict[str, Any]:
+    """Load both sessions and align B onto A, blocking.
+
+    Reads with its own session so it can run in a worker thread.
+    """
+    with Session(engine) as session:
+        channels_a = load_session_channels(session, session_a)
+        channels_b = load_session_channels(session, session_b)
+    if not channels_a or not channels_b:
+        raise ValueError("Both sessions must contain measurements")
+    return align_sessions(channels_a, channels_b)
@@ -0,0 +1,113 @@
+"""
+ITMS Frame Annotations
+Normalises the annotations JSON of video frames into FrameAnnotation rows so
+detections can be filtered by label, confidence and chainage in SQL
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlmodel import Session
+
+from app.models import FrameAnnotation, VideoFrame
+
+# Frames read per batch when rebuilding the table
+REBUILD_BATCH_SIZE = 1000
+
+def parse_annotations(annotations: Optional[str]) -> List[Dict[str, Any]]:
+    """Get the detections of an annotations JSON string.
+
+    Accepts a list of detections or an object holding one under
+    "annotations", "defects" or "detections", as written by the frame
+    processor and the hardware simulator. Anything else yields no rows.
+    """
+    if not annotations:
+        return []
+    try:
+        parsed = json.loads(annotations)
+    except ValueError:
+        return []
+    if isinstance(parsed, dict):
+        parsed = next(
+            (parsed[key] for key in ("annotations", "defects", "detections")
+             if isinstance(parsed.get(key), list)),
+            []
+        )
+    return [item for item in parsed if isinstance(item, dict)] if isinstance(parsed, list) else []
+
+def annotation_rows(video_frame_id: int, chainage: float, camera_id: str,
+                    annotations: Optional[str]) -> List[Dict[str, Any]]:
+    """Build FrameAnnotation rows for one frame, skipping unlabelled detections"""
+    rows = []
+    for detection in parse_annotations(annotations):
+        label = detection.get("label") or detection.get("type")
+        if not label:
+            continue
+        bbox = detection.get("bbox")
+        if not (isinstance(bbox, (list, tuple)) and len(bbox) == 4):
+            bbox = (None, None, None, None)
+        confidence = detection.get("confidence")
+        rows.append({
+            "video_frame_id": video_frame_id,
+            "label": str(label),
+            "confidence": float(confidence) if confidence is not None else None,
+            "bbox_x1": bbox[0], "bbox_y1": bbox[1], "bbox_x2": bbox[2], "bbox_y2": bbox[3],
+            "chainage": chainage,
+            "camera_id": camera_id
+        })
+    return rows
+
+def replace_frame_annotations(
+    session: Session, frames: Iterable[Tuple[int, float, str, Optional[str]]]
+) -> int:
+    """Replace the annotation rows of (id, chainage, camera_id, annotations) frames.
+
+    Runs in the caller's transaction so rows change together with the
+    annotations JSON. Returns the number of rows inserted.
+    """
+    frames = list(frames)
+    if not frames:
+        return 0
+    session.execute(delete(FrameAnnotation).where(
+        FrameAnnotation.video_frame_id.in_([frame[0] for frame in frames])
+    ))
+    rows = [row for frame in frames for row in annotation_rows(*frame)]
+    if rows:
+        session.execute(insert(FrameAnnotation), rows)
+    return len(rows)
+
+def rebuild_frame_annotations(session: Session) -> int:
+    """Rebuild the whole table from the annotations JSON of every frame"""
+    session.execute(delete(FrameAnnotation))
+    inserted = 0
+    last_id = 0
+    while True:
+        # Keyset batches, so frames are never all loaded at once
+        frames = session.execute(
+            select(VideoFrame.id, VideoFrame.chainage, VideoFrame.camera_id, VideoFrame.annotations)
+            .where(VideoFrame.annotations.isnot(None), VideoFrame.id > last_id)
+            .order_by(VideoFrame.id).limit(REBUILD_BATCH_SIZE)
+        ).all()
+        if not frames:
+            break
+        rows = [row for frame in frames for row in annotation_rows(*frame)]
+        if rows:
+            session.execute(insert(FrameAnnotation), rows)
+            inserted += len(rows)
+        last_id = frames[-1][0]
+    session.commit()
+    return inserted
+
+def annotation_response(annotation: FrameAnnotation) -> Dict[str, Any]:
+    """Get the API form of an annotation, with the bounding box as one list"""
+    bbox = [annotation.bbox_x1, annotation.bbox_y1, annotation.bbox_x2, annotation.bbox_y2]
+    return {
+        "id": annotation.id,
+        "video_frame_id": annotation.video_frame_id,
+        "label": annotation.label,
+        "confidence": annotation.confidence,
+        "bbox": bbox if None not in bbox else None,
+        "chainage": annotation.chainage,
+        "camera_id": annotation.camera_id
+    }
@@ -0,0 +1,200 @@
+"""
+ITMS Online Anomaly Detection
+Streaming EWMA detector that flags outlying sensor samples on ingest
+"""
+
+import math
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+from sqlmodel import Session
+
+from app.config import settings
+from app.db import dialect_insert
+from app.models import (
+    AnomalyDetectorState, DefectLog, DefectSeverity, Measurement
+)
+from app.utils import get_defect_type
+
+# State of one channel, [mean, variance, sample_count]
+DetectorState = List[float]
+
+# Largest growth factor allowed inside one closed-form filter block.
+# Keeps the cancellation error of the block-wise cumulative sum near 1e-12.
+_MAX_BLOCK_GAIN = 1e4
+
+def ewma_filter(inputs: np.ndarray, decay: float, initial: float) -> np.ndarray:
+    """Evaluate y[i] = decay * y[i-1] + inputs[i] for a whole array.
+
+    Uses the closed form of the recurrence on blocks short enough for
+    decay ** -block to stay numerically harmless.
+    """
+    n = len(inputs)
+    output = np.empty(n, dtype=np.float64)
+    if n == 0:
+        return output
+
+    if decay <= 0.0:
+        output[:] = inputs
+        return output
+
+    block = max(1, int(math.log(_MAX_BLOCK_GAIN) / -math.log(decay))) if decay < 1.0 else n
+    previous = initial
+    for start in range(0, n, block):
+        chunk = inputs[start:start + block]
+        powers = decay ** np.arange(1, len(chunk) + 1, dtype=np.float64)
+        output[start:start + len(chunk)] = powers * (previous + np.cumsum(chunk / powers))
+        previous = output[start + len(chunk) - 1]
+    return output
+
+class AnomalyDetector:
+    """Per (sensor_id, type) exponentially weighted mean/variance detector"""
+
+    def __init__(
+        self,
+        alpha: float = settings.anomaly_ewma_alpha,
+        threshold: float = settings.anomaly_z_threshold,
+        warmup_samples: int = settings.anomaly_warmup_samples
+    ):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup_samples = warmup_samples
+        self.state: Dict[Tuple[str, str], DetectorState] = {}
+        self.dirty: set = set()
+
+    def evaluate(
+        self, sensor_id: str, measurement_type: str, values: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, DetectorState]:
+        """Score a time-ordered batch against the detector state.
+
+        Each sample is scored against the state that preceded it, so a batch
+        gives the same z-scores as feeding the samples one at a time. Returns
+        the z-scores (0 during warm-up), the signed deviations from the
+        running mean and the state after the batch, which apply stores.
+        """
+        key = (sensor_id, measurement_type)
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        if n == 0:
+            return np.zeros(0), np.zeros(0), self.state.get(key)
+
+        decay = 1.0 - self.alpha
+        if key in self.state:
+            mean0, var0, count0 = self.state[key]
+        else:
+            mean0, var0, count0 = float(values[0]), 0.0, 0
+
+        means = ewma_filter(self.alpha * values, decay, mean0)
+        prior_means = np.concatenate(([mean0], means[:-1]))
+        deviations = values - prior_means
+
+        variances = ewma_filter(self.alpha * decay * deviations ** 2, decay, var0)
+        prior_vars = np.concatenate(([var0], variances[:-1]))
+
+        scores = np.zeros(n)
+        prior_counts = count0 + np.arange(n)
+        ready = (prior_counts >= self.warmup_samples) & (prior_vars > 0)
+        scores[ready] = np.abs(deviations[ready]) / np.sqrt(prior_vars[ready])
+
+        return scores, deviations, [float(means[-1]), float(variances[-1]), int(count0 + n)]
+
+    def apply(self, states: Dict[Tuple[str, str], DetectorState]):
+        """Store the states a processed batch ended with, once it is committed"""
+        self.state.update(states)
+        self.dirty.update(states)
+
+    def get_severity(self, score: float) -> DefectSeverity:
+        """Map a z-score to a defect severity"""
+        if score >= 3 * self.threshold:
+            return DefectSeverity.CRITICAL
+        elif score >= 2 * self.threshold:
+            return DefectSeverity.HIGH
+        elif score >= 1.5 * self.threshold:
+            return DefectSeverity.MEDIUM
+        return DefectSeverity.LOW
+
+    def process(
+        self, measurements: List[Measurement]
+    ) -> Tuple[List[DefectLog], Dict[Tuple[str, str], DetectorState]]:
+        """Run a batch of stored measurements through the detector.
+
+        Returns the defects and the new state of each channel. The detector
+        is left unchanged until the caller has committed the defects and
+        passes the state to apply, so a rolled back batch is not counted.
+        """
+        groups: Dict[Tuple[str, str], List[Measurement]] = {}
+        for measurement in measurements:
+            measurement_type = getattr(measurement.type, "value", measurement.type)
+            groups.setdefault((measurement.sensor_id, measurement_type), []).append(measurement)
+
+        defects = []
+        states = {}
+        for (sensor_id, measurement_type), group in groups.items():
+            group.sort(key=lambda m: m.timestamp)
+            values = np.fromiter((m.value for m in group), dtype=np.float64, count=len(group))
+            scores, deviations, states[(sensor_id, measurement_type)] = self.evaluate(
+                sensor_id, measurement_type, values
+            )
+
+            for index in np.flatnonzero(scores > self.threshold):
+                measurement = group[index]
+                score = float(scores[index])
+                defects.append(DefectLog(
+                    chainage=measurement.chainage,
+                    defect_type=get_defect_type(measurement_type, float(deviations[index])),
+                    severity=self.get_severity(score),
+                    description=(
+                        f"Anomalous {measurement_type} reading {measurement.value:.4f} "
+                        f"from {sensor_id} (z-score {score:.1f})"
+                    ),
+                    measurement_id=measurement.id
+                ))
+        return defects, states
+
+    def snapshot(self, session: Session) -> int:
+        """Persist state that changed since the last snapshot.
+
+        Upserted on (sensor_id, measurement_type), so workers and restarts
+        snapshotting the same channel share one row.
+        """
+        if not self.dirty:
+            return 0
+
+        now = datetime.utcnow()
+        rows = []
+        for sensor_id, measurement_type in self.dirty:
+            mean, variance, count = self.state[(sensor_id, measurement_type)]
+            rows.append({
+                "sensor_id": sensor_id, "measurement_type": measurement_type,
+                "mean": mean, "variance": variance, "sample_count": count, "updated_at": now
+            })
+        statement = dialect_insert(session)(AnomalyDetectorState.__table__)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["sensor_id", "measurement_type"],
+                set_={
+                    "mean": statement.excluded.mean,
+                    "variance": statement.excluded.variance,
+                    "sample_count": statement.excluded.sample_count,
+                    "updated_at": statement.excluded.updated_at
+                }
+            ),
+            rows
+        )
+        session.commit()
+        saved = len(self.dirty)
+        self.dirty.clear()
+        return saved
+
+    def restore(self, session: Session) -> int:
+        """Load the last snapshot so a restart does not need a warm-up"""
+        rows = session.query(AnomalyDetectorState).all()
+        for row in rows:
+            self.state[(row.sensor_id, row.measurement_type)] = [
+                row.mean, row.variance, row.sample_count
+            ]
+        return len(rows)
+
+# Global detector instance
+anomaly_detector = AnomalyDetector()
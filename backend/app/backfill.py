@@ -0,0 +1,104 @@
+"""
+ITMS Real-time Backfill
+Streams stored measurements for a chainage or time range over a WebSocket
+in bounded chunks read with a keyset cursor
+"""
+
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlmodel import Session
+
+from app.config import settings
+from app.db import engine
+from app.encoding import to_epoch_micros
+from app.models import Measurement, MeasurementType
+
+# Backfill chunks allowed to wait in a client's send queue, so live data
+# queued behind them is delayed by at most this many chunks
+PIPELINE_DEPTH = 2
+
+def parse_number(data: Dict[str, Any], key: str, kind=float) -> Optional[Any]:
+    """Read an optional finite number from a client message, raising ValueError otherwise"""
+    value = data.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{key} must be a number")
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"{key} must be a number")
+    if not math.isfinite(number):
+        raise ValueError(f"{key} must be finite")
+    return kind(number)
+
+class BackfillRequest:
+    """Validated range and filters of a backfill message"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.request_id = str(data.get("request_id") or "")
+        if not self.request_id:
+            raise ValueError("backfill requires a request_id")
+
+        self.start_chainage = parse_number(data, "start_chainage")
+        self.end_chainage = parse_number(data, "end_chainage")
+        self.start_time = datetime.fromisoformat(data["start_time"]) if data.get("start_time") else None
+        self.end_time = datetime.fromisoformat(data["end_time"]) if data.get("end_time") else None
+        if self.start_chainage is None and self.end_chainage is None \
+                and self.start_time is None and self.end_time is None:
+            raise ValueError("backfill requires a chainage or time range")
+
+        self.sensor_ids = data.get("sensor_ids") or None
+        self.measurement_types = [
+            MeasurementType(value) for value in data["measurement_types"]
+        ] if data.get("measurement_types") else None
+        # Walk along the track for chainage ranges, otherwise in time order
+        self.order_by = "chainage" if (
+            self.start_chainage is not None or self.end_chainage is not None
+        ) else "timestamp"
+        # A limit below one would read the whole range at once on SQLite
+        self.chunk_size = max(1, min(
+            parse_number(data, "chunk_size", int) or settings.backfill_chunk_size,
+            settings.backfill_chunk_size
+        ))
+
+def fetch_backfill_chunk(
+    request: BackfillRequest, cursor: Optional[Tuple[Any, int]]
+) -> List[Tuple]:
+    """Read the next chunk after cursor, the (sort key, id) of the last row sent"""
+    column = Measurement.chainage if request.order_by == "chainage" else Measurement.timestamp
+    with Session(engine) as session:
+        query = session.query(
+            Measurement.id, Measurement.sensor_id, Measurement.type,
+            Measurement.timestamp, Measurement.chainage, Measurement.value
+        )
+        if request.start_chainage is not None:
+            query = query.filter(Measurement.chainage >= request.start_chainage)
+        if request.end_chainage is not None:
+            query = query.filter(Measurement.chainage <= request.end_chainage)
+        if request.start_time is not None:
+            query = query.filter(Measurement.timestamp >= request.start_time)
+        if request.end_time is not None:
+            query = query.filter(Measurement.timestamp <= request.end_time)
+        if request.sensor_ids:
+            query = query.filter(Measurement.sensor_id.in_(request.sensor_ids))
+        if request.measurement_types:
+            query = query.filter(Measurement.type.in_(request.measurement_types))
+        if cursor is not None:
+            key, row_id = cursor
+            query = query.filter(
+                (column > key) | ((column == key) & (Measurement.id > row_id))
+            )
+        return query.order_by(column, Measurement.id).limit(request.chunk_size).all()
+
+def rows_to_columns(rows: List[Tuple]) -> Dict[str, list]:
+    """Convert measurement rows to the column layout used by snapshots"""
+    return {
+        "sensor_id": [row.sensor_id for row in rows],
+        "measurement_type": [getattr(row.type, "value", row.type) for row in rows],
+        "timestamp_us": [to_epoch_micros(row.timestamp) for row in rows],
+        "chainage": [row.chainage for row in rows],
+        "value": [row.value for row in rows]
+    }
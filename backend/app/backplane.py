@@ -0,0 +1,92 @@
+"""
+ITMS Real-time Backplane
+Pub/sub channel carrying broadcasts between server workers so every worker
+fans them out to its own WebSocket clients
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+class LocalBackplane:
+    """In-process backplane for a single worker and for tests.
+
+    Several connection managers started on the same instance behave like
+    workers sharing a Redis channel.
+    """
+
+    def __init__(self):
+        self.handlers: List[Handler] = []
+
+    async def start(self, handler: Handler):
+        self.handlers.append(handler)
+
+    async def stop(self):
+        self.handlers.clear()
+
+    async def publish(self, envelope: Dict[str, Any]):
+        for handler in list(self.handlers):
+            await handler(envelope)
+
+class RedisBackplane:
+    """Backplane over a Redis pub/sub channel"""
+
+    def __init__(self, url: str, channel: str = settings.realtime_channel, client: Any = None):
+        self.url = url
+        self.channel = channel
+        self.client = client
+        self.pubsub = None
+        self.listener: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        if self.client is None:
+            import redis.asyncio as redis
+            self.client = redis.from_url(self.url)
+        # Fail fast so the caller can fall back to the local backplane
+        await self.client.ping()
+        # Subscribed before returning so no broadcast published after
+        # startup is missed
+        await self.subscribe()
+        self.listener = asyncio.create_task(self.listen(handler))
+
+    async def stop(self):
+        if self.listener is not None:
+            self.listener.cancel()
+        await self.client.close()
+
+    async def publish(self, envelope: Dict[str, Any]):
+        await self.client.publish(self.channel, json.dumps(envelope))
+
+    async def subscribe(self):
+        self.pubsub = self.client.pubsub()
+        await self.pubsub.subscribe(self.channel)
+
+    async def listen(self, handler: Handler):
+        """Dispatch channel messages, resubscribing after connection errors"""
+        while True:
+            try:
+                if self.pubsub is None:
+                    await self.subscribe()
+                async for message in self.pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    try:
+                        await handler(json.loads(message["data"]))
+                    except Exception as e:
+                        print(f"❌ Error handling backplane message: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Backplane connection error: {e}")
+                self.pubsub = None
+                await asyncio.sleep(1)
+
+def create_backplane(url: Optional[str] = settings.redis_url):
+    """Get a Redis backplane for a redis:// URL, the local one otherwise"""
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackplane(url)
+    return LocalBackplane()
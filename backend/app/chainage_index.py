@@ -0,0 +1,262 @@
+"""
+ITMS Chainage Index
+In-process sorted index over defect and video frame locations, kept in
+step across workers through the realtime backplane
+"""
+
+import asyncio
+import heapq
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sortedcontainers import SortedList
+from sqlmodel import Session
+
+from app.config import settings
+from app.db import engine
+from app.models import DefectLog, VideoFrame
+
+# (id, start, end) row, end is None for point data
+IndexRow = Tuple[int, float, Optional[float]]
+
+# Rows read per query when loading an index
+LOAD_BATCH_SIZE = 10000
+
+# Serialises loads, each needs the change journal to itself
+_load_lock = threading.Lock()
+
+class ChainageIndex:
+    """Sorted index of [start, end] chainage intervals keyed by row id.
+
+    Point data uses start == end. Entries are kept as (start, id) in a
+    SortedList with each row's span in a dict, so inserts and removals cost
+    O(log n) and a batch is merged in one call. Lookups bisect on start and
+    use the longest indexed interval to bound the search window. Changes
+    are made from worker threads while the event loop reads, so every
+    access holds the lock.
+    """
+
+    def __init__(self, name: str, capacity: int = settings.chainage_index_capacity):
+        self.name = name
+        self.capacity = capacity
+        self.entries = SortedList()
+        self.spans: Dict[int, Tuple[float, float]] = {}
+        self.max_length = 0.0
+        # False until loaded, or when the table outgrew the capacity;
+        # callers then have to fall back to the database
+        self.complete = False
+        self.lock = threading.Lock()
+        # Changes made while a load is reading the table, replayed onto the
+        # loaded contents so none are lost. None when no load is running
+        self.journal: Optional[List[Tuple[Dict[int, Tuple[float, float]], List[int]]]] = None
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def begin_load(self):
+        """Start recording changes, call before reading the rows to load"""
+        with self.lock:
+            self.journal = []
+
+    def load(self, rows: Iterable[IndexRow], total: int):
+        """Replace the index contents with (id, start, end) rows.
+
+        Changes recorded since begin_load are applied on top.
+        """
+        spans = {
+            row_id: (start, end if end is not None else start)
+            for row_id, start, end in rows
+        }
+        entries = SortedList((start, row_id) for row_id, (start, _) in spans.items())
+        max_length = max((end - start for start, end in spans.values()), default=0.0)
+        with self.lock:
+            self.entries = entries
+            self.spans = spans
+            self.max_length = max_length
+            self.complete = total <= self.capacity
+            journal, self.journal = self.journal or [], None
+            for added, removed in journal:
+                self._remove(removed)
+                self._add(added)
+
+    def add(self, row_id: int, start: float, end: Optional[float] = None):
+        """Insert or move a row"""
+        self.add_many([(row_id, start, end)])
+
+    def add_many(self, rows: Iterable[IndexRow]):
+        """Insert or move rows in one pass"""
+        added = {
+            row_id: (start, end if end is not None else start)
+            for row_id, start, end in rows
+        }
+        with self.lock:
+            if self.journal is not None:
+                self.journal.append((added, []))
+            self._add(added)
+
+    def _add(self, added: Dict[int, Tuple[float, float]]):
+        if not self.complete:
+            return
+        if len(self.spans) + sum(1 for row_id in added if row_id not in self.spans) > self.capacity:
+            self.complete = False
+            return
+
+        for row_id, (start, end) in added.items():
+            previous = self.spans.get(row_id)
+            if previous is not None:
+                self.entries.remove((previous[0], row_id))
+            self.spans[row_id] = (start, end)
+            self.max_length = max(self.max_length, end - start)
+        self.entries.update((start, row_id) for row_id, (start, _) in added.items())
+
+    def remove(self, row_id: int):
+        """Remove a row if present"""
+        self.remove_many([row_id])
+
+    def remove_many(self, row_ids: Iterable[int]):
+        """Remove rows, skipping those not present"""
+        row_ids = list(row_ids)
+        with self.lock:
+            if self.journal is not None:
+                self.journal.append(({}, row_ids))
+            self._remove(row_ids)
+
+    def _remove(self, row_ids: List[int]):
+        for row_id in row_ids:
+            span = self.spans.pop(row_id, None)
+            if span is not None:
+                self.entries.remove((span[0], row_id))
+
+    def apply(self, added: Iterable[Sequence], removed: Iterable[int]):
+        """Apply a change set as published to the other workers"""
+        self.remove_many(removed)
+        self.add_many((row[0], row[1], row[2]) for row in added)
+
+    def within(self, chainage: float, tolerance: float) -> List[int]:
+        """Get ids of intervals overlapping chainage +/- tolerance"""
+        with self.lock:
+            return [
+                row_id for _, row_id in self.entries.irange(
+                    (chainage - tolerance - self.max_length,), (chainage + tolerance, math.inf)
+                )
+                if self.spans[row_id][1] >= chainage - tolerance
+            ]
+
+    def nearest(self, chainage: float, k: int) -> List[Tuple[int, float]]:
+        """Get the k closest (id, distance) pairs, closest first"""
+        with self.lock:
+            if k <= 0 or not self.spans:
+                return []
+
+            position = self.entries.bisect_right((chainage, math.inf))
+
+            # Intervals starting after the chainage are ordered by distance
+            candidates: List[Tuple[float, int]] = [
+                (start - chainage, row_id)
+                for start, row_id in self.entries.islice(position, position + k)
+            ]
+
+            # Intervals starting at or before it may end anywhere up to
+            # start + max_length, so scan until no closer one is possible
+            best = heapq.nsmallest(k, candidates)
+            bound = best[-1][0] if len(best) == k else float("inf")
+            for start, row_id in self.entries.islice(0, position, reverse=True):
+                if chainage - start - self.max_length > bound:
+                    break
+                distance = max(0.0, chainage - self.spans[row_id][1])
+                candidates.append((distance, row_id))
+                if len(candidates) >= k:
+                    bound = heapq.nsmallest(k, candidates)[-1][0]
+
+            return [(row_id, distance) for distance, row_id in heapq.nsmallest(k, candidates)]
+
+# Global index instances
+defect_index = ChainageIndex("defect")
+video_frame_index = ChainageIndex("video_frame")
+
+# Indexes by name, as carried in backplane change sets
+chainage_indexes = {index.name: index for index in (defect_index, video_frame_index)}
+
+def read_index_rows(session: Session, limit: int, id_column, *columns) -> List[Tuple]:
+    """Read up to limit rows in keyset batches ordered by id"""
+    rows: List[Tuple] = []
+    last_id = 0
+    while len(rows) < limit:
+        batch = session.query(id_column, *columns).filter(
+            id_column > last_id
+        ).order_by(id_column).limit(min(LOAD_BATCH_SIZE, limit - len(rows))).all()
+        if not batch:
+            break
+        rows.extend(batch)
+        last_id = batch[-1][0]
+    return rows
+
+def load_chainage_indexes():
+    """Load the defect and video frame indexes from the database.
+
+    Blocks for a full table read, run it in a worker thread.
+    """
+    with _load_lock, Session(engine) as session:
+        defect_index.begin_load()
+        defect_rows = read_index_rows(
+            session, defect_index.capacity + 1, DefectLog.id, DefectLog.chainage, DefectLog.end_chainage
+        )
+        defect_index.load(defect_rows, len(defect_rows))
+
+        video_frame_index.begin_load()
+        frame_rows = read_index_rows(
+            session, video_frame_index.capacity + 1, VideoFrame.id, VideoFrame.chainage
+        )
+        video_frame_index.load(
+            ((row_id, chainage, None) for row_id, chainage in frame_rows), len(frame_rows)
+        )
+
+    print(f"✅ Chainage index loaded: {len(defect_index)} defects, {len(video_frame_index)} video frames")
+
+async def update_chainage_index(index: ChainageIndex, added: Iterable[IndexRow] = (),
+                                removed: Iterable[int] = ()):
+    """Change an index off the event loop and publish the change to other workers"""
+    added = [list(row) for row in added]
+    removed = list(removed)
+    if not added and not removed:
+        return
+    await asyncio.to_thread(index.apply, added, removed)
+
+    from app.realtime import manager
+    try:
+        await manager.distribute({
+            "kind": "chainage_index",
+            "origin": manager.instance_id,
+            "index": index.name,
+            "added": added,
+            "removed": removed
+        })
+    except Exception as e:
+        print(f"❌ Error publishing chainage index change: {e}")
+
+async def reload_chainage_indexes():
+    """Reload the indexes off the event loop on every worker, after bulk deletes"""
+    await asyncio.to_thread(load_chainage_indexes)
+
+    from app.realtime import manager
+    try:
+        await manager.distribute({"kind": "chainage_index_reload", "origin": manager.instance_id})
+    except Exception as e:
+        print(f"❌ Error publishing chainage index reload: {e}")
+
+async def refresh_chainage_indexes_periodically():
+    """Background task loading the indexes, then reloading them periodically.
+
+    Lookups use the database until the first load completes. Reloading
+    bounds how stale a worker gets when it missed backplane messages or
+    runs without a shared backplane.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(load_chainage_indexes)
+        except Exception as e:
+            print(f"❌ Error loading chainage indexes: {e}")
+        if not settings.chainage_index_refresh_interval:
+            return
+        await asyncio.sleep(settings.chainage_index_refresh_interval)
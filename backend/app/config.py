@@ -41,10 +41,34 @@ class Settings(BaseSettings):
         default=["jpg", "jpeg", "png", "mp4", "avi", "mov"],
         env="ALLOWED_FILE_TYPES"
     )
+    # Content-addressed frame files, sharded by hash prefix
+    frame_store_path: str = Field(default="./storage/videos/objects", env="FRAME_STORE_PATH")
+    # Batch frame uploads
+    batch_upload_max_frames: int = Field(default=1000, env="BATCH_UPLOAD_MAX_FRAMES")
+    batch_upload_concurrency: int = Field(default=8, env="BATCH_UPLOAD_CONCURRENCY")
+    # Worker processes rendering frame thumbnails
+    thumbnail_workers: int = Field(default=2, env="THUMBNAIL_WORKERS")
+    # Video segments decoded to frames on demand
+    max_segment_size: int = Field(default=512 * 1024 * 1024, env="MAX_SEGMENT_SIZE")
+    video_decode_workers: int = Field(default=2, env="VIDEO_DECODE_WORKERS")
+    decoded_frame_cache_bytes: int = Field(default=256 * 1024 * 1024, env="DECODED_FRAME_CACHE_BYTES")
+    # Background analysis of unprocessed video frames
+    # Off by default, the built-in analyser finds nothing
+    frame_processing_enabled: bool = Field(default=False, env="FRAME_PROCESSING_ENABLED")
+    frame_analyzer: str = Field(default="app.frame_processing:DefectDetector", env="FRAME_ANALYZER")
+    frame_processing_workers: Optional[int] = Field(default=None, env="FRAME_PROCESSING_WORKERS")
+    frame_processing_batch_size: int = Field(default=64, env="FRAME_PROCESSING_BATCH_SIZE")
+    frame_lease_seconds: float = Field(default=300.0, env="FRAME_LEASE_SECONDS")
+    frame_processing_poll_interval: float = Field(default=5.0, env="FRAME_PROCESSING_POLL_INTERVAL")
+    frame_processing_max_attempts: int = Field(default=3, env="FRAME_PROCESSING_MAX_ATTEMPTS")
+    frame_processing_retry_seconds: float = Field(default=60.0, env="FRAME_PROCESSING_RETRY_SECONDS")
     
     # Data retention settings
     data_retention_days: int = Field(default=30, env="DATA_RETENTION_DAYS")
     cleanup_interval_hours: int = Field(default=24, env="CLEANUP_INTERVAL_HOURS")
+    cleanup_batch_size: int = Field(default=500, env="CLEANUP_BATCH_SIZE")
+    cleanup_unlink_workers: int = Field(default=8, env="CLEANUP_UNLINK_WORKERS")
+    orphan_grace_seconds: float = Field(default=3600.0, env="ORPHAN_GRACE_SECONDS")
     
     # Sensor settings
     max_sample_rate: int = Field(default=1000, env="MAX_SAMPLE_RATE")
@@ -53,11 +77,49 @@ class Settings(BaseSettings):
     # Alert settings
     vibration_threshold: float = Field(default=2.0, env="VIBRATION_THRESHOLD")
     gauge_tolerance: float = Field(default=0.02, env="GAUGE_TOLERANCE")
-    speed_threshold: float = Field(default=200, env="SPEED_THRESHOLD")
+    nominal_gauge: float = Field(default=1.676, env="NOMINAL_GAUGE")  # meters
+    exceedance_max_gap: float = Field(default=1.0, env="EXCEEDANCE_MAX_GAP")  # meters
+    config_cache_ttl: int = Field(default=30, env="CONFIG_CACHE_TTL")  # seconds
+    
+    # Chainage index settings
+    chainage_index_capacity: int = Field(default=500000, env="CHAINAGE_INDEX_CAPACITY")
+    chainage_index_refresh_interval: int = Field(default=300, env="CHAINAGE_INDEX_REFRESH_INTERVAL")  # seconds, 0 disables
+    
+    # Cross-run alignment settings
+    alignment_grid_step: float = Field(default=0.25, env="ALIGNMENT_GRID_STEP")  # meters
+    alignment_max_offset: float = Field(default=50.0, env="ALIGNMENT_MAX_OFFSET")  # meters
+    
+    # Degradation trend settings
+    segment_length: float = Field(default=100.0, env="SEGMENT_LENGTH")  # meters
+    degradation_refresh_interval: int = Field(default=3600, env="DEGRADATION_REFRESH_INTERVAL")  # seconds
+    degradation_forecast_days: int = Field(default=90, env="DEGRADATION_FORECAST_DAYS")
+    
+    # Anomaly detection settings
+    anomaly_ewma_alpha: float = Field(default=0.05, env="ANOMALY_EWMA_ALPHA")
+    anomaly_z_threshold: float = Field(default=4.0, env="ANOMALY_Z_THRESHOLD")
+    anomaly_warmup_samples: int = Field(default=50, env="ANOMALY_WARMUP_SAMPLES")
+    anomaly_snapshot_interval: int = Field(default=60, env="ANOMALY_SNAPSHOT_INTERVAL")  # seconds
     
     # WebSocket settings
     websocket_heartbeat_interval: int = Field(default=30, env="WEBSOCKET_HEARTBEAT_INTERVAL")
     max_websocket_connections: int = Field(default=100, env="MAX_WEBSOCKET_CONNECTIONS")
+    # Seconds without any client message before a connection is evicted
+    websocket_idle_timeout: int = Field(default=90, env="WEBSOCKET_IDLE_TIMEOUT")
+    websocket_send_queue_size: int = Field(default=256, env="WEBSOCKET_SEND_QUEUE_SIZE")
+    # Policy for clients whose queue is full: drop_oldest, coalesce or disconnect
+    websocket_slow_client_policy: str = Field(default="drop_oldest", env="WEBSOCKET_SLOW_CLIENT_POLICY")
+    # Highest frame rate in Hz a client may request for decimated sensor data
+    realtime_max_frame_rate: float = Field(default=60.0, env="REALTIME_MAX_FRAME_RATE")
+    # Recent samples kept per sensor/type for clients joining mid-run
+    replay_buffer_capacity: int = Field(default=4096, env="REPLAY_BUFFER_CAPACITY")
+    replay_buffer_seconds: float = Field(default=60.0, env="REPLAY_BUFFER_SECONDS")
+    # Rows per backfill chunk and backfills running at once per client
+    backfill_chunk_size: int = Field(default=2000, env="BACKFILL_CHUNK_SIZE")
+    backfill_max_concurrent: int = Field(default=2, env="BACKFILL_MAX_CONCURRENT")
+    # Add per-stage latency to sensor_data messages sent to clients
+    realtime_echo_latency: bool = Field(default=False, env="REALTIME_ECHO_LATENCY")
+    # Published events kept for SSE Last-Event-ID resumption
+    sse_replay_size: int = Field(default=1000, env="SSE_REPLAY_SIZE")
     
     # Logging settings
     log_level: str = Field(default="INFO", env="LOG_LEVEL")
@@ -65,6 +127,7 @@ class Settings(BaseSettings):
     
     # Redis settings (for production scaling)
     redis_url: Optional[str] = Field(default=None, env="REDIS_URL")
+    realtime_channel: str = Field(default="itms:realtime", env="REALTIME_CHANNEL")
     
     # Email settings (for notifications)
     smtp_server: Optional[str] = Field(default=None, env="SMTP_SERVER")
@@ -0,0 +1,59 @@
+"""
+ITMS Runtime Configuration Cache
+Time-bounded cache over the SystemConfig table for hot code paths
+"""
+
+import time
+from typing import Dict, Optional
+
+from sqlmodel import Session
+
+from app.config import settings
+from app.db import engine
+from app.models import SystemConfig
+
+class ConfigCache:
+    """Caches SystemConfig values, falling back to Settings defaults"""
+
+    def __init__(self, ttl: float = settings.config_cache_ttl):
+        self.ttl = ttl
+        self._values: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+
+    def _refresh(self):
+        with Session(engine) as session:
+            configs = session.query(SystemConfig).all()
+            self._values = {config.key: config.value for config in configs}
+        self._loaded_at = time.monotonic()
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Get a configuration value as a string"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"❌ Error loading system configuration: {e}")
+        return self._values.get(key, default)
+
+    def get_float(self, key: str, default: float) -> float:
+        """Get a configuration value as a float"""
+        value = self.get(key)
+        try:
+            return float(value) if value is not None else default
+        except ValueError:
+            return default
+
+    def get_int(self, key: str, default: int) -> int:
+        """Get a configuration value as an int"""
+        value = self.get(key)
+        try:
+            return int(value) if value is not None else default
+        except ValueError:
+            return default
+
+    def invalidate(self):
+        """Force a reload on the next read"""
+        self._loaded_at = None
+
+# Global configuration cache instance
+config_cache = ConfigCache()
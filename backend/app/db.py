@@ -4,7 +4,9 @@ Database engine, session management, and connection setup
 """
 
 from sqlmodel import SQLModel, create_engine, Session
-from sqlalchemy import event
+from sqlalchemy import event, func, inspect, select, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.engine import Engine
 import os
 from typing import Generator
@@ -43,9 +45,66 @@ if DATABASE_URL.startswith("sqlite"):
         cursor.execute("PRAGMA foreign_keys=ON")
         cursor.close()
 
+def upgrade_tables():
+    """Add columns and indexes introduced after a table was first created.
+
+    create_all only creates missing tables, so databases from earlier
+    releases get new columns with ALTER TABLE ... ADD COLUMN. New columns
+    are nullable, which every database accepts on a populated table. Before
+    a new unique index is created, duplicate rows are removed, keeping the
+    newest of each. Safe to run on every start.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                if not column.nullable:
+                    raise RuntimeError(f"Cannot add required column {table.name}.{column.name}")
+                statement = (
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.format_column(column)} "
+                    f"{column.type.compile(dialect=engine.dialect)}"
+                )
+                for foreign_key in column.foreign_keys:
+                    statement += (
+                        f" REFERENCES {preparer.format_table(foreign_key.column.table)}"
+                        f" ({preparer.format_column(foreign_key.column)})"
+                    )
+                connection.execute(text(statement))
+                print(f"🔧 Added column {table.name}.{column.name}")
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                if index.unique:
+                    remove_duplicate_rows(connection, table, list(index.columns))
+                index.create(connection)
+
+def remove_duplicate_rows(connection, table, columns):
+    """Delete all but the row with the highest primary key per value of columns"""
+    primary_key = list(table.primary_key.columns)[0]
+    newest = select(func.max(primary_key)).group_by(*columns)
+    removed = connection.execute(table.delete().where(primary_key.notin_(newest))).rowcount
+    if removed:
+        print(f"🔧 Removed {removed} duplicate rows from {table.name}")
+
+def dialect_insert(session: Session):
+    """Get the INSERT construct with ON CONFLICT support for the database"""
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql_insert
+    return sqlite_insert
+
 def create_db_and_tables():
-    """Create database tables"""
+    """Create database tables and bring existing ones up to date"""
     SQLModel.metadata.create_all(engine)
+    upgrade_tables()
 
 def get_session() -> Generator[Session, None, None]:
     """Dependency to get database session"""
@@ -96,11 +155,6 @@ def init_database():
                     value="2.0",
                     description="Vibration alert threshold in g"
                 ),
-                SystemConfig(
-                    key="speed_threshold",
-                    value="200",
-                    description="Speed alert threshold in km/h"
-                ),
                 SystemConfig(
                     key="gauge_tolerance",
                     value="0.02",
@@ -0,0 +1,70 @@
+"""
+ITMS Real-time Decimation
+Coalesces sensor samples per topic into fixed-rate frames carrying the
+min, max and last value of each window so short spikes are not lost
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+def normalize_frame_rate(rate: Any) -> Optional[float]:
+    """Clamp a client-requested frame rate in Hz, None or 0 meaning raw samples"""
+    if not rate:
+        return None
+    rate = float(rate)
+    if rate <= 0:
+        return None
+    # Rounded so that clients asking for nearly the same rate share frames
+    return min(max(round(rate, 1), 0.1), settings.realtime_max_frame_rate)
+
+class FrameAggregator:
+    """Accumulates samples per (sensor_id, type) between two frame ticks"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.windows: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def add(self, sensor_id: str, measurement_type: str, samples: List[Dict[str, Any]]):
+        """Fold samples of one topic into its current window"""
+        values = [sample["value"] for sample in samples]
+        chainages = [sample["chainage"] for sample in samples]
+        window = self.windows.get((sensor_id, measurement_type))
+        if window is None:
+            self.windows[(sensor_id, measurement_type)] = {
+                "count": len(values),
+                "min": min(values),
+                "max": max(values),
+                "last": values[-1],
+                "chainage": min(chainages),
+                "end_chainage": max(chainages),
+                "last_chainage": chainages[-1],
+                "last_timestamp": samples[-1].get("timestamp")
+            }
+            return
+
+        window["count"] += len(values)
+        window["min"] = min(window["min"], min(values))
+        window["max"] = max(window["max"], max(values))
+        window["last"] = values[-1]
+        window["chainage"] = min(window["chainage"], min(chainages))
+        window["end_chainage"] = max(window["end_chainage"], max(chainages))
+        window["last_chainage"] = chainages[-1]
+        window["last_timestamp"] = samples[-1].get("timestamp")
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Get one frame message per topic with samples since the last tick"""
+        windows, self.windows = self.windows, {}
+        timestamp = datetime.now(timezone.utc).isoformat()
+        return [
+            {
+                "type": "sensor_frame",
+                "sensor_id": sensor_id,
+                "measurement_type": measurement_type,
+                "rate": self.rate,
+                "data": window,
+                "timestamp": timestamp
+            }
+            for (sensor_id, measurement_type), window in windows.items()
+        ]
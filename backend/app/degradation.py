@@ -0,0 +1,232 @@
+"""
+ITMS Degradation Trends
+Maintains per-segment condition indicators across completed sessions and
+fits a linear degradation trend to every segment
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlmodel import Session
+
+from app.alignment import load_session_channels
+from app.config import settings
+from app.db import engine
+from app.models import DataSession, SegmentCondition, SegmentTrend
+
+def compute_segment_conditions(
+    data_session: DataSession, channels: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]],
+    segment_length: float = settings.segment_length
+) -> List[SegmentCondition]:
+    """Aggregate a session's measurements into per-segment indicators"""
+    by_type: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {}
+    for (_, measurement_type), arrays in channels.items():
+        by_type.setdefault(measurement_type, []).append(arrays)
+
+    conditions = []
+    for measurement_type, arrays in by_type.items():
+        chainages = np.concatenate([chainage for chainage, _ in arrays])
+        values = np.concatenate([value for _, value in arrays])
+
+        segments = np.floor(chainages / segment_length).astype(np.int64)
+        unique_segments, inverse = np.unique(segments, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights=values)
+        squares = np.bincount(inverse, weights=values ** 2)
+        peaks = np.zeros(len(unique_segments))
+        np.maximum.at(peaks, inverse, np.abs(values))
+
+        means = sums / counts
+        std_devs = np.sqrt(np.maximum(squares / counts - means ** 2, 0.0))
+        rms = np.sqrt(squares / counts)
+
+        for i, segment in enumerate(unique_segments):
+            conditions.append(SegmentCondition(
+                session_id=data_session.id,
+                segment_start=float(segment * segment_length),
+                measurement_type=measurement_type,
+                std_dev=float(std_devs[i]),
+                rms=float(rms[i]),
+                peak=float(peaks[i]),
+                sample_count=int(counts[i]),
+                recorded_at=data_session.end_time
+            ))
+    return conditions
+
+def fit_trends(
+    segment_starts: np.ndarray, days: np.ndarray, values: np.ndarray,
+    horizon_day: float
+) -> Dict[str, np.ndarray]:
+    """Fit y = intercept + slope * day to every segment at once.
+
+    Observations are scattered into a segments x sessions matrix so the
+    least-squares fit runs as masked column reductions instead of a Python
+    loop per segment.
+    """
+    segments, rows = np.unique(segment_starts, return_inverse=True)
+    session_days, columns = np.unique(days, return_inverse=True)
+
+    observed = np.zeros((len(segments), len(session_days)), dtype=bool)
+    matrix = np.zeros(observed.shape)
+    observed[rows, columns] = True
+    matrix[rows, columns] = values
+    day_matrix = np.broadcast_to(session_days, observed.shape)
+
+    counts = observed.sum(axis=1)
+    safe_counts = np.maximum(counts, 1)
+    mean_day = (day_matrix * observed).sum(axis=1) / safe_counts
+    mean_value = matrix.sum(axis=1) / safe_counts
+
+    day_delta = np.where(observed, day_matrix - mean_day[:, None], 0.0)
+    value_delta = np.where(observed, matrix - mean_value[:, None], 0.0)
+    sxx = (day_delta ** 2).sum(axis=1)
+    sxy = (day_delta * value_delta).sum(axis=1)
+    syy = (value_delta ** 2).sum(axis=1)
+
+    slope = np.divide(sxy, sxx, out=np.zeros(len(segments)), where=sxx > 0)
+    intercept = mean_value - slope * mean_day
+    residuals = np.where(observed, matrix - (intercept[:, None] + slope[:, None] * day_matrix), 0.0)
+    r_squared = np.divide(
+        syy - (residuals ** 2).sum(axis=1), syy,
+        out=np.full(len(segments), np.nan), where=syy > 0
+    )
+
+    latest_column = np.where(observed, np.arange(len(session_days)), -1).argmax(axis=1)
+    return {
+        "segment_start": segments,
+        "slope": slope,
+        "intercept": intercept,
+        "r_squared": r_squared,
+        "count": counts,
+        "latest": matrix[np.arange(len(segments)), latest_column],
+        "forecast": intercept + slope * horizon_day
+    }
+
+def update_segment_conditions(session: Session) -> int:
+    """Record indicators for completed sessions not processed yet"""
+    processed = {
+        row[0] for row in session.query(SegmentCondition.session_id).distinct().all()
+    }
+    pending = [
+        data_session for data_session in session.query(DataSession).filter(
+            DataSession.status == "completed"
+        ).all()
+        if data_session.id not in processed
+    ]
+
+    for data_session in pending:
+        channels = load_session_channels(session, data_session)
+        session.add_all(compute_segment_conditions(data_session, channels))
+        session.commit()
+    return len(pending)
+
+def refit_segment_trends(session: Session, segments: Optional[Set[Tuple[str, float]]] = None) -> int:
+    """Refit segment trends from the recorded indicators, the caller commits.
+
+    Refits every segment, or only the given (measurement type, segment
+    start) pairs, dropping the trends of those left without indicators.
+    """
+    query = session.query(
+        SegmentCondition.measurement_type, SegmentCondition.segment_start,
+        SegmentCondition.recorded_at, SegmentCondition.std_dev
+    )
+    if segments is not None:
+        query = query.filter(
+            SegmentCondition.measurement_type.in_({segment[0] for segment in segments}),
+            SegmentCondition.segment_start.in_({segment[1] for segment in segments})
+        )
+    rows = [
+        row for row in query.all()
+        if segments is None or (row.measurement_type, row.segment_start) in segments
+    ]
+    if not rows and segments is None:
+        return 0
+
+    # Days count from the first session overall, also when refitting a few
+    epoch = session.query(func.min(SegmentCondition.recorded_at)).scalar() if rows else None
+    now = datetime.utcnow()
+    horizon_day = (now - epoch).total_seconds() / 86400 + settings.degradation_forecast_days if rows else 0.0
+
+    by_type: Dict[str, List] = {}
+    for row in rows:
+        by_type.setdefault(row.measurement_type, []).append(row)
+
+    trends = []
+    for measurement_type, type_rows in by_type.items():
+        fit = fit_trends(
+            np.array([row.segment_start for row in type_rows]),
+            np.array([(row.recorded_at - epoch).total_seconds() / 86400 for row in type_rows]),
+            np.array([row.std_dev for row in type_rows]),
+            horizon_day
+        )
+        for i in np.flatnonzero(fit["count"] >= 2):
+            trends.append(SegmentTrend(
+                segment_start=float(fit["segment_start"][i]),
+                segment_end=float(fit["segment_start"][i] + settings.segment_length),
+                measurement_type=measurement_type,
+                slope_per_day=float(fit["slope"][i]),
+                intercept=float(fit["intercept"][i]),
+                r_squared=None if np.isnan(fit["r_squared"][i]) else float(fit["r_squared"][i]),
+                session_count=int(fit["count"][i]),
+                latest_value=float(fit["latest"][i]),
+                forecast_value=float(fit["forecast"][i]),
+                updated_at=now
+            ))
+
+    if segments is None:
+        session.query(SegmentTrend).delete()
+    else:
+        stale = [
+            trend_id for trend_id, measurement_type, segment_start in session.query(
+                SegmentTrend.id, SegmentTrend.measurement_type, SegmentTrend.segment_start
+            ).filter(
+                SegmentTrend.measurement_type.in_({segment[0] for segment in segments}),
+                SegmentTrend.segment_start.in_({segment[1] for segment in segments})
+            )
+            if (measurement_type, segment_start) in segments
+        ]
+        for start in range(0, len(stale), 500):
+            session.query(SegmentTrend).filter(
+                SegmentTrend.id.in_(stale[start:start + 500])
+            ).delete(synchronize_session=False)
+    session.add_all(trends)
+    return len(trends)
+
+def delete_session_conditions(session: Session, session_id: int) -> int:
+    """Delete a session's indicators and refit the trends of its segments.
+
+    The caller commits, together with deleting the session. Returns the
+    number of trends refitted.
+    """
+    segments = {
+        (measurement_type, segment_start)
+        for measurement_type, segment_start in session.query(
+            SegmentCondition.measurement_type, SegmentCondition.segment_start
+        ).filter(SegmentCondition.session_id == session_id).distinct()
+    }
+    if not segments:
+        return 0
+    session.query(SegmentCondition).filter(
+        SegmentCondition.session_id == session_id
+    ).delete(synchronize_session=False)
+    return refit_segment_trends(session, segments)
+
+def refresh_degradation() -> int:
+    """Process new completed sessions and refit trends"""
+    with Session(engine) as session:
+        update_segment_conditions(session)
+        fitted = refit_segment_trends(session)
+        session.commit()
+        return fitted
+
+async def refresh_degradation_periodically():
+    """Background task to keep segment trends up to date"""
+    while True:
+        try:
+            await asyncio.to_thread(refresh_degradation)
+        except Exception as e:
+            print(f"❌ Error refreshing degradation trends: {e}")
+        await asyncio.sleep(settings.degradation_refresh_interval)
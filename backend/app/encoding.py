@@ -0,0 +1,103 @@
+"""
+ITMS Real-time Encoding
+Serializes realtime messages as JSON text or as binary column frames for
+clients that negotiate the columnar WebSocket subprotocol
+"""
+
+import json
+import struct
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+# WebSocket subprotocol selecting the binary encoding
+COLUMNAR_SUBPROTOCOL = "itms.columnar.v1"
+
+# Magic, version, kind, metadata length, row count (little-endian)
+HEADER = struct.Struct("<4sBBHI")
+MAGIC = b"ITMS"
+VERSION = 1
+
+# Frame kinds
+KIND_SAMPLES = 1
+KIND_FRAME = 2
+KIND_SNAPSHOT = 3
+
+def to_epoch_micros(timestamp: Any) -> int:
+    """Convert an ISO string or datetime to microseconds since the epoch, naive as UTC"""
+    if timestamp is None:
+        return 0
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp() * 1_000_000)
+
+def pack_columns(kind: int, metadata: Dict[str, Any], rows: int, columns: List[np.ndarray]) -> bytes:
+    """Build header + JSON metadata + columns, each column 8-byte aligned.
+
+    Alignment lets clients view the columns as typed arrays without copying.
+    """
+    meta = json.dumps(metadata, separators=(",", ":")).encode()
+    parts = [HEADER.pack(MAGIC, VERSION, kind, len(meta), rows), meta]
+    offset = HEADER.size + len(meta)
+    for column in columns:
+        padding = -offset % 8
+        parts.append(b"\0" * padding)
+        data = column.tobytes()
+        parts.append(data)
+        offset += padding + len(data)
+    return b"".join(parts)
+
+def encode_columnar(message: Dict[str, Any]) -> Union[str, bytes]:
+    """Encode sensor messages as binary columns, anything else as JSON text.
+
+    sensor_data and sensor_snapshot columns: timestamp int64 (us since
+    epoch), chainage float64, value float32. sensor_frame has a single row
+    with columns count int64, last_timestamp int64, then float64 chainage,
+    end_chainage, last_chainage, min, max, last.
+    """
+    metadata = {
+        "type": message["type"],
+        "sensor_id": message.get("sensor_id"),
+        "measurement_type": message.get("measurement_type"),
+        "timestamp": message.get("timestamp")
+    }
+
+    if message["type"] == "sensor_data":
+        samples = message["data"]
+        return pack_columns(KIND_SAMPLES, metadata, len(samples), [
+            np.fromiter((to_epoch_micros(s.get("timestamp")) for s in samples),
+                        dtype="<i8", count=len(samples)),
+            np.fromiter((s["chainage"] for s in samples), dtype="<f8", count=len(samples)),
+            np.fromiter((s["value"] for s in samples), dtype="<f4", count=len(samples))
+        ])
+
+    if message["type"] == "sensor_frame":
+        frame = message["data"]
+        metadata["rate"] = message.get("rate")
+        return pack_columns(KIND_FRAME, metadata, 1, [
+            np.array([frame["count"], to_epoch_micros(frame.get("last_timestamp"))], dtype="<i8"),
+            np.array([
+                frame["chainage"], frame["end_chainage"], frame["last_chainage"],
+                frame["min"], frame["max"], frame["last"]
+            ], dtype="<f8")
+        ])
+
+    if message["type"] == "sensor_snapshot":
+        columns = message["data"]
+        rows = len(columns["timestamp_us"])
+        return pack_columns(KIND_SNAPSHOT, metadata, rows, [
+            np.asarray(columns["timestamp_us"], dtype="<i8"),
+            np.asarray(columns["chainage"], dtype="<f8"),
+            np.asarray(columns["value"], dtype="<f4")
+        ])
+
+    return json.dumps(message)
+
+def encode_message(message: Dict[str, Any], encoding: str) -> Union[str, bytes]:
+    """Serialize a message for a client encoding ("json" or "columnar")"""
+    if encoding == "columnar":
+        return encode_columnar(message)
+    return json.dumps(message)
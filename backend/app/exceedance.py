@@ -0,0 +1,154 @@
+"""
+ITMS Threshold Exceedance Engine
+Checks ingest batches against alert thresholds and merges consecutive
+exceedances into a single defect span
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import Session
+
+from app.config import settings
+from app.config_cache import config_cache
+from app.models import DefectLog, DefectSeverity, Measurement
+from app.utils import get_defect_type
+
+class ExceedanceEngine:
+    """Run-length encodes threshold exceedances per (sensor_id, type)"""
+
+    def __init__(self, max_gap: float = settings.exceedance_max_gap):
+        self.max_gap = max_gap
+        # key -> span still open at the end of the previous batch
+        self.open_spans: Dict[Tuple[str, str], Dict] = {}
+
+    def get_limits(self, measurement_type: str) -> Optional[Tuple[float, float]]:
+        """Get (nominal, tolerance) for a measurement type, None if unchecked"""
+        if measurement_type == "gauge":
+            return (
+                settings.nominal_gauge,
+                config_cache.get_float("gauge_tolerance", settings.gauge_tolerance)
+            )
+        elif measurement_type == "acceleration":
+            return (
+                0.0,
+                config_cache.get_float("vibration_threshold", settings.vibration_threshold)
+            )
+        return None
+
+    def get_severity(self, excess_ratio: float) -> DefectSeverity:
+        """Map peak deviation / tolerance to a defect severity"""
+        if excess_ratio >= 3.0:
+            return DefectSeverity.CRITICAL
+        elif excess_ratio >= 2.0:
+            return DefectSeverity.HIGH
+        elif excess_ratio >= 1.5:
+            return DefectSeverity.MEDIUM
+        return DefectSeverity.LOW
+
+    def find_spans(
+        self, chainages: np.ndarray, values: np.ndarray, nominal: float, tolerance: float
+    ) -> List[Tuple[int, int, int]]:
+        """Get (start, end, peak) indices of runs of same-sided exceedances.
+
+        A run is split where the deviation changes side or where consecutive
+        samples are more than max_gap apart.
+        """
+        deviations = values - nominal
+        exceeding = np.abs(deviations) > tolerance
+        if not exceeding.any():
+            return []
+
+        run_keys = np.where(exceeding, np.sign(deviations), 0).astype(np.int8)
+        breaks = (np.diff(run_keys) != 0) | (np.abs(np.diff(chainages)) > self.max_gap)
+        starts = np.concatenate(([0], np.flatnonzero(breaks) + 1))
+        ends = np.concatenate((starts[1:], [len(values)]))
+
+        keep = run_keys[starts] != 0
+        starts, ends = starts[keep], ends[keep]
+        magnitudes = np.abs(deviations)
+        return [
+            (int(start), int(end - 1), int(start + np.argmax(magnitudes[start:end])))
+            for start, end in zip(starts, ends)
+        ]
+
+    def process(
+        self, session: Session, measurements: List[Measurement]
+    ) -> Tuple[List[DefectLog], List[DefectLog]]:
+        """Evaluate a batch of stored measurements.
+
+        New spans are added to the session; spans continuing an exceedance
+        left open by the previous batch extend the existing row. Returns the
+        new and the extended defects.
+        """
+        groups: Dict[Tuple[str, str], List[Measurement]] = {}
+        for measurement in measurements:
+            measurement_type = getattr(measurement.type, "value", measurement.type)
+            groups.setdefault((measurement.sensor_id, measurement_type), []).append(measurement)
+
+        new_defects = []
+        extended_defects = []
+        for key, group in groups.items():
+            limits = self.get_limits(key[1])
+            if limits is None:
+                continue
+            nominal, tolerance = limits
+
+            group.sort(key=lambda m: m.timestamp)
+            chainages = np.fromiter((m.chainage for m in group), dtype=np.float64, count=len(group))
+            values = np.fromiter((m.value for m in group), dtype=np.float64, count=len(group))
+            spans = self.find_spans(chainages, values, nominal, tolerance)
+
+            open_span = self.open_spans.pop(key, None)
+            for start, end, peak in spans:
+                deviation = values[peak] - nominal
+                ratio = abs(deviation) / tolerance if tolerance > 0 else float("inf")
+
+                if (
+                    start == 0 and open_span is not None
+                    and np.sign(deviation) == open_span["sign"]
+                    and abs(chainages[0] - open_span["end_chainage"]) <= self.max_gap
+                ):
+                    defect = session.get(DefectLog, open_span["defect_id"])
+                    if defect is not None:
+                        defect.end_chainage = float(chainages[end])
+                        if abs(deviation) > open_span["peak_deviation"]:
+                            defect.peak_value = float(values[peak])
+                            defect.measurement_id = group[peak].id
+                            defect.severity = self.get_severity(ratio)
+                            open_span["peak_deviation"] = abs(deviation)
+                        session.add(defect)
+                        extended_defects.append(defect)
+                        open_span["end_chainage"] = float(chainages[end])
+                        if end == len(values) - 1:
+                            self.open_spans[key] = open_span
+                        continue
+
+                defect = DefectLog(
+                    chainage=float(chainages[start]),
+                    end_chainage=float(chainages[end]),
+                    peak_value=float(values[peak]),
+                    defect_type=get_defect_type(key[1], deviation),
+                    severity=self.get_severity(ratio),
+                    description=(
+                        f"{key[1].capitalize()} reading from {key[0]} outside "
+                        f"tolerance of {tolerance:g} around {nominal:g}"
+                    ),
+                    measurement_id=group[peak].id
+                )
+                session.add(defect)
+                session.flush()
+                new_defects.append(defect)
+
+                if end == len(values) - 1:
+                    self.open_spans[key] = {
+                        "defect_id": defect.id,
+                        "sign": np.sign(deviation),
+                        "end_chainage": float(chainages[end]),
+                        "peak_deviation": abs(deviation)
+                    }
+
+        return new_defects, extended_defects
+
+# Global exceedance engine instance
+exceedance_engine = ExceedanceEngine()
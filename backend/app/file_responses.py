@@ -0,0 +1,186 @@
+"""
+ITMS File Responses
+Conditional and ranged responses for stored frame files, sent with the ASGI
+zero-copy extension when the server offers it, and for decoded frames
+"""
+
+import mimetypes
+import os
+import stat
+from email.utils import formatdate
+from typing import Optional, Tuple
+
+import anyio
+from fastapi import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# Bytes read per chunk when the server cannot send files itself
+FILE_CHUNK_SIZE = 256 * 1024
+
+# Content-addressed files never change once written
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MUTABLE_CACHE_CONTROL = "public, max-age=86400"
+
+ZEROCOPY_EXTENSION = "http.response.zerocopy"
+
+def file_etag(stat_result: os.stat_result, content_hash: Optional[str] = None) -> str:
+    """Get a strong ETag from a content hash, else a weak one from mtime and size"""
+    if content_hash:
+        return f'"{content_hash}"'
+    return f'W/"{int(stat_result.st_mtime_ns):x}-{stat_result.st_size:x}"'
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (candidate[2:] if candidate.startswith("W/") else candidate) == opaque
+        for candidate in (value.strip() for value in header.split(","))
+    )
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Get the inclusive byte range of a single-range Range header.
+
+    Returns None for headers to ignore, such as other units or multiple
+    ranges, and raises ValueError for ranges outside the file.
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, _, last = (part.strip() for part in ranges.partition("-"))
+    if not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start > end:
+            raise ValueError("range not satisfiable")
+        return start, end
+
+    # Suffix range, the last n bytes
+    length = int(last)
+    if length == 0 or size == 0:
+        raise ValueError("range not satisfiable")
+    return max(size - length, 0), size - 1
+
+class RangeFileResponse(Response):
+    """Sends bytes start to end inclusive of a file without buffering it"""
+
+    def __init__(self, path: str, start: int, end: int, status_code: int = 200,
+                 headers: Optional[dict] = None, media_type: Optional[str] = None,
+                 send_body: bool = True):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.send_body = send_body
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["content-length"] = str(max(end - start + 1, 0))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+        count = self.end - self.start + 1
+        if not self.send_body or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            # The server copies from the file descriptor in the kernel
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": ZEROCOPY_EXTENSION,
+                    "file": file,
+                    "offset": self.start,
+                    "count": count,
+                    "more_body": False
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await file.read(min(FILE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0
+                })
+            if remaining > 0:
+                # File shrank while sending, close the body
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def file_response(
+    request: Request, path: str, content_hash: Optional[str] = None,
+    media_type: Optional[str] = None
+) -> Response:
+    """Serve a file with ETag, If-None-Match, Range and cache headers.
+
+    Files with a content hash are immutable and get a strong ETag and a
+    year-long cache lifetime. Raises FileNotFoundError if path is missing.
+    """
+    stat_result = os.stat(path)
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise FileNotFoundError(path)
+
+    etag = file_etag(stat_result, content_hash)
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": IMMUTABLE_CACHE_CONTROL if content_hash else MUTABLE_CACHE_CONTROL,
+        "accept-ranges": "bytes"
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    size = stat_result.st_size
+    media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    send_body = request.method != "HEAD"
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # A stale If-Range means the client's partial copy is outdated, send it
+    # all. Only strong validators may be used for ranges.
+    if range_header and (
+        if_range is None or (if_range.strip() == etag and not etag.startswith("W/"))
+    ):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            headers["content-range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            return RangeFileResponse(path, start, end, status_code=206, headers=headers,
+                                     media_type=media_type, send_body=send_body)
+
+    return RangeFileResponse(path, 0, size - 1, headers=headers,
+                             media_type=media_type, send_body=send_body)
+
+def content_response(request: Request, content: bytes, content_hash: str,
+                     media_type: str = "image/jpeg") -> Response:
+    """Serve generated immutable content with a strong ETag and If-None-Match"""
+    etag = f'"{content_hash}"'
+    headers = {"etag": etag, "cache-control": IMMUTABLE_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if request.method == "HEAD":
+        headers["content-length"] = str(len(content))
+        return Response(status_code=200, headers=headers, media_type=media_type)
+    return Response(content=content, headers=headers, media_type=media_type)
@@ -0,0 +1,310 @@
+"""
+ITMS Frame Processing
+Claims unprocessed video frames in batches, runs a defect analyser over them
+in a process pool and writes the annotations back in bulk
+"""
+
+import asyncio
+import importlib
+import json
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, bindparam, func, or_, select, update
+from sqlmodel import Session
+
+from app.annotations import replace_frame_annotations
+from app.config import settings
+from app.db import engine
+from app.models import VideoFrame
+
+class DefectDetector:
+    """Analyser interface run over every frame.
+
+    Matches DefectDetector in scripts/hardware_simulator.py, so any class with
+    the same analyze_image method can be set as FRAME_ANALYZER. Each returned
+    defect is a dict with at least type and confidence. This base class
+    finds nothing, it only marks frames as processed.
+    """
+
+    def analyze_image(self, image: np.ndarray, chainage: float) -> List[Dict[str, Any]]:
+        return []
+
+# Analysers loaded in this process, keyed by "module:Class"
+_analyzers: Dict[str, Any] = {}
+
+def load_analyzer(path: str):
+    """Get the analyser instance for a "module:Class" path, created once per process"""
+    analyzer = _analyzers.get(path)
+    if analyzer is None:
+        module_name, _, class_name = path.partition(":")
+        analyzer = _analyzers[path] = getattr(importlib.import_module(module_name), class_name)()
+    return analyzer
+
+def iter_frame_images(frames: List[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], Any]]:
+    """Yield each frame with its RGB image array, or the exception loading it.
+
+    Frames of one segment are decoded in a single forward pass from the
+    first keyframe needed, instead of one seek per frame.
+    """
+    from PIL import Image
+
+    segments: Dict[str, List[Dict[str, Any]]] = {}
+    for frame in frames:
+        if frame["segment_id"] is not None:
+            segments.setdefault(frame["filepath"], []).append(frame)
+            continue
+        try:
+            with Image.open(frame["filepath"]) as image:
+                yield frame, np.asarray(image.convert("RGB"))
+        except Exception as e:
+            yield frame, e
+
+    for filepath, segment_frames in segments.items():
+        wanted = {frame["pts"]: frame for frame in segment_frames}
+        try:
+            import av
+            with av.open(filepath) as container:
+                stream = container.streams.video[0]
+                stream.thread_type = "AUTO"
+                container.seek(min(frame["keyframe_pts"] for frame in segment_frames),
+                               stream=stream, backward=True)
+                last_pts = max(wanted)
+                for decoded in container.decode(stream):
+                    frame = wanted.pop(decoded.pts, None)
+                    if frame is not None:
+                        yield frame, decoded.to_ndarray(format="rgb24")
+                    if not wanted or (decoded.pts is not None and decoded.pts >= last_pts):
+                        break
+            error = ValueError("Frame not found in video segment")
+        except Exception as e:
+            error = e
+        for frame in wanted.values():
+            yield frame, error
+
+def analyze_frames(analyzer_path: str, frames: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Run the analyser over a chunk of frames, run in a worker process"""
+    analyzer = load_analyzer(analyzer_path)
+    results = []
+    for frame, image in iter_frame_images(frames):
+        if isinstance(image, Exception):
+            results.append({"id": frame["id"], "error": str(image)})
+            continue
+        try:
+            defects = analyzer.analyze_image(image, frame["chainage"])
+        except Exception as e:
+            results.append({"id": frame["id"], "error": str(e)})
+            continue
+        confidences = [defect["confidence"] for defect in defects if "confidence" in defect]
+        results.append({
+            "id": frame["id"],
+            "annotations": json.dumps(defects, default=str),
+            "confidence": max(confidences) if confidences else None
+        })
+    return results
+
+def claim_frames(owner: str, batch_size: int, lease_seconds: float) -> List[Dict[str, Any]]:
+    """Lease a batch of unprocessed frames to owner.
+
+    Postgres skips rows locked by other claimers; SQLite serialises writers,
+    so a single UPDATE over a subquery claims atomically there. Frames whose
+    lease has expired, because their worker crashed, are claimed again.
+    """
+    now = datetime.utcnow()
+    claimable = select(VideoFrame.id).where(
+        VideoFrame.processed == False,
+        or_(VideoFrame.lease_expires_at.is_(None), VideoFrame.lease_expires_at < now)
+    ).order_by(VideoFrame.id).limit(batch_size)
+    lease = {"lease_owner": owner, "lease_expires_at": now + timedelta(seconds=lease_seconds)}
+
+    with Session(engine) as session:
+        if engine.dialect.name == "postgresql":
+            ids = [row[0] for row in session.execute(claimable.with_for_update(skip_locked=True))]
+            if not ids:
+                return []
+            session.execute(update(VideoFrame).where(VideoFrame.id.in_(ids)).values(**lease))
+        else:
+            session.execute(
+                update(VideoFrame).where(VideoFrame.id.in_(claimable.scalar_subquery()))
+                .values(**lease).execution_options(synchronize_session=False)
+            )
+        session.commit()
+
+        rows = session.execute(
+            select(
+                VideoFrame.id, VideoFrame.filepath, VideoFrame.chainage, VideoFrame.camera_id,
+                VideoFrame.segment_id, VideoFrame.pts, VideoFrame.keyframe_pts
+            ).where(VideoFrame.lease_owner == owner).order_by(VideoFrame.id)
+        ).all()
+    return [dict(row._mapping) for row in rows]
+
+def write_results(owner: str, results: List[Dict[str, Any]], frames: List[Dict[str, Any]],
+                  max_attempts: int = settings.frame_processing_max_attempts,
+                  retry_seconds: float = settings.frame_processing_retry_seconds) -> int:
+    """Store annotations of a batch in one executemany, returning rows written.
+
+    Rows whose lease was taken over after expiring are left to the new owner.
+    The normalised detections of the frames still leased are replaced in the
+    same transaction. Frames that failed keep their annotations and
+    detections, record the error and stay unprocessed, so they can be
+    claimed again after retry_seconds until max_attempts failures mark them
+    processed.
+    """
+    if not results:
+        return 0
+    owned_by_batch = and_(VideoFrame.id == bindparam("frame_id"), VideoFrame.lease_owner == owner)
+    statement = update(VideoFrame).where(owned_by_batch).values(
+        annotations=bindparam("frame_annotations"),
+        confidence=bindparam("frame_confidence"),
+        processed=True,
+        processing_error=None,
+        lease_owner=None,
+        lease_expires_at=None
+    )
+    attempts = func.coalesce(VideoFrame.processing_attempts, 0) + 1
+    failed_statement = update(VideoFrame).where(owned_by_batch).values(
+        processing_error=bindparam("frame_error"),
+        processing_attempts=attempts,
+        processed=attempts >= max_attempts,
+        lease_owner=None,
+        # Keeps the frame from being claimed again before the retry delay
+        lease_expires_at=datetime.utcnow() + timedelta(seconds=retry_seconds)
+    )
+    annotations = {result["id"]: result["annotations"] for result in results if "error" not in result}
+    parameters = [
+        {
+            "frame_id": result["id"],
+            "frame_annotations": result["annotations"],
+            "frame_confidence": result.get("confidence")
+        }
+        for result in results if "error" not in result
+    ]
+    failed_parameters = [
+        {"frame_id": result["id"], "frame_error": result["error"]}
+        for result in results if "error" in result
+    ]
+    with Session(engine) as session:
+        owned = {row[0] for row in session.execute(
+            select(VideoFrame.id).where(VideoFrame.lease_owner == owner)
+        )}
+        connection = session.connection()
+        written = 0
+        if parameters:
+            written += connection.execute(statement, parameters).rowcount
+        if failed_parameters:
+            written += connection.execute(failed_statement, failed_parameters).rowcount
+        replace_frame_annotations(session, [
+            (frame["id"], frame["chainage"], frame["camera_id"], annotations[frame["id"]])
+            for frame in frames if frame["id"] in owned and frame["id"] in annotations
+        ])
+        session.commit()
+    return written
+
+class FrameProcessor:
+    """Background loop feeding claimed frames to a pool of analyser processes"""
+
+    def __init__(self, analyzer: str = settings.frame_analyzer,
+                 workers: Optional[int] = settings.frame_processing_workers,
+                 batch_size: int = settings.frame_processing_batch_size,
+                 lease_seconds: float = settings.frame_lease_seconds):
+        self.analyzer = analyzer
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.batches = 0
+        self.frames_processed = 0
+        self.frames_failed = 0
+        self.last_batch_frames = 0
+        self.last_batch_seconds = 0.0
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # Spawned workers avoid forking the server's threads and sockets
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    async def process_batch(self) -> int:
+        """Claim, analyse and store one batch, returning the frames claimed"""
+        owner = f"{self.worker_id}:{uuid.uuid4().hex[:12]}"
+        frames = await asyncio.to_thread(claim_frames, owner, self.batch_size, self.lease_seconds)
+        if not frames:
+            return 0
+
+        started = time.perf_counter()
+        # One chunk per worker keeps the frames of a segment together
+        chunk_size = -(-len(frames) // self.workers)
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        try:
+            chunks = await asyncio.gather(*(
+                loop.run_in_executor(executor, analyze_frames, self.analyzer,
+                                     frames[start:start + chunk_size])
+                for start in range(0, len(frames), chunk_size)
+            ))
+        except BrokenProcessPool:
+            # Leases expire and the frames are claimed again by a fresh pool
+            self.executor = None
+            raise
+
+        results = [result for chunk in chunks for result in chunk]
+        await asyncio.to_thread(write_results, owner, results, frames)
+
+        failed = sum(1 for result in results if "error" in result)
+        self.batches += 1
+        self.frames_processed += len(results) - failed
+        self.frames_failed += failed
+        self.last_batch_frames = len(frames)
+        self.last_batch_seconds = time.perf_counter() - started
+        return len(frames)
+
+    async def run(self):
+        """Process batches while frames are waiting, polling when idle"""
+        while True:
+            try:
+                claimed = await self.process_batch()
+            except Exception as e:
+                print(f"❌ Error processing video frames: {e}")
+                claimed = 0
+            if claimed < self.batch_size:
+                await asyncio.sleep(settings.frame_processing_poll_interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with Session(engine) as session:
+            pending = session.query(VideoFrame).filter(VideoFrame.processed == False).count()
+            retrying = session.query(VideoFrame).filter(
+                VideoFrame.processed == False, VideoFrame.processing_attempts > 0
+            ).count()
+        return {
+            "analyzer": self.analyzer,
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "pending": pending,
+            "retrying": retrying,
+            "batches": self.batches,
+            "frames_processed": self.frames_processed,
+            "frames_failed": self.frames_failed,
+            "last_batch_seconds": round(self.last_batch_seconds, 3),
+            "frames_per_second": round(
+                self.last_batch_frames / self.last_batch_seconds, 1
+            ) if self.last_batch_seconds else None
+        }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+# Global frame processor instance
+frame_processor = FrameProcessor()
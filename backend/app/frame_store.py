@@ -0,0 +1,163 @@
+"""
+ITMS Frame Store
+Content-addressed storage for video frame files, sharded by hash prefix so
+identical frames are stored once and no directory grows without bound
+"""
+
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import bindparam, update
+from sqlmodel import Session
+
+from app.config import settings
+from app.db import dialect_insert
+from app.models import FrameBlob
+
+class FrameStore:
+    """Frame files stored as root/ab/cd/abcd....ext with per-file refcounts.
+
+    Refcounts live in the FrameBlob table and change in the same transaction
+    as the VideoFrame rows referencing them. A file is only moved into place
+    after its row is committed. Released files are unlinked while a
+    placeholder row for their hash is held uncommitted, so an upload of the
+    same content waits in acquire until the file is gone and then moves its
+    own copy into place.
+    """
+
+    def __init__(self, root: str = settings.frame_store_path):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def object_path(self, sha256: str, extension: str) -> str:
+        """Get the sharded path of a stored file"""
+        return os.path.join(self.root, sha256[:2], sha256[2:4], f"{sha256}.{extension}")
+
+    def acquire(self, session: Session, sha256: str, size: int, extension: str) -> FrameBlob:
+        """Add a reference to a file, creating its blob row on first use.
+
+        The caller commits. Returns the blob, whose extension names the file
+        even when a duplicate was uploaded under a different one. A single
+        upsert, so concurrent first uploads of the same content both count.
+        """
+        insert = dialect_insert(session)
+        session.execute(
+            insert(FrameBlob.__table__)
+            .values(
+                sha256=sha256, extension=extension, size=size,
+                refcount=1, created_at=datetime.utcnow()
+            )
+            .on_conflict_do_update(
+                index_elements=["sha256"],
+                set_={"refcount": FrameBlob.__table__.c.refcount + 1}
+            )
+        )
+        return session.get(FrameBlob, sha256, populate_existing=True)
+
+    def release(self, session: Session, sha256: str) -> Optional[str]:
+        """Drop a reference to a file, deleting its blob row at zero.
+
+        The caller commits and then passes the returned path, if any, to
+        remove_unreferenced.
+        """
+        paths = self.release_many(session, {sha256: 1})
+        return paths[0] if paths else None
+
+    def release_many(self, session: Session, references: Dict[str, int]) -> List[str]:
+        """Drop many references at once, given as counts per hash.
+
+        Refcounts are decremented in place so concurrent acquires are never
+        lost. The caller commits and then unlinks the returned paths under
+        claim_unreferenced.
+        """
+        if not references:
+            return []
+        session.connection().execute(
+            update(FrameBlob)
+            .where(FrameBlob.sha256 == bindparam("blob_sha256"))
+            .values(refcount=FrameBlob.refcount - bindparam("blob_references")),
+            [{"blob_sha256": sha256, "blob_references": count} for sha256, count in references.items()]
+        )
+        paths = []
+        hashes = list(references)
+        for start in range(0, len(hashes), 500):
+            released = session.query(FrameBlob.sha256, FrameBlob.extension).filter(
+                FrameBlob.sha256.in_(hashes[start:start + 500]),
+                FrameBlob.refcount <= 0
+            ).all()
+            if released:
+                session.query(FrameBlob).filter(
+                    FrameBlob.sha256.in_([sha256 for sha256, _ in released])
+                ).delete(synchronize_session=False)
+                paths.extend(self.object_path(sha256, extension) for sha256, extension in released)
+        return paths
+
+    @contextmanager
+    def claim_unreferenced(self, session: Session, paths: List[str]) -> Iterator[List[str]]:
+        """Yield the released files that were not acquired again meanwhile.
+
+        A placeholder row with no references is inserted for each hash and
+        kept uncommitted until the block exits, when the placeholders are
+        deleted and the session commits. Files that already have a row again
+        are left out. Unlink the yielded paths inside the block.
+        """
+        by_hash = {os.path.splitext(os.path.basename(path))[0]: path for path in paths}
+        hashes = list(by_hash)
+        insert = dialect_insert(session)
+        created_at = datetime.utcnow()
+        claimed = []
+        try:
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                session.execute(
+                    insert(FrameBlob.__table__).on_conflict_do_nothing(index_elements=["sha256"]),
+                    [
+                        {
+                            "sha256": sha256,
+                            "extension": os.path.splitext(by_hash[sha256])[1].lstrip("."),
+                            "size": 0, "refcount": 0, "created_at": created_at
+                        }
+                        for sha256 in batch
+                    ]
+                )
+                claimed.extend(sha256 for (sha256,) in session.query(FrameBlob.sha256).filter(
+                    FrameBlob.sha256.in_(batch), FrameBlob.refcount <= 0
+                ))
+
+            yield [by_hash[sha256] for sha256 in claimed]
+
+            for start in range(0, len(claimed), 500):
+                session.query(FrameBlob).filter(
+                    FrameBlob.sha256.in_(claimed[start:start + 500]), FrameBlob.refcount <= 0
+                ).delete(synchronize_session=False)
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+
+    def store(self, temp_path: str, sha256: str, extension: str) -> str:
+        """Move a committed upload into place and return its path.
+
+        Replacing an existing copy is safe since the content is identical.
+        """
+        path = self.object_path(sha256, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return path
+
+    def remove_unreferenced(self, session: Session, path: str) -> bool:
+        """Unlink a released file unless it was acquired again meanwhile"""
+        with self.claim_unreferenced(session, [path]) as paths:
+            if not paths:
+                return False
+            try:
+                os.remove(path)
+                return True
+            except FileNotFoundError:
+                return False
+
+# Global frame store instance
+frame_store = FrameStore()
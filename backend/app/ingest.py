@@ -0,0 +1,79 @@
+"""
+ITMS Ingest Pipeline
+Post-commit processing shared by every measurement ingest path
+"""
+
+import asyncio
+from typing import Any, Dict, List
+
+from sqlmodel import Session
+
+from app.anomaly import anomaly_detector
+from app.chainage_index import defect_index, update_chainage_index
+from app.config import settings
+from app.db import engine
+from app.exceedance import exceedance_engine
+from app.models import DefectLog, Measurement
+from app.realtime import manager
+
+def defect_to_dict(defect: DefectLog) -> Dict[str, Any]:
+    """Serialize a defect for real-time alerts"""
+    return {
+        "id": defect.id,
+        "chainage": defect.chainage,
+        "end_chainage": defect.end_chainage,
+        "peak_value": defect.peak_value,
+        "defect_type": defect.defect_type,
+        "severity": int(defect.severity),
+        "description": defect.description,
+        "measurement_id": defect.measurement_id
+    }
+
+async def process_measurements(session: Session, measurements: List[Measurement]) -> List[DefectLog]:
+    """Run detection on freshly committed measurements and raise alerts"""
+    if not measurements:
+        return []
+
+    try:
+        defects, detector_state = anomaly_detector.process(measurements)
+        new_spans, extended_spans = exceedance_engine.process(session, measurements)
+        defects.extend(new_spans)
+        session.add_all(defects)
+        session.commit()
+        # Only a committed batch moves the detector on
+        anomaly_detector.apply(detector_state)
+        for defect in defects + extended_spans:
+            session.refresh(defect)
+        indexed = [
+            (defect.id, defect.chainage, defect.end_chainage) for defect in defects + extended_spans
+        ]
+    except Exception as e:
+        # Detection must never fail an ingest that has already been stored
+        session.rollback()
+        print(f"❌ Error running defect detection: {e}")
+        return []
+
+    await update_chainage_index(defect_index, indexed)
+    for defect in defects:
+        await manager.broadcast_defect_alert(defect_to_dict(defect))
+
+    return defects
+
+def restore_detector_state() -> int:
+    """Load the persisted anomaly detector state"""
+    with Session(engine) as session:
+        return anomaly_detector.restore(session)
+
+def snapshot_detector_state() -> int:
+    """Persist the anomaly detector state"""
+    with Session(engine) as session:
+        return anomaly_detector.snapshot(session)
+
+async def snapshot_detector_state_periodically():
+    """Background task to snapshot anomaly detector state"""
+    while True:
+        await asyncio.sleep(settings.anomaly_snapshot_interval)
+        try:
+            snapshot_detector_state()
+        except Exception as e:
+            print(f"❌ Error snapshotting anomaly detector state: {e}")
@@ -0,0 +1,81 @@
+"""
+ITMS Latency Tracking
+Low-overhead histograms of the time spent in each stage between a sensor
+measurement and its delivery to realtime clients
+"""
+
+import bisect
+import math
+from typing import Dict
+
+# Pipeline stages, in order
+STAGES = ("ingest", "commit", "fanout", "socket_write", "end_to_end")
+
+class LatencyHistogram:
+    """Log-bucketed histogram of durations in seconds.
+
+    Buckets grow geometrically, so recording is one bisect and percentiles
+    are accurate to the bucket width (about 12% with 20 buckets a decade).
+    """
+
+    def __init__(self, min_value: float = 1e-6, max_value: float = 1000.0,
+                 buckets_per_decade: int = 20):
+        decades = math.log10(max_value / min_value)
+        self.bounds = [
+            min_value * 10 ** (i / buckets_per_decade)
+            for i in range(int(decades * buckets_per_decade) + 1)
+        ]
+        # Last bucket collects everything above max_value
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float):
+        # Clock skew between sensors and server can make a stage negative
+        value = max(value, 0.0)
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """Get the upper bound of the bucket holding the q-th percentile"""
+        if self.count == 0:
+            return 0.0
+        target = q / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target and bucket_count:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Get count and millisecond statistics"""
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p90_ms": round(self.percentile(90) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3)
+        }
+
+class LatencyTracker:
+    """One histogram per pipeline stage"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+
+    def record(self, stage: str, seconds: float):
+        self.histograms[stage].record(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+# Global latency tracker instance
+latency_tracker = LatencyTracker()
@@ -11,13 +11,21 @@ import uvicorn
 import asyncio
 from typing import List
 
+from app.config import settings
 from app.db import engine, create_db_and_tables
 from app.models import Measurement, DefectLog, VideoFrame
-from app.routers import measurements, video, reports, admin
-from app.realtime import ConnectionManager
-
-# Global WebSocket connection manager
-manager = ConnectionManager()
+from app.routers import measurements, video, reports, admin, defects, stream
+from app.realtime import manager, monitor_connections
+from app.thumbnails import thumbnail_generator
+from app.video_segments import segment_decoder
+from app.uploads import UploadSizeLimitMiddleware
+from app.frame_processing import frame_processor
+from app.chainage_index import refresh_chainage_indexes_periodically
+from app.degradation import refresh_degradation_periodically
+from app.ingest import (
+    process_measurements, restore_detector_state,
+    snapshot_detector_state, snapshot_detector_state_periodically
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -26,13 +34,30 @@ async def lifespan(app: FastAPI):
     create_db_and_tables()
     print("✅ Database tables created")
     
+    restored = restore_detector_state()
+    print(f"✅ Anomaly detector state restored for {restored} channels")
+    
+    await manager.start_backplane()
+    
     # Start background task for sensor simulation
     asyncio.create_task(simulate_sensor_data())
+    asyncio.create_task(snapshot_detector_state_periodically())
+    asyncio.create_task(refresh_degradation_periodically())
+    # Loads in a worker thread, lookups query the database until it is done
+    asyncio.create_task(refresh_chainage_indexes_periodically())
+    asyncio.create_task(monitor_connections())
+    if settings.frame_processing_enabled:
+        asyncio.create_task(frame_processor.run())
     
     yield
     
     # Shutdown
     print("🛑 Shutting down ITMS Backend Server...")
+    snapshot_detector_state()
+    await manager.stop_backplane()
+    thumbnail_generator.shutdown()
+    segment_decoder.shutdown()
+    frame_processor.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
@@ -51,22 +76,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads before their body is spooled to disk
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        "/api/v1/video-frames/upload": settings.max_file_size,
+        "/api/v1/video-frames/batch": settings.max_file_size * settings.batch_upload_max_frames,
+        "/api/v1/video-segments/upload": settings.max_segment_size,
+    }
+)
+
 # Include routers
 app.include_router(measurements.router, prefix="/api/v1", tags=["measurements"])
 app.include_router(video.router, prefix="/api/v1", tags=["video"])
 app.include_router(reports.router, prefix="/api/v1", tags=["reports"])
 app.include_router(admin.router, prefix="/api/v1", tags=["admin"])
+app.include_router(defects.router, prefix="/api/v1", tags=["defects"])
+app.include_router(stream.router, prefix="/api/v1", tags=["stream"])
 
 # WebSocket endpoint for real-time data
 @app.websocket("/ws/realtime")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    if not await manager.connect(websocket):
+        return
     try:
         while True:
             # Keep connection alive and handle client messages
             data = await websocket.receive_text()
-            # Echo back or process client messages
-            await websocket.send_text(f"Echo: {data}")
+            # Handle pings and subscription changes
+            await manager.handle_client_message(websocket, data)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
@@ -93,8 +131,9 @@ async def simulate_sensor_data():
     """Simulate sensor data for demo purposes"""
     import random
     import json
+    import time
     from datetime import datetime, timezone
-    from app.db import get_session
+    from sqlmodel import Session
     from app.models import Measurement
     
     chainage = 0.0
@@ -106,7 +145,8 @@ async def simulate_sensor_data():
                     "chainage": chainage,
                     "timestamp": datetime.now(timezone.utc),
                     "type": "gauge",
-                    "value": 1.676 + random.gauss(0, 0.02),  # Standard gauge with noise
+                    # Noise well inside the default gauge tolerance, as in the hardware simulator
+                    "value": 1.676 + random.gauss(0, 0.005),  # Standard gauge with noise
                     "sensor_id": "laser_front"
                 },
                 {
@@ -125,19 +165,20 @@ async def simulate_sensor_data():
                 }
             ]
             
-            # Store in database
-            with get_session() as session:
-                for data in sensor_data:
-                    measurement = Measurement(**data)
-                    session.add(measurement)
+            # Store in database and run detection
+            received_at = time.time()
+            with Session(engine) as session:
+                measurements = [Measurement(**data) for data in sensor_data]
+                session.add_all(measurements)
                 session.commit()
+                committed_at = time.time()
+                await process_measurements(session, measurements)
             
             # Broadcast to WebSocket clients
-            await manager.broadcast_json({
-                "type": "sensor_data",
-                "data": sensor_data,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            })
+            await manager.broadcast_sensor_data([
+                {**data, "timestamp": data["timestamp"].isoformat()}
+                for data in sensor_data
+            ], received_at, committed_at)
             
             chainage += 0.25  # 25cm increments
             await asyncio.sleep(0.1)  # 10Hz update rate
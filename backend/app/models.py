@@ -6,6 +6,7 @@ Defines the database schema for the Integrated Track Monitoring System
 from typing import Optional, List
 from datetime import datetime
 from sqlmodel import Field, SQLModel, Relationship
+from sqlalchemy import Column, ForeignKey, Index, Integer
 from enum import Enum
 
 class MeasurementType(str, Enum):
@@ -50,6 +51,7 @@ class DefectType(str, Enum):
     JOINT_DEFECT = "joint_defect"
     SLEEPER_DEFECT = "sleeper_defect"
     BALLAST_DEFECT = "ballast_defect"
+    VIBRATION_EXCESS = "vibration_excess"
 
 # Base model for common fields
 class TimestampMixin(SQLModel):
@@ -61,8 +63,8 @@ class TimestampMixin(SQLModel):
 class Measurement(SQLModel, table=True):
     """Sensor measurement data"""
     id: Optional[int] = Field(default=None, primary_key=True)
-    chainage: float = Field(description="Distance along track in meters")
-    timestamp: datetime = Field(description="Measurement timestamp")
+    chainage: float = Field(index=True, description="Distance along track in meters")
+    timestamp: datetime = Field(index=True, description="Measurement timestamp")
     type: MeasurementType = Field(description="Type of measurement")
     value: float = Field(description="Measured value")
     sensor_id: str = Field(description="ID of the sensor that made the measurement")
@@ -77,6 +79,8 @@ class DefectLog(SQLModel, table=True):
     """Track defects and anomalies detected"""
     id: Optional[int] = Field(default=None, primary_key=True)
     chainage: float = Field(description="Location of defect in meters")
+    end_chainage: Optional[float] = Field(default=None, description="End of the defect span in meters")
+    peak_value: Optional[float] = Field(default=None, description="Peak measured value within the span")
     defect_type: DefectType = Field(description="Type of defect")
     severity: DefectSeverity = Field(description="Severity level")
     description: Optional[str] = Field(default=None, description="Detailed description")
@@ -100,7 +104,65 @@ class VideoFrame(SQLModel, table=True):
     frame_number: Optional[int] = Field(default=None, description="Frame number in video")
     annotations: Optional[str] = Field(default=None, description="ML annotations as JSON")
     confidence: Optional[float] = Field(default=None, description="ML confidence score")
-    processed: bool = Field(default=False, description="Whether frame has been processed")
+    processed: bool = Field(default=False, index=True, description="Whether frame has been processed")
+    # Lease held by the frame processor batch analysing the frame
+    lease_owner: Optional[str] = Field(default=None, index=True, description="Claiming processor batch")
+    lease_expires_at: Optional[datetime] = Field(default=None, description="When the claim may be taken over")
+    processing_attempts: Optional[int] = Field(default=0, description="Failed analysis attempts")
+    processing_error: Optional[str] = Field(default=None, description="Error of the last failed analysis")
+    sha256: Optional[str] = Field(default=None, index=True, description="Content hash of a stored frame file")
+    file_size: Optional[int] = Field(default=None, description="Stored file size in bytes")
+    # Frames decoded on demand from a stored video segment
+    segment_id: Optional[int] = Field(default=None, foreign_key="videosegment.id", index=True)
+    pts: Optional[int] = Field(default=None, description="Presentation timestamp in the segment")
+    keyframe_pts: Optional[int] = Field(default=None, description="Keyframe to seek to before decoding")
+
+# Frame annotation model
+class FrameAnnotation(SQLModel, table=True):
+    """One labelled detection of a video frame, kept in sync with its annotations JSON"""
+    __table_args__ = (
+        Index("ix_frameannotation_label_chainage", "label", "chainage"),
+        Index("ix_frameannotation_label_confidence", "label", "confidence"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    video_frame_id: int = Field(sa_column=Column(
+        Integer, ForeignKey("videoframe.id", ondelete="CASCADE"), nullable=False, index=True
+    ))
+    label: str = Field(description="Detected defect type")
+    confidence: Optional[float] = Field(default=None, description="Detection confidence")
+    bbox_x1: Optional[float] = Field(default=None, description="Bounding box left in pixels")
+    bbox_y1: Optional[float] = Field(default=None, description="Bounding box top in pixels")
+    bbox_x2: Optional[float] = Field(default=None, description="Bounding box right in pixels")
+    bbox_y2: Optional[float] = Field(default=None, description="Bounding box bottom in pixels")
+    chainage: float = Field(index=True, description="Chainage of the frame")
+    camera_id: str = Field(description="Camera of the frame")
+
+# Video segment model
+class VideoSegment(SQLModel, table=True):
+    """Stored video file whose frames are indexed as VideoFrame rows"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    camera_id: str = Field(index=True, description="Camera that recorded the segment")
+    filepath: str = Field(description="Path to the stored video file")
+    sha256: str = Field(index=True, description="Content hash of the video file")
+    file_size: int = Field(description="Stored file size in bytes")
+    start_timestamp: datetime = Field(description="Timestamp of the first frame")
+    start_chainage: float = Field(description="Track location of the first frame")
+    end_chainage: float = Field(description="Track location of the last frame")
+    frame_count: int = Field(description="Number of indexed frames")
+    fps: float = Field(description="Average frame rate")
+    width: int
+    height: int
+    codec: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Content-addressed frame file
+class FrameBlob(SQLModel, table=True):
+    """Frame file in the content-addressed store, shared by identical frames"""
+    sha256: str = Field(primary_key=True, description="SHA-256 of the file content")
+    extension: str = Field(description="File extension")
+    size: int = Field(description="File size in bytes")
+    refcount: int = Field(default=0, description="Video frames referencing the file")
+    created_at: datetime = Field(default_factory=datetime.utcnow)
 
 # System configuration model
 class SystemConfig(SQLModel, table=True):
@@ -125,6 +187,59 @@ class DataSession(SQLModel, table=True):
     status: str = Field(default="active", description="Session status")
     notes: Optional[str] = Field(default=None, description="Session notes")
 
+# Anomaly detector state snapshot
+class AnomalyDetectorState(SQLModel, table=True):
+    """Persisted EWMA state of the online anomaly detector"""
+    __table_args__ = (
+        Index("ix_anomalydetectorstate_channel", "sensor_id", "measurement_type", unique=True),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    sensor_id: str = Field(index=True, description="Sensor the state belongs to")
+    measurement_type: str = Field(description="Measurement type the state belongs to")
+    mean: float = Field(description="EWMA mean")
+    variance: float = Field(description="EWMA variance")
+    sample_count: int = Field(default=0, description="Samples seen by the detector")
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Cached cross-run comparison
+class SessionComparison(SQLModel, table=True):
+    """Cached alignment and difference series between two data sessions"""
+    __table_args__ = (
+        Index("ix_sessioncomparison_sessions", "session_a_id", "session_b_id", unique=True),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_a_id: int = Field(foreign_key="datasession.id", index=True)
+    session_b_id: int = Field(foreign_key="datasession.id", index=True)
+    result: str = Field(description="Comparison result as JSON")
+    computed_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Per-segment condition indicators
+class SegmentCondition(SQLModel, table=True):
+    """Condition indicators of one track segment in one completed session"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: int = Field(foreign_key="datasession.id", index=True)
+    segment_start: float = Field(index=True, description="Segment start chainage in meters")
+    measurement_type: str = Field(description="Measurement type the indicators describe")
+    std_dev: float = Field(description="Standard deviation over the segment")
+    rms: float = Field(description="Root mean square over the segment")
+    peak: float = Field(description="Largest absolute value over the segment")
+    sample_count: int = Field(description="Samples in the segment")
+    recorded_at: datetime = Field(description="Session end time")
+
+class SegmentTrend(SQLModel, table=True):
+    """Fitted degradation trend of one track segment"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    segment_start: float = Field(index=True, description="Segment start chainage in meters")
+    segment_end: float = Field(description="Segment end chainage in meters")
+    measurement_type: str = Field(index=True, description="Measurement type the trend describes")
+    slope_per_day: float = Field(description="Change of standard deviation per day")
+    intercept: float = Field(description="Fitted standard deviation at the first session")
+    r_squared: Optional[float] = Field(default=None, description="Goodness of fit")
+    session_count: int = Field(description="Sessions the trend was fitted on")
+    latest_value: float = Field(description="Standard deviation in the latest session")
+    forecast_value: float = Field(description="Forecast standard deviation at the horizon")
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 # Pydantic models for API requests/responses
 class MeasurementCreate(SQLModel):
     """Schema for creating new measurements"""
@@ -150,6 +265,8 @@ class MeasurementResponse(SQLModel):
 class DefectCreate(SQLModel):
     """Schema for creating new defects"""
     chainage: float
+    end_chainage: Optional[float] = None
+    peak_value: Optional[float] = None
     defect_type: DefectType
     severity: DefectSeverity
     description: Optional[str] = None
@@ -160,6 +277,8 @@ class DefectResponse(SQLModel):
     """Schema for defect API responses"""
     id: int
     chainage: float
+    end_chainage: Optional[float] = None
+    peak_value: Optional[float] = None
     defect_type: DefectType
     severity: DefectSeverity
     description: Optional[str] = None
@@ -179,6 +298,26 @@ class VideoFrameCreate(SQLModel):
     annotations: Optional[str] = None
     confidence: Optional[float] = None
 
+class DefectFrameMatch(SQLModel):
+    """Closest frame of one camera to a defect"""
+    video_frame_id: int
+    camera_id: str
+    chainage: float
+    timestamp: datetime
+    distance: float
+
+class DefectWithFramesResponse(DefectResponse):
+    """Defect with the closest frame of each camera"""
+    frames: List[DefectFrameMatch] = []
+
+class VideoFrameManifestEntry(SQLModel):
+    """Metadata of one frame in a batch upload manifest"""
+    filename: str
+    chainage: float
+    camera_id: str
+    timestamp: Optional[datetime] = None
+    frame_number: Optional[int] = None
+
 class VideoFrameResponse(SQLModel):
     """Schema for video frame API responses"""
     id: int
@@ -190,6 +329,44 @@ class VideoFrameResponse(SQLModel):
     annotations: Optional[str] = None
     confidence: Optional[float] = None
     processed: bool
+    processing_error: Optional[str] = None
+    sha256: Optional[str] = None
+    file_size: Optional[int] = None
+    segment_id: Optional[int] = None
+
+class FrameAnnotationResponse(SQLModel):
+    """Schema for frame annotation API responses"""
+    id: int
+    video_frame_id: int
+    label: str
+    confidence: Optional[float] = None
+    bbox: Optional[List[float]] = None
+    chainage: float
+    camera_id: str
+
+class FrameAnnotationLabelStats(SQLModel):
+    """Annotation count and confidence of one label"""
+    label: str
+    count: int
+    frames: int
+    max_confidence: Optional[float] = None
+
+class VideoSegmentResponse(SQLModel):
+    """Schema for video segment API responses"""
+    id: int
+    camera_id: str
+    filepath: str
+    sha256: str
+    file_size: int
+    start_timestamp: datetime
+    start_chainage: float
+    end_chainage: float
+    frame_count: int
+    fps: float
+    width: int
+    height: int
+    codec: str
+    created_at: datetime
 
 # Statistics and analytics models
 class MeasurementStats(SQLModel):
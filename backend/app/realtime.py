@@ -4,97 +4,719 @@ Handles WebSocket connections for live data streaming
 """
 
 import json
+import time
 import asyncio
-from typing import List, Dict, Any
+import uuid
+
+import numpy as np
+from collections import deque
+from typing import List, Dict, Any, Optional, Set, Tuple, Deque, Callable, Union
 from fastapi import WebSocket
 from datetime import datetime, timezone
 
+from app.config import settings
+from app.decimation import FrameAggregator, normalize_frame_rate
+from app.encoding import COLUMNAR_SUBPROTOCOL, encode_message, to_epoch_micros
+from app.latency import latency_tracker
+from app.backplane import LocalBackplane, create_backplane
+from app.replay import ReplayBuffer
+from app.backfill import PIPELINE_DEPTH, BackfillRequest, fetch_backfill_chunk, rows_to_columns
+
+# Message topics clients can subscribe to
+TOPICS = {"sensor_data", "defect_alert", "system_status"}
+
+class Subscription:
+    """Filter deciding which broadcasts a client receives.
+
+    Unset filters match everything, so a client that never subscribes keeps
+    receiving the full stream.
+    """
+    
+    def __init__(self):
+        self.topics: Optional[Set[str]] = None
+        self.sensor_ids: Optional[Set[str]] = None
+        self.measurement_types: Optional[Set[str]] = None
+        self.chainage_window: Optional[Tuple[float, float]] = None
+        # Frame rate in Hz for decimated sensor data, None for raw samples
+        self.rate: Optional[float] = None
+    
+    def update(self, data: Dict[str, Any]):
+        """Apply a subscribe message"""
+        topics = list(data.get("subscriptions", [])) + list(data.get("topics", []))
+        if topics:
+            self.topics = (self.topics or set()) | set(topics)
+        if data.get("sensor_ids"):
+            self.sensor_ids = (self.sensor_ids or set()) | set(data["sensor_ids"])
+        if data.get("measurement_types"):
+            self.measurement_types = (self.measurement_types or set()) | set(data["measurement_types"])
+        if "chainage_window" in data:
+            window = data["chainage_window"]
+            self.chainage_window = (float(window[0]), float(window[1])) if window else None
+        if "rate" in data:
+            self.rate = normalize_frame_rate(data["rate"])
+    
+    def remove(self, data: Dict[str, Any]):
+        """Apply an unsubscribe message"""
+        topics = list(data.get("subscriptions", [])) + list(data.get("topics", []))
+        if topics:
+            self.topics = (self.topics if self.topics is not None else set(TOPICS)) - set(topics)
+        if data.get("sensor_ids") and self.sensor_ids is not None:
+            self.sensor_ids -= set(data["sensor_ids"])
+        if data.get("measurement_types") and self.measurement_types is not None:
+            self.measurement_types -= set(data["measurement_types"])
+        if data.get("chainage_window"):
+            self.chainage_window = None
+        if data.get("rate"):
+            self.rate = None
+    
+    def matches(self, topic: str, sensor_id: Optional[str] = None,
+                measurement_type: Optional[str] = None) -> bool:
+        """Check whether a topic passes the topic, sensor and type filters"""
+        if self.topics is not None and topic not in self.topics:
+            return False
+        if sensor_id is not None and self.sensor_ids is not None and sensor_id not in self.sensor_ids:
+            return False
+        if (measurement_type is not None and self.measurement_types is not None
+                and measurement_type not in self.measurement_types):
+            return False
+        return True
+    
+    def window_overlap(self, chainage_range: Optional[Tuple[float, float]]) -> str:
+        """Get "all", "partial" or "none" for how a chainage range fits the window"""
+        if self.chainage_window is None or chainage_range is None:
+            return "all"
+        low, high = self.chainage_window
+        if chainage_range[0] >= low and chainage_range[1] <= high:
+            return "all"
+        if chainage_range[1] < low or chainage_range[0] > high:
+            return "none"
+        return "partial"
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "topics": sorted(self.topics) if self.topics is not None else None,
+            "sensor_ids": sorted(self.sensor_ids) if self.sensor_ids is not None else None,
+            "measurement_types": sorted(self.measurement_types) if self.measurement_types is not None else None,
+            "chainage_window": list(self.chainage_window) if self.chainage_window else None,
+            "rate": self.rate
+        }
+
+class ClientConnection:
+    """Outbound queue and writer task of one WebSocket client.
+    
+    Broadcasts only enqueue; the writer task drains the queue, so a slow
+    socket never delays other clients or the producer. When the queue is
+    full the slow-consumer policy decides what happens:
+    
+    - drop_oldest: discard the oldest queued message
+    - coalesce: replace the queued message of the same topic, falling back
+      to drop_oldest
+    - disconnect: close the connection
+    
+    Messages queued as not droppable, such as backfill chunks, are never
+    discarded. Their producer paces itself on the queue depth instead, so
+    they overshoot the queue size by at most a few entries.
+    """
+    
+    def __init__(self, websocket: WebSocket, client_id: str, encoding: str = "json",
+                 queue_size: int = settings.websocket_send_queue_size,
+                 policy: str = settings.websocket_slow_client_policy):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.connected_at = datetime.now(timezone.utc)
+        self.last_ping = datetime.now(timezone.utc)
+        # Last time anything was received from the client
+        self.last_seen = datetime.now(timezone.utc)
+        self.subscription = Subscription()
+        # "json" or "columnar", negotiated by WebSocket subprotocol
+        self.encoding = encoding
+        self.queue_size = queue_size
+        self.policy = policy
+        # (topic, payload, event id, perf_counter at enqueue, epoch seconds
+        # of the newest sample carried, droppable) waiting for the writer
+        self.queue: Deque[Tuple[Optional[str], Union[str, bytes], Optional[str], float, Optional[float], bool]] = deque()
+        self.ready = asyncio.Event()
+        # Set by the writer after each send, for producers pacing themselves
+        self.sent = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self.evicted = False
+        self.closed = False
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.messages_received = 0
+        self.bytes_sent = 0
+        self.peak_queue_depth = 0
+        # request_id -> running backfill task
+        self.backfills: Dict[str, asyncio.Task] = {}
+    
+    def enqueue(self, payload: Union[str, bytes], topic: Optional[str] = None,
+                event_id: Optional[str] = None, origin: Optional[float] = None,
+                droppable: bool = True) -> bool:
+        """Queue a serialized message, applying the slow-consumer policy"""
+        if self.closed or self.evicted:
+            return False
+        
+        if len(self.queue) >= self.queue_size and droppable:
+            if self.policy == "disconnect":
+                self.evicted = True
+                self.ready.set()
+                return False
+            
+            if self.policy == "coalesce" and topic is not None:
+                for index, item in enumerate(self.queue):
+                    if item[0] == topic:
+                        self.queue[index] = (topic, payload, event_id, time.perf_counter(), origin, True)
+                        self.messages_dropped += 1
+                        return True
+            
+            # Drop the oldest droppable message, or this one if there is none
+            self.messages_dropped += 1
+            for index, item in enumerate(self.queue):
+                if item[5]:
+                    del self.queue[index]
+                    break
+            else:
+                return False
+        
+        self.queue.append((topic, payload, event_id, time.perf_counter(), origin, droppable))
+        self.peak_queue_depth = max(self.peak_queue_depth, len(self.queue))
+        self.ready.set()
+        return True
+    
+    async def run(self, on_close: Callable[[WebSocket], None]):
+        """Writer task: send queued messages until the connection ends"""
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.queue and not self.evicted:
+                    _, payload, event_id, enqueued_at, origin, _ = self.queue.popleft()
+                    await self.send(payload, event_id)
+                    latency_tracker.record("socket_write", time.perf_counter() - enqueued_at)
+                    if origin is not None:
+                        latency_tracker.record("end_to_end", time.time() - origin)
+                    self.messages_sent += 1
+                    self.bytes_sent += len(payload)
+                    self.sent.set()
+                if self.evicted:
+                    print(f"🐢 Disconnecting slow client: {self.client_id}")
+                    await self.close_transport(1013)
+                    break
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"❌ Error sending to client {self.client_id}: {e}")
+        finally:
+            on_close(self.websocket)
+    
+    async def send(self, payload: Union[str, bytes], event_id: Optional[str] = None):
+        """Write one payload to the socket"""
+        if isinstance(payload, bytes):
+            await self.websocket.send_bytes(payload)
+        else:
+            await self.websocket.send_text(payload)
+    
+    async def close_transport(self, code: int):
+        await self.websocket.close(code=code)
+    
+    async def wait_for_queue(self, depth: int):
+        """Wait until at most depth messages are queued"""
+        while len(self.queue) > depth and not self.closed:
+            self.sent.clear()
+            await self.sent.wait()
+    
+    def close(self):
+        """Stop the writer and backfill tasks"""
+        self.closed = True
+        for task in list(self.backfills.values()):
+            task.cancel()
+        if self.writer is not None and self.writer is not asyncio.current_task():
+            self.writer.cancel()
+
+class SSEConnection(ClientConnection):
+    """Server-Sent Events client sharing the WebSocket queue and fan-out.
+    
+    The writer task hands formatted events to a one-slot stream the HTTP
+    response reads from, so a stalled reader backs up into the send queue
+    and the slow-consumer policy applies as for WebSockets.
+    """
+    
+    def __init__(self, client_id: str,
+                 queue_size: int = settings.websocket_send_queue_size,
+                 policy: str = settings.websocket_slow_client_policy):
+        super().__init__(None, client_id, "json", queue_size, policy)
+        # The connection is its own key in the manager
+        self.websocket = self
+        self.stream: asyncio.Queue = asyncio.Queue(maxsize=1)
+    
+    async def send(self, payload: Union[str, bytes], event_id: Optional[str] = None):
+        if event_id is not None:
+            await self.stream.put(f"id: {event_id}\ndata: {payload}\n\n")
+        else:
+            await self.stream.put(f"data: {payload}\n\n")
+        # SSE clients cannot reply, a consumed event shows they are alive
+        self.last_seen = datetime.now(timezone.utc)
+    
+    async def close_transport(self, code: int):
+        while not self.stream.empty():
+            self.stream.get_nowait()
+        self.stream.put_nowait(None)
+    
+    async def events(self):
+        """Yield formatted events until the connection is closed"""
+        try:
+            while True:
+                event = await self.stream.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            manager.disconnect(self)
+
+class PublishedEvent:
+    """A published topic message, kept for SSE resumption"""
+    
+    __slots__ = (
+        "event_id", "sequence", "message", "topic", "sensor_id",
+        "measurement_type", "rate", "origin", "samples", "chainage_range"
+    )
+    
+    def __init__(self, event_id: str, sequence: int, message: Dict[str, Any], topic: str,
+                 sensor_id: Optional[str], measurement_type: Optional[str],
+                 rate: Optional[float], origin: Optional[float] = None):
+        self.event_id = event_id
+        # Epoch seconds of the newest measurement, for end-to-end latency
+        self.origin = origin
+        self.sequence = sequence
+        self.message = message
+        self.topic = topic
+        self.sensor_id = sensor_id
+        self.measurement_type = measurement_type
+        self.rate = rate
+        self.samples = message.get("data") if isinstance(message.get("data"), list) else None
+        self.chainage_range = None
+        if self.samples:
+            chainages = [sample["chainage"] for sample in self.samples]
+            self.chainage_range = (min(chainages), max(chainages))
+        elif isinstance(message.get("data"), dict) and "chainage" in message["data"]:
+            chainage = message["data"]["chainage"]
+            self.chainage_range = (chainage, message["data"].get("end_chainage") or chainage)
+
 class ConnectionManager:
     """Manages WebSocket connections for real-time data broadcasting"""
     
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.connection_metadata: Dict[WebSocket, Dict[str, Any]] = {}
-    
-    async def connect(self, websocket: WebSocket, client_id: str = None):
-        """Accept a new WebSocket connection"""
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        
-        # Store connection metadata
-        self.connection_metadata[websocket] = {
-            "client_id": client_id or f"client_{len(self.active_connections)}",
-            "connected_at": datetime.now(timezone.utc),
-            "last_ping": datetime.now(timezone.utc),
-            "subscriptions": set()
-        }
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.client_counter = 0
+        self.connections_rejected = 0
+        self.connections_evicted = 0
+        # Frame rate -> aggregator and flush task for decimated clients
+        self.frame_aggregators: Dict[float, FrameAggregator] = {}
+        self.frame_tasks: Dict[float, asyncio.Task] = {}
+        # Recent samples per topic, sent to clients when they subscribe
+        self.replay = ReplayBuffer()
+        # Pub/sub shared with the other workers, None delivers locally only
+        self.backplane = None
+        # Recently published events for SSE Last-Event-ID resumption. Ids
+        # carry a per-process prefix, another worker's ids are not resumable
+        self.instance_id = uuid.uuid4().hex[:8]
+        self.event_sequence = 0
+        self.event_log: Deque[PublishedEvent] = deque(maxlen=settings.sse_replay_size)
+    
+    async def start_backplane(self, backplane=None):
+        """Subscribe this worker to the backplane, Redis when configured"""
+        backplane = backplane or create_backplane()
+        try:
+            await backplane.start(self.dispatch)
+        except Exception as e:
+            print(f"❌ Error connecting realtime backplane, using local delivery: {e}")
+            backplane = LocalBackplane()
+            await backplane.start(self.dispatch)
+        self.backplane = backplane
+        print(f"✅ Realtime backplane started: {type(backplane).__name__}")
+    
+    async def stop_backplane(self):
+        """Unsubscribe this worker from the backplane"""
+        if self.backplane is not None:
+            await self.backplane.stop()
+            self.backplane = None
+    
+    async def distribute(self, envelope: Dict[str, Any]):
+        """Send a broadcast to every worker through the backplane"""
+        if self.backplane is None:
+            await self.dispatch(envelope)
+        else:
+            await self.backplane.publish(envelope)
+    
+    async def dispatch(self, envelope: Dict[str, Any]):
+        """Fan a backplane broadcast out to this worker's clients"""
+        kind = envelope["kind"]
+        if kind == "sensor_data":
+            await self.fan_out_sensor_data(envelope["samples"], envelope.get("trace"))
+        elif kind == "message":
+            await self.publish(envelope["message"])
+        elif kind == "broadcast":
+            await self.fan_out(envelope["message"])
+        elif kind == "chainage_index":
+            # The publishing worker applied the change before sending it
+            if envelope["origin"] != self.instance_id:
+                from app.chainage_index import chainage_indexes
+                await asyncio.to_thread(
+                    chainage_indexes[envelope["index"]].apply, envelope["added"], envelope["removed"]
+                )
+        elif kind == "chainage_index_reload":
+            if envelope["origin"] != self.instance_id:
+                from app.chainage_index import load_chainage_indexes
+                await asyncio.to_thread(load_chainage_indexes)
+    
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.connections)
+    
+    def at_capacity(self) -> bool:
+        """Check the connection limit, counting a rejection when reached"""
+        if len(self.connections) >= settings.max_websocket_connections:
+            self.connections_rejected += 1
+            print(f"⛔ Realtime connection rejected, limit of {settings.max_websocket_connections} reached")
+            return True
+        return False
+    
+    async def connect(self, websocket: WebSocket, client_id: str = None) -> bool:
+        """Accept a new WebSocket connection, False if the limit is reached"""
+        if self.at_capacity():
+            await websocket.close(code=1013)
+            return False
+        
+        # Binary sensor frames are opt-in through the subprotocol
+        if COLUMNAR_SUBPROTOCOL in websocket.scope.get("subprotocols", []):
+            await websocket.accept(subprotocol=COLUMNAR_SUBPROTOCOL)
+            encoding = "columnar"
+        else:
+            await websocket.accept()
+            encoding = "json"
+        self.client_counter += 1
         
-        print(f"🔌 WebSocket client connected: {self.connection_metadata[websocket]['client_id']}")
+        connection = ClientConnection(
+            websocket, client_id or f"client_{self.client_counter}", encoding
+        )
+        self.connections[websocket] = connection
+        connection.writer = asyncio.create_task(connection.run(self.disconnect))
+        
+        print(f"🔌 WebSocket client connected: {connection.client_id}")
         
         # Send welcome message
         await self.send_personal_message({
             "type": "connection_established",
-            "client_id": self.connection_metadata[websocket]['client_id'],
+            "client_id": connection.client_id,
+            "encoding": encoding,
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "message": "Connected to ITMS real-time data stream"
         }, websocket)
+        return True
+    
+    def connect_sse(self, data: Dict[str, Any], last_event_id: Optional[str] = None,
+                    snapshot: bool = True) -> Optional[SSEConnection]:
+        """Register an SSE client, None if the limit is reached.
+        
+        Events published after last_event_id are replayed from the event log
+        when it still holds them; otherwise the client gets a snapshot.
+        """
+        if self.at_capacity():
+            return None
+        
+        self.client_counter += 1
+        connection = SSEConnection(f"sse_{self.client_counter}")
+        connection.subscription.update(data)
+        self.connections[connection] = connection
+        connection.writer = asyncio.create_task(connection.run(self.disconnect))
+        self.update_frame_rates()
+        
+        print(f"🔌 SSE client connected: {connection.client_id}")
+        connection.enqueue(json.dumps({
+            "type": "connection_established",
+            "client_id": connection.client_id,
+            "subscription": connection.subscription.to_dict(),
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }))
+        
+        missed = self.events_since(last_event_id)
+        if missed is not None:
+            payloads: Dict[Any, Union[str, bytes]] = {}
+            for event in missed:
+                self.deliver(connection, event, payloads)
+        elif snapshot:
+            self.send_snapshot(connection)
+        return connection
+    
+    def events_since(self, last_event_id: Optional[str]) -> Optional[List[PublishedEvent]]:
+        """Get logged events after an event id, None if it cannot be resumed"""
+        if not last_event_id or not self.event_log:
+            return None
+        instance_id, _, sequence = last_event_id.partition("-")
+        if instance_id != self.instance_id or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        if sequence < self.event_log[0].sequence - 1:
+            return None
+        return [event for event in self.event_log if event.sequence > sequence]
     
     def disconnect(self, websocket: WebSocket):
         """Remove a WebSocket connection"""
-        if websocket in self.active_connections:
-            client_id = self.connection_metadata.get(websocket, {}).get('client_id', 'unknown')
-            self.active_connections.remove(websocket)
-            if websocket in self.connection_metadata:
-                del self.connection_metadata[websocket]
-            print(f"🔌 WebSocket client disconnected: {client_id}")
+        connection = self.connections.pop(websocket, None)
+        if connection is not None:
+            connection.close()
+            self.update_frame_rates()
+            kind = "SSE" if isinstance(connection, SSEConnection) else "WebSocket"
+            print(f"🔌 {kind} client disconnected: {connection.client_id}")
     
     async def send_personal_message(self, message: Dict[str, Any], websocket: WebSocket):
         """Send a message to a specific WebSocket connection"""
-        try:
-            await websocket.send_text(json.dumps(message))
-        except Exception as e:
-            print(f"❌ Error sending personal message: {e}")
-            self.disconnect(websocket)
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.enqueue(json.dumps(message))
     
     async def broadcast(self, message: str):
-        """Broadcast a message to all connected clients"""
-        if not self.active_connections:
-            return
-        
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                print(f"❌ Error broadcasting to client: {e}")
-                disconnected.append(connection)
-        
-        # Remove disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection)
+        """Broadcast a message to all connected clients of every worker"""
+        await self.distribute({"kind": "broadcast", "message": message})
+    
+    async def fan_out(self, message: str):
+        """Send a message to all clients connected to this worker"""
+        for connection in list(self.connections.values()):
+            connection.enqueue(message)
     
     async def broadcast_json(self, message: Dict[str, Any]):
         """Broadcast a JSON message to all connected clients"""
         await self.broadcast(json.dumps(message))
     
-    async def broadcast_sensor_data(self, sensor_data: Dict[str, Any]):
-        """Broadcast sensor data to subscribed clients"""
-        message = {
-            "type": "sensor_data",
-            "data": sensor_data,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        await self.broadcast_json(message)
+    async def publish(self, message: Dict[str, Any], sensor_id: Optional[str] = None,
+                      measurement_type: Optional[str] = None, topic: Optional[str] = None,
+                      rate: Optional[float] = None, origin: Optional[float] = None):
+        """Send a topic message to the clients whose subscription matches it.
+        
+        The message is serialized once per client encoding and the same
+        payload goes to every matching client. Messages carrying a "data"
+        list of samples are trimmed per client chainage window; each
+        distinct window is serialized once. Sensor data only goes to
+        clients whose frame rate equals rate, None meaning the raw stream.
+        """
+        self.event_sequence += 1
+        event = PublishedEvent(
+            f"{self.instance_id}-{self.event_sequence}", self.event_sequence, message,
+            topic or message["type"], sensor_id, measurement_type, rate, origin
+        )
+        self.event_log.append(event)
+        
+        payloads: Dict[Any, Union[str, bytes]] = {}
+        for connection in list(self.connections.values()):
+            self.deliver(connection, event, payloads)
+    
+    def deliver(self, connection: ClientConnection, event: PublishedEvent,
+                payloads: Dict[Any, Union[str, bytes]]):
+        """Queue an event for one client if its subscription matches.
+        
+        payloads caches serialized messages by encoding and chainage window
+        across the clients of one publish call.
+        """
+        subscription = connection.subscription
+        if not subscription.matches(event.topic, event.sensor_id, event.measurement_type):
+            return
+        if event.topic == "sensor_data" and subscription.rate != event.rate:
+            return
+        
+        overlap = subscription.window_overlap(event.chainage_range)
+        if overlap == "none":
+            return
+        if overlap == "all" or event.samples is None:
+            key = (connection.encoding, None)
+            if key not in payloads:
+                payloads[key] = encode_message(event.message, connection.encoding)
+        else:
+            key = (connection.encoding, subscription.chainage_window)
+            if key not in payloads:
+                low, high = subscription.chainage_window
+                payloads[key] = encode_message({
+                    **event.message,
+                    "data": [s for s in event.samples if low <= s["chainage"] <= high]
+                }, connection.encoding)
+        
+        connection.enqueue(
+            payloads[key], f"{event.topic}:{event.sensor_id}:{event.measurement_type}",
+            event.event_id, event.origin
+        )
+
+    async def broadcast_sensor_data(self, sensor_data: Any, received_at: Optional[float] = None,
+                                    committed_at: Optional[float] = None):
+        """Broadcast one sample or a list of samples to subscribed clients.
+        
+        Samples are grouped into one message per (sensor_id, type) topic.
+        received_at and committed_at are the epoch seconds at which the
+        ingest request arrived and its transaction committed; when given
+        they feed the latency histograms.
+        """
+        samples = sensor_data if isinstance(sensor_data, list) else [sensor_data]
+        trace = None
+        if received_at is not None and committed_at is not None:
+            trace = {"received_at": received_at, "committed_at": committed_at}
+            latency_tracker.record("commit", committed_at - received_at)
+        await self.distribute({"kind": "sensor_data", "samples": samples, "trace": trace})
+    
+    async def fan_out_sensor_data(self, samples: List[Dict[str, Any]],
+                                  trace: Optional[Dict[str, float]] = None):
+        """Publish samples to this worker's raw and decimated subscribers"""
+        topics: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for sample in samples:
+            measurement_type = getattr(sample["type"], "value", sample["type"])
+            topics.setdefault((sample["sensor_id"], measurement_type), []).append(sample)
+        
+        timestamp = datetime.now(timezone.utc).isoformat()
+        for (sensor_id, measurement_type), topic_samples in topics.items():
+            timestamps = np.fromiter(
+                (to_epoch_micros(s.get("timestamp")) for s in topic_samples),
+                dtype=np.int64, count=len(topic_samples)
+            )
+            self.replay.add(sensor_id, measurement_type, topic_samples, timestamps)
+            for aggregator in self.frame_aggregators.values():
+                aggregator.add(sensor_id, measurement_type, topic_samples)
+            
+            message = {
+                "type": "sensor_data",
+                "sensor_id": sensor_id,
+                "measurement_type": measurement_type,
+                "data": topic_samples,
+                "timestamp": timestamp
+            }
+            origin = None
+            if trace is not None:
+                origin = int(timestamps.max()) / 1_000_000
+                ingest = trace["received_at"] - origin
+                commit = trace["committed_at"] - trace["received_at"]
+                fanout = time.time() - trace["committed_at"]
+                latency_tracker.record("ingest", ingest)
+                latency_tracker.record("fanout", fanout)
+                if settings.realtime_echo_latency:
+                    message["latency"] = {
+                        "ingest_ms": round(ingest * 1000, 3),
+                        "commit_ms": round(commit * 1000, 3),
+                        "fanout_ms": round(fanout * 1000, 3)
+                    }
+            await self.publish(message, sensor_id, measurement_type, origin=origin)
+    
+    def send_snapshot(self, connection: ClientConnection):
+        """Queue the buffered recent samples of every topic a client subscribes to"""
+        subscription = connection.subscription
+        timestamp = datetime.now(timezone.utc).isoformat()
+        for sensor_id, measurement_type in list(self.replay.buffers):
+            if not subscription.matches("sensor_data", sensor_id, measurement_type):
+                continue
+            columns = self.replay.snapshot(sensor_id, measurement_type, subscription.chainage_window)
+            if columns is None:
+                continue
+            connection.enqueue(encode_message({
+                "type": "sensor_snapshot",
+                "sensor_id": sensor_id,
+                "measurement_type": measurement_type,
+                "data": columns,
+                "timestamp": timestamp
+            }, connection.encoding))
+    
+    def start_backfill(self, connection: ClientConnection, data: Dict[str, Any]):
+        """Validate a backfill message and start streaming it"""
+        request = BackfillRequest(data)
+        if request.request_id in connection.backfills:
+            raise ValueError(f"backfill {request.request_id} is already running")
+        if len(connection.backfills) >= settings.backfill_max_concurrent:
+            raise ValueError(f"at most {settings.backfill_max_concurrent} backfills may run at once")
+        connection.backfills[request.request_id] = asyncio.create_task(
+            self.run_backfill(connection, request)
+        )
+    
+    async def run_backfill(self, connection: ClientConnection, request: BackfillRequest):
+        """Stream a backfill range in chunks, interleaved with live data.
+        
+        Each chunk is read after the previous one has mostly left the send
+        queue, so live messages never wait behind more than PIPELINE_DEPTH
+        chunks and a cancelled backfill stops reading immediately.
+        """
+        cursor = None
+        sequence = 0
+        total = 0
+        try:
+            while True:
+                rows = await asyncio.to_thread(fetch_backfill_chunk, request, cursor)
+                if rows:
+                    await connection.wait_for_queue(PIPELINE_DEPTH)
+                    # Never dropped for live data, the cursor moves past these rows
+                    if not connection.enqueue(json.dumps({
+                        "type": "backfill_data",
+                        "request_id": request.request_id,
+                        "sequence": sequence,
+                        "data": rows_to_columns(rows),
+                        "timestamp": datetime.now(timezone.utc).isoformat()
+                    }), droppable=False):
+                        break
+                    sequence += 1
+                    total += len(rows)
+                
+                if len(rows) < request.chunk_size:
+                    connection.enqueue(json.dumps({
+                        "type": "backfill_complete",
+                        "request_id": request.request_id,
+                        "chunks": sequence,
+                        "rows": total,
+                        "timestamp": datetime.now(timezone.utc).isoformat()
+                    }), droppable=False)
+                    break
+                
+                last = rows[-1]
+                cursor = (getattr(last, request.order_by), last.id)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"❌ Error in backfill {request.request_id} for {connection.client_id}: {e}")
+            connection.enqueue(json.dumps({
+                "type": "error",
+                "request_id": request.request_id,
+                "message": f"Backfill failed: {str(e)}",
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }), droppable=False)
+        finally:
+            connection.backfills.pop(request.request_id, None)
+    
+    def update_frame_rates(self):
+        """Start or stop frame streams to match the rates clients requested"""
+        rates = {
+            connection.subscription.rate for connection in self.connections.values()
+        } - {None}
+        for rate in rates - set(self.frame_tasks):
+            self.frame_aggregators[rate] = FrameAggregator(rate)
+            self.frame_tasks[rate] = asyncio.create_task(self.stream_frames(rate))
+        for rate in set(self.frame_tasks) - rates:
+            self.frame_tasks.pop(rate).cancel()
+            del self.frame_aggregators[rate]
+    
+    async def stream_frames(self, rate: float):
+        """Publish one frame per active topic every 1 / rate seconds"""
+        aggregator = self.frame_aggregators[rate]
+        while True:
+            await asyncio.sleep(1 / rate)
+            try:
+                for frame in aggregator.drain():
+                    await self.publish(
+                        frame, frame["sensor_id"], frame["measurement_type"],
+                        topic="sensor_data", rate=rate
+                    )
+            except Exception as e:
+                print(f"❌ Error streaming {rate} Hz frames: {e}")
     
     async def broadcast_defect_alert(self, defect_data: Dict[str, Any]):
-        """Broadcast defect alert to all clients"""
+        """Broadcast defect alert to subscribed clients"""
         message = {
             "type": "defect_alert",
             "data": defect_data,
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "priority": "high"
         }
-        await self.broadcast_json(message)
+        await self.distribute({"kind": "message", "message": message})
     
     async def broadcast_system_status(self, status: Dict[str, Any]):
         """Broadcast system status update"""
@@ -103,48 +725,79 @@ class ConnectionManager:
             "data": status,
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
-        await self.broadcast_json(message)
+        await self.distribute({"kind": "message", "message": message})
     
     def get_connection_count(self) -> int:
         """Get the number of active connections"""
-        return len(self.active_connections)
+        return len(self.connections)
     
     def get_connection_info(self) -> List[Dict[str, Any]]:
         """Get information about all active connections"""
         info = []
-        for websocket, metadata in self.connection_metadata.items():
+        for connection in self.connections.values():
             info.append({
-                "client_id": metadata["client_id"],
-                "connected_at": metadata["connected_at"].isoformat(),
-                "last_ping": metadata["last_ping"].isoformat(),
-                "subscriptions": list(metadata["subscriptions"])
+                "client_id": connection.client_id,
+                "connected_at": connection.connected_at.isoformat(),
+                "last_ping": connection.last_ping.isoformat(),
+                "subscription": connection.subscription.to_dict(),
+                "last_seen": connection.last_seen.isoformat(),
+                "encoding": connection.encoding,
+                "queued_messages": len(connection.queue),
+                "peak_queue_depth": connection.peak_queue_depth,
+                "messages_sent": connection.messages_sent,
+                "messages_dropped": connection.messages_dropped,
+                "messages_received": connection.messages_received,
+                "bytes_sent": connection.bytes_sent
             })
         return info
     
+    def get_stats(self) -> Dict[str, Any]:
+        """Get connection counts and per-connection metrics"""
+        return {
+            "active_connections": len(self.connections),
+            "max_connections": settings.max_websocket_connections,
+            "total_connections": self.client_counter,
+            "rejected_connections": self.connections_rejected,
+            "evicted_connections": self.connections_evicted,
+            "connections": self.get_connection_info()
+        }
+    
+    async def evict_idle_clients(self, timeout: float) -> int:
+        """Disconnect clients silent for longer than timeout seconds"""
+        now = datetime.now(timezone.utc)
+        idle = [
+            websocket for websocket, connection in self.connections.items()
+            if (now - connection.last_seen).total_seconds() > timeout
+        ]
+        for websocket in idle:
+            connection = self.connections[websocket]
+            print(f"💤 Evicting unresponsive client: {connection.client_id}")
+            self.disconnect(websocket)
+            self.connections_evicted += 1
+            try:
+                # Closes a WebSocket or ends an SSE response alike
+                await asyncio.wait_for(connection.close_transport(1001), timeout=5)
+            except Exception:
+                pass
+        return len(idle)
+    
     async def ping_all_clients(self):
-        """Send ping to all clients to check connection health"""
-        ping_message = {
+        """Send ping to this worker's clients to check connection health"""
+        await self.fan_out(json.dumps({
             "type": "ping",
             "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(json.dumps(ping_message))
-                # Update last ping time
-                if connection in self.connection_metadata:
-                    self.connection_metadata[connection]["last_ping"] = datetime.now(timezone.utc)
-            except Exception as e:
-                print(f"❌ Ping failed for client: {e}")
-                disconnected.append(connection)
-        
-        # Remove disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection)
+        }))
+        now = datetime.now(timezone.utc)
+        for connection in self.connections.values():
+            connection.last_ping = now
     
     async def handle_client_message(self, websocket: WebSocket, message: str):
         """Handle incoming messages from clients"""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.last_seen = datetime.now(timezone.utc)
+            connection.messages_received += 1
+        
         try:
             data = json.loads(message)
             message_type = data.get("type")
@@ -156,25 +809,60 @@ class ConnectionManager:
                     "timestamp": datetime.now(timezone.utc).isoformat()
                 }, websocket)
             
+            elif message_type == "pong":
+                # Heartbeat reply, recorded above
+                pass
+            
             elif message_type == "subscribe":
                 # Handle subscription requests
-                subscriptions = data.get("subscriptions", [])
-                if websocket in self.connection_metadata:
-                    self.connection_metadata[websocket]["subscriptions"].update(subscriptions)
+                if websocket in self.connections:
+                    subscription = self.connections[websocket].subscription
+                    subscription.update(data)
+                    self.update_frame_rates()
                     await self.send_personal_message({
                         "type": "subscription_confirmed",
-                        "subscriptions": list(self.connection_metadata[websocket]["subscriptions"]),
+                        "subscription": subscription.to_dict(),
+                        "timestamp": datetime.now(timezone.utc).isoformat()
+                    }, websocket)
+                    # Recent history first, so charts fill before live data
+                    if data.get("snapshot", True):
+                        self.send_snapshot(self.connections[websocket])
+            
+            elif message_type == "backfill":
+                # Stream a stored range over this socket
+                if websocket in self.connections:
+                    try:
+                        self.start_backfill(self.connections[websocket], data)
+                    except (ValueError, TypeError) as e:
+                        await self.send_personal_message({
+                            "type": "error",
+                            "request_id": data.get("request_id"),
+                            "message": f"Invalid backfill request: {str(e)}",
+                            "timestamp": datetime.now(timezone.utc).isoformat()
+                        }, websocket)
+            
+            elif message_type == "backfill_cancel":
+                # Stop a running backfill
+                if websocket in self.connections:
+                    task = self.connections[websocket].backfills.get(str(data.get("request_id")))
+                    if task is not None:
+                        task.cancel()
+                    await self.send_personal_message({
+                        "type": "backfill_cancelled",
+                        "request_id": data.get("request_id"),
+                        "cancelled": task is not None,
                         "timestamp": datetime.now(timezone.utc).isoformat()
                     }, websocket)
             
             elif message_type == "unsubscribe":
                 # Handle unsubscription requests
-                subscriptions = data.get("subscriptions", [])
-                if websocket in self.connection_metadata:
-                    self.connection_metadata[websocket]["subscriptions"].difference_update(subscriptions)
+                if websocket in self.connections:
+                    subscription = self.connections[websocket].subscription
+                    subscription.remove(data)
+                    self.update_frame_rates()
                     await self.send_personal_message({
                         "type": "unsubscription_confirmed",
-                        "subscriptions": list(self.connection_metadata[websocket]["subscriptions"]),
+                        "subscription": subscription.to_dict(),
                         "timestamp": datetime.now(timezone.utc).isoformat()
                     }, websocket)
             
@@ -204,11 +892,16 @@ manager = ConnectionManager()
 
 # Background task for connection health monitoring
 async def monitor_connections():
-    """Background task to monitor WebSocket connections"""
+    """Background task to ping clients and evict unresponsive ones.
+    
+    Clients are expected to answer pings with a pong (any message counts);
+    a client silent for websocket_idle_timeout seconds is disconnected.
+    """
     while True:
         try:
+            await manager.evict_idle_clients(settings.websocket_idle_timeout)
             await manager.ping_all_clients()
-            await asyncio.sleep(30)  # Ping every 30 seconds
+            await asyncio.sleep(settings.websocket_heartbeat_interval)
         except Exception as e:
             print(f"❌ Error in connection monitoring: {e}")
             await asyncio.sleep(5)
@@ -0,0 +1,94 @@
+"""
+ITMS Real-time Replay
+Per-sensor ring buffers holding the most recent samples so clients joining
+mid-run can draw their charts without querying the database
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.encoding import to_epoch_micros
+
+class SensorRingBuffer:
+    """Fixed-size ring of (timestamp us, chainage, value) samples"""
+
+    def __init__(self, capacity: int = settings.replay_buffer_capacity):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.chainages = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        # Next write position and number of valid samples
+        self.head = 0
+        self.size = 0
+
+    def extend(self, timestamps: np.ndarray, chainages: np.ndarray, values: np.ndarray):
+        """Append samples, overwriting the oldest once full"""
+        if len(timestamps) > self.capacity:
+            timestamps = timestamps[-self.capacity:]
+            chainages = chainages[-self.capacity:]
+            values = values[-self.capacity:]
+
+        positions = (self.head + np.arange(len(timestamps))) % self.capacity
+        self.timestamps[positions] = timestamps
+        self.chainages[positions] = chainages
+        self.values[positions] = values
+        self.head = (self.head + len(timestamps)) % self.capacity
+        self.size = min(self.size + len(timestamps), self.capacity)
+
+    def snapshot(self, seconds: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get samples from the last seconds before the newest one, oldest first"""
+        order = (self.head - self.size + np.arange(self.size)) % self.capacity
+        timestamps = self.timestamps[order]
+        if self.size:
+            keep = timestamps >= timestamps[-1] - int(seconds * 1_000_000)
+            order = order[keep]
+            timestamps = timestamps[keep]
+        return timestamps, self.chainages[order], self.values[order]
+
+class ReplayBuffer:
+    """Ring buffers keyed by (sensor_id, measurement type)"""
+
+    def __init__(self, capacity: int = settings.replay_buffer_capacity,
+                 seconds: float = settings.replay_buffer_seconds):
+        self.capacity = capacity
+        self.seconds = seconds
+        self.buffers: Dict[Tuple[str, str], SensorRingBuffer] = {}
+
+    def add(self, sensor_id: str, measurement_type: str, samples: List[Dict[str, Any]],
+            timestamps: Optional[np.ndarray] = None):
+        """Record samples of one topic, with their timestamps in us if already parsed"""
+        buffer = self.buffers.get((sensor_id, measurement_type))
+        if buffer is None:
+            buffer = self.buffers[(sensor_id, measurement_type)] = SensorRingBuffer(self.capacity)
+        if timestamps is None:
+            timestamps = np.fromiter((to_epoch_micros(s.get("timestamp")) for s in samples),
+                                     dtype=np.int64, count=len(samples))
+        buffer.extend(
+            timestamps,
+            np.fromiter((s["chainage"] for s in samples), dtype=np.float64, count=len(samples)),
+            np.fromiter((s["value"] for s in samples), dtype=np.float64, count=len(samples))
+        )
+
+    def snapshot(
+        self, sensor_id: str, measurement_type: str,
+        chainage_window: Optional[Tuple[float, float]] = None
+    ) -> Optional[Dict[str, list]]:
+        """Get the recent samples of one topic as columns, None if empty"""
+        buffer = self.buffers.get((sensor_id, measurement_type))
+        if buffer is None or buffer.size == 0:
+            return None
+
+        timestamps, chainages, values = buffer.snapshot(self.seconds)
+        if chainage_window is not None:
+            inside = (chainages >= chainage_window[0]) & (chainages <= chainage_window[1])
+            timestamps, chainages, values = timestamps[inside], chainages[inside], values[inside]
+        if len(timestamps) == 0:
+            return None
+
+        return {
+            "timestamp_us": timestamps.tolist(),
+            "chainage": chainages.tolist(),
+            "value": values.tolist()
+        }
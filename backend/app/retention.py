@@ -0,0 +1,417 @@
+"""
+ITMS Retention
+Deletes expired video frames and segments together with their files, and
+reconciles the frame store with the database
+"""
+
+import os
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, union_all
+from sqlmodel import Session
+
+from app.config import settings
+from app.db import engine
+from app.frame_store import frame_store
+from app.models import FrameBlob, VideoFrame, VideoSegment
+from app.thumbnails import IMAGE_SIZES, derived_path
+
+# Suffixes of smaller copies rendered next to an original image
+DERIVED_SUFFIXES = tuple(f".{size}.jpg" for size in IMAGE_SIZES)
+
+# Directory frames were saved to before the frame store, as in routers/video.py
+VIDEO_STORAGE_PATH = os.getenv("VIDEO_STORAGE_PATH", "./storage/videos")
+
+def with_derived(path: str) -> List[str]:
+    """Get a file and the paths of its derived sizes"""
+    return [path] + [derived_path(path, name) for name in IMAGE_SIZES]
+
+def reclaimable_size(path: str) -> int:
+    """Get the bytes unlink_file would free for a file and its derived sizes"""
+    size = 0
+    for candidate in with_derived(path):
+        try:
+            size += os.stat(candidate).st_size
+        except OSError:
+            continue
+    return size
+
+def unlink_file(path: str) -> Tuple[int, int]:
+    """Remove a file and its derived sizes, returning (files, bytes) removed"""
+    files = 0
+    size = 0
+    for candidate in with_derived(path):
+        try:
+            candidate_size = os.stat(candidate).st_size
+            os.remove(candidate)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            print(f"Warning: Could not delete file {candidate}: {e}")
+            continue
+        files += 1
+        size += candidate_size
+    return files, size
+
+class FileReaper:
+    """Unlinks files on a thread pool while the caller moves on to the next batch"""
+
+    def __init__(self, workers: int = settings.cleanup_unlink_workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="itms-unlink")
+        self.futures: List[Future] = []
+
+    def submit(self, paths: Iterable[str]):
+        self.futures.extend(self.executor.submit(unlink_file, path) for path in paths)
+
+    def run(self, paths: Iterable[str]):
+        """Unlink files on the pool and wait until they are gone"""
+        futures = [self.executor.submit(unlink_file, path) for path in paths]
+        self.futures.extend(futures)
+        wait(futures)
+
+    def wait(self) -> Tuple[int, int]:
+        """Wait for every unlink and return the total (files, bytes) removed"""
+        files = 0
+        size = 0
+        for future in self.futures:
+            removed_files, removed_size = future.result()
+            files += removed_files
+            size += removed_size
+        self.executor.shutdown()
+        return files, size
+
+def unlink_files(paths: Iterable[str]) -> Tuple[int, int]:
+    """Remove files concurrently, returning (files, bytes) removed"""
+    reaper = FileReaper()
+    reaper.submit(paths)
+    return reaper.wait()
+
+def release_stored_files(session: Session, paths: List[str], reaper: FileReaper):
+    """Unlink released stored files that were not acquired again, then commit"""
+    with frame_store.claim_unreferenced(session, paths) as unreferenced:
+        reaper.run(unreferenced)
+
+def delete_frame_batch(session: Session, frames: List[Tuple[int, str, Optional[str]]],
+                       reaper: FileReaper):
+    """Delete (id, filepath, sha256) frame rows, commit and unlink their files.
+
+    Stored files are released in bulk and unlinked once no frame refers to
+    them. Files of frames stored before the frame store are handed to the
+    reaper directly.
+    """
+    paths = frame_store.release_many(
+        session, Counter(sha256 for _, _, sha256 in frames if sha256)
+    )
+    legacy_paths = [filepath for _, filepath, sha256 in frames if not sha256]
+    session.query(VideoFrame).filter(
+        VideoFrame.id.in_([frame_id for frame_id, _, _ in frames])
+    ).delete(synchronize_session=False)
+    session.commit()
+    reaper.submit(legacy_paths)
+    release_stored_files(session, paths, reaper)
+
+def delete_expired_video(cutoff: datetime, dry_run: bool = True,
+                         batch_size: int = settings.cleanup_batch_size) -> Dict[str, Any]:
+    """Delete frames and segments recorded before cutoff, and their files.
+
+    Rows are deleted in keyset batches of batch_size, each committed on its
+    own. The stored files a batch released are unlinked on a thread pool
+    before the next batch is read, and files from before the frame store
+    while it is.
+    """
+    started = time.perf_counter()
+    with Session(engine) as session:
+        expired_frames = session.query(VideoFrame).filter(
+            VideoFrame.timestamp < cutoff, VideoFrame.segment_id.is_(None)
+        )
+        # A segment expires with its newest frame
+        expired_segments = session.query(VideoSegment).filter(
+            VideoSegment.start_timestamp < cutoff,
+            VideoSegment.id.notin_(
+                session.query(VideoFrame.segment_id).filter(
+                    VideoFrame.segment_id.isnot(None), VideoFrame.timestamp >= cutoff
+                ).scalar_subquery()
+            )
+        )
+        if dry_run:
+            return {
+                "video_frames": expired_frames.count(),
+                "video_segments": expired_segments.count(),
+                "bytes_reclaimable": sum(
+                    reclaimable_size(path)
+                    for path in expired_file_paths(session, expired_frames, expired_segments)
+                )
+            }
+
+        reaper = FileReaper()
+        frames_deleted = 0
+        last_id = 0
+        while True:
+            frames = session.query(VideoFrame.id, VideoFrame.filepath, VideoFrame.sha256).filter(
+                VideoFrame.timestamp < cutoff,
+                VideoFrame.segment_id.is_(None),
+                VideoFrame.id > last_id
+            ).order_by(VideoFrame.id).limit(batch_size).all()
+            if not frames:
+                break
+            last_id = frames[-1][0]
+            delete_frame_batch(session, frames, reaper)
+            frames_deleted += len(frames)
+
+        segments_deleted = 0
+        for segment_id, sha256 in expired_segments.with_entities(
+            VideoSegment.id, VideoSegment.sha256
+        ).all():
+            frames_deleted += session.query(VideoFrame).filter(
+                VideoFrame.segment_id == segment_id
+            ).delete(synchronize_session=False)
+            session.query(VideoSegment).filter(VideoSegment.id == segment_id).delete(
+                synchronize_session=False
+            )
+            paths = frame_store.release_many(session, {sha256: 1})
+            session.commit()
+            release_stored_files(session, paths, reaper)
+            segments_deleted += 1
+
+    files_removed, bytes_reclaimed = reaper.wait()
+    return {
+        "video_frames": frames_deleted,
+        "video_segments": segments_deleted,
+        "files_removed": files_removed,
+        "bytes_reclaimed": bytes_reclaimed,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+def expired_file_paths(session: Session, expired_frames, expired_segments) -> Iterable[str]:
+    """Yield the files deleting the expired frames and segments would unlink.
+
+    Stored files count only if every reference to them expires, files of
+    frames from before the frame store always do.
+    """
+    references = union_all(
+        expired_frames.filter(VideoFrame.sha256.isnot(None)).with_entities(VideoFrame.sha256).statement,
+        expired_segments.with_entities(VideoSegment.sha256).statement
+    ).subquery()
+    expired_counts = session.query(
+        references.c.sha256, func.count().label("expired")
+    ).group_by(references.c.sha256).subquery()
+    for sha256, extension in session.query(FrameBlob.sha256, FrameBlob.extension).join(
+        expired_counts, expired_counts.c.sha256 == FrameBlob.sha256
+    ).filter(FrameBlob.refcount <= expired_counts.c.expired):
+        yield frame_store.object_path(sha256, extension)
+
+    for (filepath,) in expired_frames.filter(VideoFrame.sha256.is_(None)).with_entities(
+        VideoFrame.filepath
+    ):
+        yield filepath
+
+def scan_files(directory: str, older_than: float, skip: Optional[str] = None) -> Iterable[str]:
+    """Yield files under directory last modified before older_than"""
+    skip = os.path.abspath(skip) if skip is not None else None
+    for root, dirs, files in os.walk(directory):
+        if skip is not None:
+            dirs[:] = [name for name in dirs if os.path.abspath(os.path.join(root, name)) != skip]
+        for file in files:
+            path = os.path.join(root, file)
+            try:
+                if os.path.getmtime(path) < older_than:
+                    yield path
+            except FileNotFoundError:
+                continue
+
+def has_original(path: str) -> bool:
+    """Check whether the original of a derived image file still exists"""
+    directory, name = os.path.split(path)
+    original = name.rsplit(".", 2)[0] + "."
+    return any(
+        entry.startswith(original) and not entry.endswith(DERIVED_SUFFIXES)
+        for entry in os.listdir(directory)
+    )
+
+def find_orphaned_files(session: Session, older_than: float,
+                        batch_size: int = settings.cleanup_batch_size) -> Tuple[List[str], List[str]]:
+    """Get stored files that no blob or frame row refers to.
+
+    Returns content-addressed originals, which must be unlinked under
+    claim_unreferenced since an upload may acquire them again, and all
+    other orphaned files.
+    """
+    stored_orphans = []
+    orphans = []
+
+    # Content-addressed files without a blob row
+    originals: Dict[str, str] = {}
+    for path in scan_files(frame_store.root, older_than, skip=frame_store.tmp_dir):
+        if path.endswith(DERIVED_SUFFIXES):
+            if not has_original(path):
+                orphans.append(path)
+            continue
+        originals[os.path.splitext(os.path.basename(path))[0]] = path
+    hashes = list(originals)
+    for start in range(0, len(hashes), batch_size):
+        batch = hashes[start:start + batch_size]
+        known = {sha256 for (sha256,) in session.query(FrameBlob.sha256).filter(
+            FrameBlob.sha256.in_(batch)
+        )}
+        stored_orphans.extend(originals[sha256] for sha256 in batch if sha256 not in known)
+
+    # Frames saved before the frame store, directly under the video directory
+    legacy = []
+    for path in scan_files(VIDEO_STORAGE_PATH, older_than, skip=frame_store.root):
+        if not path.endswith(DERIVED_SUFFIXES):
+            legacy.append(path)
+        elif not has_original(path):
+            orphans.append(path)
+    for start in range(0, len(legacy), batch_size):
+        batch = legacy[start:start + batch_size]
+        known = {filepath for (filepath,) in session.query(VideoFrame.filepath).filter(
+            VideoFrame.filepath.in_(batch)
+        )}
+        orphans.extend(path for path in batch if path not in known)
+
+    return stored_orphans, orphans
+
+def repair_rows(session: Session, dry_run: bool, older_than: float) -> Dict[str, Any]:
+    """Fix rows pointing at missing files and blob refcounts that drifted.
+
+    Blob rows are committed before their file is moved into place and
+    references are counted before blobs are read, so only blobs created
+    before older_than are checked. Older blobs can still gain or lose
+    references while this runs, so their rows are locked and the
+    references counted again in the statement that fixes them.
+    """
+    # Count the references each blob really has
+    references: Counter = Counter(dict(
+        session.query(VideoFrame.sha256, func.count(VideoFrame.id))
+        .filter(VideoFrame.sha256.isnot(None)).group_by(VideoFrame.sha256).all()
+    ))
+    references.update(dict(
+        session.query(VideoSegment.sha256, func.count(VideoSegment.id))
+        .group_by(VideoSegment.sha256).all()
+    ))
+
+    missing_blobs: Set[str] = set()
+    drifted: Dict[str, int] = {}
+    unreferenced_paths = []
+    for sha256, extension, refcount in session.query(
+        FrameBlob.sha256, FrameBlob.extension, FrameBlob.refcount
+    ).filter(FrameBlob.created_at <= datetime.utcfromtimestamp(older_than)):
+        path = frame_store.object_path(sha256, extension)
+        if not os.path.exists(path):
+            missing_blobs.add(sha256)
+        elif references[sha256] == 0:
+            unreferenced_paths.append(path)
+        elif refcount != references[sha256]:
+            drifted[sha256] = references[sha256]
+
+    # Frames and segments whose file is gone cannot be shown or processed
+    missing_frames = [
+        frame_id for frame_id, filepath, sha256 in session.query(
+            VideoFrame.id, VideoFrame.filepath, VideoFrame.sha256
+        ).filter(VideoFrame.segment_id.is_(None))
+        if (sha256 in missing_blobs if sha256 else not os.path.exists(filepath))
+    ]
+    missing_segments = [
+        segment_id for segment_id, sha256 in session.query(VideoSegment.id, VideoSegment.sha256)
+        if sha256 in missing_blobs
+    ]
+    if not dry_run:
+        frame_references = session.query(func.count(VideoFrame.id)).filter(
+            VideoFrame.sha256 == FrameBlob.sha256
+        ).scalar_subquery()
+        segment_references = session.query(func.count(VideoSegment.id)).filter(
+            VideoSegment.sha256 == FrameBlob.sha256
+        ).scalar_subquery()
+        drifted_hashes = list(drifted)
+        for start in range(0, len(drifted_hashes), 500):
+            batch = drifted_hashes[start:start + 500]
+            lock_blobs(session, batch)
+            session.query(FrameBlob).filter(FrameBlob.sha256.in_(batch)).update(
+                {"refcount": frame_references + segment_references}, synchronize_session=False
+            )
+        # Blobs nothing refers to go now, their files once the rows are gone
+        unreferenced = [os.path.splitext(os.path.basename(path))[0] for path in unreferenced_paths]
+        for start in range(0, len(unreferenced), 500):
+            batch = unreferenced[start:start + 500]
+            lock_blobs(session, batch)
+            session.query(FrameBlob).filter(
+                FrameBlob.sha256.in_(batch),
+                ~session.query(VideoFrame.id).filter(VideoFrame.sha256 == FrameBlob.sha256).exists(),
+                ~session.query(VideoSegment.id).filter(VideoSegment.sha256 == FrameBlob.sha256).exists()
+            ).delete(synchronize_session=False)
+        for start in range(0, len(missing_frames), 500):
+            session.query(VideoFrame).filter(
+                VideoFrame.id.in_(missing_frames[start:start + 500])
+            ).delete(synchronize_session=False)
+        if missing_segments:
+            session.query(VideoFrame).filter(
+                VideoFrame.segment_id.in_(missing_segments)
+            ).delete(synchronize_session=False)
+            session.query(VideoSegment).filter(
+                VideoSegment.id.in_(missing_segments)
+            ).delete(synchronize_session=False)
+        missing = list(missing_blobs)
+        for start in range(0, len(missing), 500):
+            session.query(FrameBlob).filter(
+                FrameBlob.sha256.in_(missing[start:start + 500])
+            ).delete(synchronize_session=False)
+        session.commit()
+
+    return {
+        "frames_missing_files": len(missing_frames),
+        "segments_missing_files": len(missing_segments),
+        "blobs_missing_files": len(missing_blobs),
+        "refcounts_fixed": len(drifted),
+        "unreferenced_blobs": len(unreferenced_paths),
+        "unreferenced_paths": unreferenced_paths
+    }
+
+def lock_blobs(session: Session, hashes: List[str]):
+    """Lock blob rows until commit so acquires and releases wait.
+
+    A no-op on SQLite, where the first write of the transaction takes the
+    database lock instead.
+    """
+    session.query(FrameBlob.sha256).filter(FrameBlob.sha256.in_(hashes)).with_for_update().all()
+
+def reconcile_frame_store(dry_run: bool = True,
+                          grace_seconds: float = settings.orphan_grace_seconds) -> Dict[str, Any]:
+    """Bring files on disk and frame, segment and blob rows back in line.
+
+    Files and temporary uploads younger than grace_seconds are left alone,
+    since an upload may still be moving them into place.
+    """
+    started = time.perf_counter()
+    older_than = time.time() - grace_seconds
+    with Session(engine) as session:
+        rows = repair_rows(session, dry_run, older_than)
+        unreferenced_paths = rows.pop("unreferenced_paths")
+        stored_orphans, orphaned = find_orphaned_files(session, older_than)
+
+    temp_files = list(scan_files(frame_store.tmp_dir, older_than))
+    orphaned_bytes = sum(
+        reclaimable_size(path) for path in set(stored_orphans + orphaned + unreferenced_paths + temp_files)
+    )
+
+    result = {
+        **rows,
+        "orphaned_files": len(stored_orphans) + len(orphaned),
+        "stale_temp_files": len(temp_files),
+        "dry_run": dry_run
+    }
+    if dry_run:
+        result["bytes_reclaimable"] = orphaned_bytes
+    else:
+        reaper = FileReaper()
+        reaper.submit(orphaned + temp_files)
+        with Session(engine) as session:
+            release_stored_files(session, stored_orphans + unreferenced_paths, reaper)
+        files_removed, bytes_reclaimed = reaper.wait()
+        result["files_removed"] = files_removed
+        result["bytes_reclaimed"] = bytes_reclaimed
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
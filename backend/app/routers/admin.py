@@ -3,14 +3,21 @@ ITMS Admin API Router
 Handles administrative functions and system management
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
 import json
 
-from app.db import get_session
-from app.models import SystemConfig, DataSession, Measurement, DefectLog, VideoFrame
+from app.db import dialect_insert, get_session
+from app.config_cache import config_cache
+from app.chainage_index import reload_chainage_indexes
+from app.models import (
+    SystemConfig, DataSession, Measurement, DefectLog, VideoFrame, SessionComparison
+)
+from app.alignment import compare_sessions
+from app.degradation import delete_session_conditions, refresh_degradation
 
 router = APIRouter()
 
@@ -50,6 +57,7 @@ async def update_system_config(
     
     session.commit()
     session.refresh(config)
+    config_cache.invalidate()
     
     return {"message": f"Configuration {config_key} updated successfully"}
 
@@ -106,6 +114,59 @@ async def get_system_status(session: Session = Depends(get_session)):
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@router.get("/system/websocket")
+async def get_websocket_status():
+    """Get WebSocket connection counts and per-connection metrics"""
+    from app.realtime import manager
+    return manager.get_stats()
+
+@router.get("/system/latency")
+async def get_realtime_latency(
+    reset: bool = Query(False, description="Clear the histograms after reading them")
+):
+    """Get realtime pipeline latency percentiles per stage"""
+    from app.latency import latency_tracker
+    summary = latency_tracker.summary()
+    if reset:
+        latency_tracker.reset()
+    return summary
+
+@router.get("/system/video-decoder")
+async def get_video_decoder_stats():
+    """Get video segment decoder and decoded frame cache statistics"""
+    from app.video_segments import segment_decoder
+    return segment_decoder.get_stats()
+
+@router.get("/system/frame-processing")
+async def get_frame_processing_stats():
+    """Get background video frame analysis progress and throughput"""
+    from app.frame_processing import frame_processor
+    return await run_in_threadpool(frame_processor.get_stats)
+
+@router.post("/system/annotations/rebuild")
+async def rebuild_annotations(session: Session = Depends(get_session)):
+    """Rebuild the frame annotation table from the annotations JSON of every frame"""
+    from app.annotations import rebuild_frame_annotations
+    inserted = await run_in_threadpool(rebuild_frame_annotations, session)
+    return {"message": "Frame annotations rebuilt", "annotations": inserted}
+
+@router.post("/system/cleanup/reconcile")
+async def reconcile_frame_files(
+    dry_run: bool = Query(True, description="Only report what would be removed"),
+    grace_seconds: Optional[float] = Query(None, ge=0, description="Skip files modified more recently than this")
+):
+    """Remove stored files without rows and rows without files, and fix blob refcounts"""
+    from app.config import settings
+    from app.retention import reconcile_frame_store
+    
+    result = await run_in_threadpool(
+        reconcile_frame_store, dry_run,
+        grace_seconds if grace_seconds is not None else settings.orphan_grace_seconds
+    )
+    if not dry_run and (result["frames_missing_files"] or result["segments_missing_files"]):
+        await reload_chainage_indexes()
+    return result
+
 @router.post("/sessions")
 async def create_data_session(
     session_name: str,
@@ -151,6 +212,7 @@ async def get_data_sessions(
 @router.put("/sessions/{session_id}/end")
 async def end_data_session(
     session_id: int,
+    background_tasks: BackgroundTasks,
     end_chainage: Optional[float] = None,
     notes: Optional[str] = None,
     session: Session = Depends(get_session)
@@ -190,6 +252,9 @@ async def end_data_session(
     session.commit()
     session.refresh(data_session)
     
+    # Fold the new session into the degradation trends
+    background_tasks.add_task(refresh_degradation)
+    
     return {
         "message": "Data session ended successfully",
         "session_id": data_session.id,
@@ -210,6 +275,57 @@ async def get_data_session(
     
     return data_session
 
+@router.get("/sessions/{session_a_id}/compare/{session_b_id}")
+async def compare_data_sessions(
+    session_a_id: int,
+    session_b_id: int,
+    session: Session = Depends(get_session)
+):
+    """Align session B onto session A and return per-channel B - A differences"""
+    cached = session.query(SessionComparison).filter(
+        SessionComparison.session_a_id == session_a_id,
+        SessionComparison.session_b_id == session_b_id
+    ).first()
+    if cached:
+        return json.loads(cached.result)
+    
+    session_a = session.query(DataSession).filter(DataSession.id == session_a_id).first()
+    session_b = session.query(DataSession).filter(DataSession.id == session_b_id).first()
+    if not session_a or not session_b:
+        raise HTTPException(status_code=404, detail="Data session not found")
+    
+    try:
+        alignment = await run_in_threadpool(compare_sessions, session_a, session_b)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    result = {
+        "session_a": session_a_id,
+        "session_b": session_b_id,
+        **alignment,
+        "computed_at": datetime.utcnow().isoformat()
+    }
+    
+    # Only completed sessions are immutable enough to cache. Concurrent
+    # requests for the same pair overwrite one cached row.
+    if session_a.status == "completed" and session_b.status == "completed":
+        computed_at = datetime.utcnow()
+        insert = dialect_insert(session)
+        session.execute(
+            insert(SessionComparison.__table__)
+            .values(
+                session_a_id=session_a_id, session_b_id=session_b_id,
+                result=json.dumps(result), computed_at=computed_at
+            )
+            .on_conflict_do_update(
+                index_elements=["session_a_id", "session_b_id"],
+                set_={"result": json.dumps(result), "computed_at": computed_at}
+            )
+        )
+        session.commit()
+    
+    return result
+
 @router.delete("/sessions/{session_id}")
 async def delete_data_session(
     session_id: int,
@@ -221,6 +337,12 @@ async def delete_data_session(
     if not data_session:
         raise HTTPException(status_code=404, detail="Data session not found")
     
+    session.query(SessionComparison).filter(
+        (SessionComparison.session_a_id == session_id) |
+        (SessionComparison.session_b_id == session_id)
+    ).delete(synchronize_session=False)
+    # Trends of the session's segments are refitted without it
+    await run_in_threadpool(delete_session_conditions, session, session_id)
     session.delete(data_session)
     session.commit()
     
@@ -348,22 +470,21 @@ async def execute_cleanup(
         })
     
     if cleanup_video:
-        old_video_frames = session.query(VideoFrame).filter(
-            VideoFrame.timestamp < cutoff_date
-        )
-        
-        count = old_video_frames.count()
+        # Frames go in batches together with the files nothing else references
+        from app.retention import delete_expired_video
         
-        if not dry_run and count > 0:
-            old_video_frames.delete()
-            session.commit()
+        video = await run_in_threadpool(delete_expired_video, cutoff_date, dry_run)
         
         results["operations"].append({
             "type": "video_frames",
-            "records_affected": count,
-            "executed": not dry_run
+            "records_affected": video["video_frames"],
+            "executed": not dry_run,
+            **video
         })
     
+    if not dry_run and (cleanup_defects or cleanup_video):
+        await reload_chainage_indexes()
+    
     results["timestamp"] = datetime.utcnow().isoformat()
     
     return results
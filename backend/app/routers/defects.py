@@ -0,0 +1,163 @@
+"""
+ITMS Defects API Router
+Handles defect location lookups
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, func, or_
+from typing import Dict, List, Optional
+import numpy as np
+
+from app.db import get_session
+from app.models import (
+    DefectFrameMatch, DefectLog, DefectResponse, DefectWithFramesResponse, VideoFrame
+)
+from app.chainage_index import defect_index
+
+router = APIRouter()
+
+# End of the defect span, point defects end where they start
+defect_end = func.coalesce(DefectLog.end_chainage, DefectLog.chainage)
+
+# Chainage windows combined into one frame query
+WINDOWS_PER_QUERY = 100
+
+@router.get("/defects/chainage/{chainage}", response_model=List[DefectResponse])
+async def get_defects_at_chainage(
+    chainage: float,
+    tolerance: float = Query(5.0, description="Tolerance in meters"),
+    session: Session = Depends(get_session)
+):
+    """Get defects whose span lies within tolerance of a chainage"""
+    if not defect_index.complete:
+        return session.query(DefectLog).filter(
+            DefectLog.chainage <= chainage + tolerance,
+            defect_end >= chainage - tolerance
+        ).order_by(DefectLog.chainage).all()
+
+    defect_ids = defect_index.within(chainage, tolerance)
+    if not defect_ids:
+        return []
+
+    return session.query(DefectLog).filter(
+        DefectLog.id.in_(defect_ids)
+    ).order_by(DefectLog.chainage).all()
+
+def match_nearest_frames(
+    starts: np.ndarray, ends: np.ndarray, frame_chainages: np.ndarray
+) -> tuple:
+    """Get the index of the closest frame to each span and its distance.
+
+    frame_chainages must be sorted. The frame closest to a span's midpoint is
+    inside the span if any frame is, and otherwise the closest outside it, so
+    one searchsorted over all midpoints pairs every span.
+    """
+    midpoints = (starts + ends) / 2
+    right = np.clip(np.searchsorted(frame_chainages, midpoints), 1, len(frame_chainages) - 1)
+    left = right - 1
+    if len(frame_chainages) == 1:
+        right = left = np.zeros(len(midpoints), dtype=np.intp)
+    take_left = np.abs(midpoints - frame_chainages[left]) <= np.abs(frame_chainages[right] - midpoints)
+    nearest = np.where(take_left, left, right)
+    chainages = frame_chainages[nearest]
+    distances = np.maximum(np.maximum(starts - chainages, chainages - ends), 0.0)
+    return nearest, distances
+
+def merge_windows(starts: np.ndarray, ends: np.ndarray, reach: float) -> List[tuple]:
+    """Get the disjoint (low, high) chainage ranges within reach of any span"""
+    order = np.argsort(starts, kind="stable")
+    windows: List[list] = []
+    for low, high in zip((starts[order] - reach).tolist(), (ends[order] + reach).tolist()):
+        if windows and low <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], high)
+        else:
+            windows.append([low, high])
+    return [tuple(window) for window in windows]
+
+@router.get("/defects/with-frames", response_model=List[DefectWithFramesResponse])
+async def get_defects_with_frames(
+    start_chainage: float = Query(..., description="Start chainage in meters"),
+    end_chainage: float = Query(..., description="End chainage in meters"),
+    camera_id: Optional[str] = Query(None, description="Only match frames of this camera"),
+    max_distance: float = Query(50.0, ge=0, description="Largest defect to frame distance in meters"),
+    limit: int = Query(1000, ge=1, le=10000, description="Maximum number of defects to return"),
+    session: Session = Depends(get_session)
+):
+    """Get defects in a chainage range, each with the closest frame of every camera"""
+    if end_chainage < start_chainage:
+        raise HTTPException(status_code=400, detail="end_chainage must not be before start_chainage")
+
+    defects = session.query(DefectLog).filter(
+        DefectLog.chainage <= end_chainage,
+        defect_end >= start_chainage
+    ).order_by(DefectLog.chainage).limit(limit).all()
+    results = [DefectWithFramesResponse.from_orm(defect) for defect in defects]
+    if not defects:
+        return results
+
+    starts = np.array([defect.chainage for defect in defects], dtype=np.float64)
+    ends = np.array([
+        defect.end_chainage if defect.end_chainage is not None else defect.chainage
+        for defect in defects
+    ], dtype=np.float64)
+
+    # Only frames within max_distance of some defect, so defects far apart
+    # do not load every frame between them
+    windows = merge_windows(starts, ends, max_distance)
+    frames_by_camera: Dict[str, list] = {}
+    for offset in range(0, len(windows), WINDOWS_PER_QUERY):
+        query = session.query(
+            VideoFrame.camera_id, VideoFrame.chainage, VideoFrame.id, VideoFrame.timestamp
+        ).filter(or_(*(
+            and_(VideoFrame.chainage >= low, VideoFrame.chainage <= high)
+            for low, high in windows[offset:offset + WINDOWS_PER_QUERY]
+        )))
+        if camera_id is not None:
+            query = query.filter(VideoFrame.camera_id == camera_id)
+        for row in query:
+            frames_by_camera.setdefault(row.camera_id, []).append(row)
+
+    for camera, frames in frames_by_camera.items():
+        frames.sort(key=lambda frame: (frame.chainage, frame.id))
+        nearest, distances = match_nearest_frames(
+            starts, ends, np.array([frame.chainage for frame in frames], dtype=np.float64)
+        )
+        for result, index, distance in zip(results, nearest.tolist(), distances.tolist()):
+            if distance > max_distance:
+                continue
+            frame = frames[index]
+            result.frames.append(DefectFrameMatch(
+                video_frame_id=frame.id,
+                camera_id=camera,
+                chainage=frame.chainage,
+                timestamp=frame.timestamp,
+                distance=round(distance, 3)
+            ))
+
+    return results
+
+@router.get("/defects/nearest/{chainage}", response_model=List[DefectResponse])
+async def get_nearest_defects(
+    chainage: float,
+    k: int = Query(5, ge=1, le=100, description="Number of defects to return"),
+    session: Session = Depends(get_session)
+):
+    """Get the defects closest to a chainage, closest first"""
+    if not defect_index.complete:
+        distance = case(
+            (DefectLog.chainage > chainage, DefectLog.chainage - chainage),
+            (defect_end < chainage, chainage - defect_end),
+            else_=0.0
+        )
+        return session.query(DefectLog).order_by(distance).limit(k).all()
+
+    nearest = defect_index.nearest(chainage, k)
+    if not nearest:
+        return []
+
+    defects = session.query(DefectLog).filter(
+        DefectLog.id.in_([defect_id for defect_id, _ in nearest])
+    ).all()
+    order = {defect_id: rank for rank, (defect_id, _) in enumerate(nearest)}
+    return sorted(defects, key=lambda defect: order[defect.id])
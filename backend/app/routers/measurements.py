@@ -9,8 +9,10 @@ from sqlalchemy import func, and_, or_
 from typing import List, Optional
 from datetime import datetime, timedelta
 import json
+import time
 
 from app.db import get_session
+from app.ingest import process_measurements
 from app.models import (
     Measurement, MeasurementCreate, MeasurementResponse,
     MeasurementType, SensorType, MeasurementStats
@@ -24,10 +26,12 @@ async def create_measurement(
     session: Session = Depends(get_session)
 ):
     """Create a new measurement record"""
+    received_at = time.time()
     try:
         db_measurement = Measurement(**measurement.dict())
         session.add(db_measurement)
         session.commit()
+        committed_at = time.time()
         session.refresh(db_measurement)
         
         # Broadcast to WebSocket clients
@@ -38,7 +42,9 @@ async def create_measurement(
             "value": db_measurement.value,
             "sensor_id": db_measurement.sensor_id,
             "timestamp": db_measurement.timestamp.isoformat()
-        })
+        }, received_at, committed_at)
+        
+        await process_measurements(session, [db_measurement])
         
         return db_measurement
     except Exception as e:
@@ -51,6 +57,7 @@ async def create_measurements_batch(
     session: Session = Depends(get_session)
 ):
     """Create multiple measurement records in a batch"""
+    received_at = time.time()
     try:
         db_measurements = []
         for measurement in measurements:
@@ -59,6 +66,7 @@ async def create_measurements_batch(
             db_measurements.append(db_measurement)
         
         session.commit()
+        committed_at = time.time()
         
         # Refresh all measurements
         for measurement in db_measurements:
@@ -76,12 +84,9 @@ async def create_measurements_batch(
                 "timestamp": measurement.timestamp.isoformat()
             })
         
-        await manager.broadcast_json({
-            "type": "batch_measurements",
-            "data": batch_data,
-            "count": len(batch_data),
-            "timestamp": datetime.utcnow().isoformat()
-        })
+        await manager.broadcast_sensor_data(batch_data, received_at, committed_at)
+        
+        await process_measurements(session, db_measurements)
         
         return db_measurements
     except Exception as e:
@@ -15,7 +15,9 @@ import zipfile
 import os
 
 from app.db import get_session
-from app.models import Measurement, DefectLog, VideoFrame, MeasurementStats, DefectStats
+from app.models import (
+    Measurement, DefectLog, VideoFrame, MeasurementStats, DefectStats, SegmentTrend
+)
 
 router = APIRouter()
 
@@ -116,7 +118,7 @@ async def export_defects_csv(
     
     # Write header
     writer.writerow([
-        'ID', 'Chainage', 'Defect Type', 'Severity', 'Description', 
+        'ID', 'Chainage', 'End Chainage', 'Peak Value', 'Defect Type', 'Severity', 'Description', 
         'Reviewed', 'Reviewed By', 'Reviewed At', 'Photo Path', 'Measurement ID'
     ])
     
@@ -125,6 +127,8 @@ async def export_defects_csv(
         writer.writerow([
             defect.id,
             defect.chainage,
+            defect.end_chainage,
+            defect.peak_value,
             defect.defect_type,
             defect.severity,
             defect.description,
@@ -328,3 +332,42 @@ async def get_track_health_assessment(
         "recommendations": recommendations,
         "assessment_date": datetime.utcnow().isoformat()
     }
+
+@router.get("/reports/degradation")
+async def get_degradation_report(
+    measurement_type: Optional[str] = Query(None, description="Filter by measurement type"),
+    start_chainage: Optional[float] = Query(None, description="Start chainage in meters"),
+    end_chainage: Optional[float] = Query(None, description="End chainage in meters"),
+    min_sessions: int = Query(2, ge=2, description="Minimum sessions behind a trend"),
+    limit: int = Query(50, description="Maximum number of segments to return"),
+    session: Session = Depends(get_session)
+):
+    """Get track segments ranked by how fast they are deteriorating"""
+    query = session.query(SegmentTrend).filter(SegmentTrend.session_count >= min_sessions)
+    
+    if measurement_type is not None:
+        query = query.filter(SegmentTrend.measurement_type == measurement_type)
+    if start_chainage is not None:
+        query = query.filter(SegmentTrend.segment_end >= start_chainage)
+    if end_chainage is not None:
+        query = query.filter(SegmentTrend.segment_start <= end_chainage)
+    
+    trends = query.order_by(SegmentTrend.slope_per_day.desc()).limit(limit).all()
+    
+    return {
+        "segments": [
+            {
+                "segment_start": trend.segment_start,
+                "segment_end": trend.segment_end,
+                "measurement_type": trend.measurement_type,
+                "slope_per_day": trend.slope_per_day,
+                "r_squared": trend.r_squared,
+                "session_count": trend.session_count,
+                "latest_value": trend.latest_value,
+                "forecast_value": trend.forecast_value
+            }
+            for trend in trends
+        ],
+        "updated_at": trends[0].updated_at.isoformat() if trends else None,
+        "generated_at": datetime.utcnow().isoformat()
+    }
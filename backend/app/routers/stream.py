@@ -0,0 +1,48 @@
+"""
+ITMS Stream API Router
+Server-Sent Events mirror of the real-time WebSocket topics
+"""
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+router = APIRouter()
+
+def split_list(value: Optional[str]) -> list:
+    """Split a comma-separated query parameter"""
+    return [item.strip() for item in value.split(",") if item.strip()] if value else []
+
+@router.get("/stream/events")
+async def stream_events(
+    topics: Optional[str] = Query(None, description="Comma-separated topics, all if omitted"),
+    sensor_ids: Optional[str] = Query(None, description="Comma-separated sensor IDs"),
+    measurement_types: Optional[str] = Query(None, description="Comma-separated measurement types"),
+    start_chainage: Optional[float] = Query(None, description="Chainage window start in meters"),
+    end_chainage: Optional[float] = Query(None, description="Chainage window end in meters"),
+    rate: Optional[float] = Query(None, description="Frame rate in Hz for decimated sensor data"),
+    snapshot: bool = Query(True, description="Send recent samples before live data"),
+    last_event_id: Optional[str] = Header(None, description="Resume after this event ID")
+):
+    """Stream real-time topics as Server-Sent Events"""
+    from app.realtime import manager
+
+    if (start_chainage is None) != (end_chainage is None):
+        raise HTTPException(status_code=400, detail="Give both start_chainage and end_chainage")
+    chainage_window = [start_chainage, end_chainage] if start_chainage is not None else None
+
+    connection = manager.connect_sse({
+        "topics": split_list(topics),
+        "sensor_ids": split_list(sensor_ids),
+        "measurement_types": split_list(measurement_types),
+        "chainage_window": chainage_window,
+        "rate": rate
+    }, last_event_id, snapshot)
+    if connection is None:
+        raise HTTPException(status_code=503, detail="Realtime connection limit reached")
+
+    return StreamingResponse(
+        connection.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
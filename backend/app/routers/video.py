@@ -3,15 +3,33 @@ ITMS Video API Router
 Handles video frame metadata and processing
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File, Form
+from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
+from sqlalchemy import func
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import json
 import os
-import shutil
 
 from app.db import get_session
-from app.models import VideoFrame, VideoFrameCreate, VideoFrameResponse
+from app.config import settings
+from app.models import (
+    FrameAnnotation, FrameAnnotationLabelStats, FrameAnnotationResponse,
+    VideoFrame, VideoFrameCreate, VideoFrameManifestEntry, VideoFrameResponse,
+    VideoSegment, VideoSegmentResponse
+)
+from app.annotations import annotation_response, replace_frame_annotations
+from app.chainage_index import update_chainage_index, video_frame_index
+from app.file_responses import content_response, file_response
+from app.frame_store import frame_store
+from app.thumbnails import IMAGE_SIZES, derived_path, is_image, remove_derived, thumbnail_generator
+from app.uploads import (
+    UploadError, extract_tar_to_temp, get_upload_extension, is_tar_upload,
+    remove_temp_files, save_upload_to_temp
+)
+from app.video_segments import VIDEO_EXTENSIONS, segment_decoder
 
 router = APIRouter()
 
@@ -28,8 +46,19 @@ async def create_video_frame(
     try:
         db_video_frame = VideoFrame(**video_frame.dict())
         session.add(db_video_frame)
+        if db_video_frame.annotations:
+            # Frames sent with annotations were analysed by the sender
+            db_video_frame.processed = True
+            session.flush()
+            replace_frame_annotations(session, [(
+                db_video_frame.id, db_video_frame.chainage,
+                db_video_frame.camera_id, db_video_frame.annotations
+            )])
         session.commit()
         session.refresh(db_video_frame)
+        await update_chainage_index(
+            video_frame_index, [(db_video_frame.id, db_video_frame.chainage, None)]
+        )
         return db_video_frame
     except Exception as e:
         session.rollback()
@@ -45,37 +74,181 @@ async def upload_video_frame(
 ):
     """Upload a video frame file and create metadata record"""
     try:
-        # Generate unique filename
-        timestamp = datetime.utcnow()
-        filename = f"{camera_id}_{timestamp.strftime('%Y%m%d_%H%M%S')}_{frame_number or 0}.jpg"
-        filepath = os.path.join(VIDEO_STORAGE_PATH, filename)
-        
-        # Save file
-        with open(filepath, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        extension = get_upload_extension(file.filename)
         
-        # Create database record
+        # Stream to the store's temp directory in chunks, enforcing the size limit
+        temp_path, size, sha256 = await save_upload_to_temp(file, frame_store.tmp_dir)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    try:
+        # Reference the content-addressed file, shared with identical frames
+        blob = frame_store.acquire(session, sha256, size, extension)
         video_frame = VideoFrame(
-            timestamp=timestamp,
+            timestamp=datetime.utcnow(),
             chainage=chainage,
             camera_id=camera_id,
-            filepath=filepath,
-            frame_number=frame_number
+            filepath=frame_store.object_path(sha256, blob.extension),
+            frame_number=frame_number,
+            sha256=sha256,
+            file_size=size
         )
+        deduplicated = blob.refcount > 1
         
         session.add(video_frame)
         session.commit()
         session.refresh(video_frame)
+        frame_store.store(temp_path, sha256, blob.extension)
+        await update_chainage_index(video_frame_index, [(video_frame.id, video_frame.chainage, None)])
+        if not deduplicated:
+            thumbnail_generator.schedule(video_frame.filepath)
         
         return {
             "message": "Video frame uploaded successfully",
             "video_frame_id": video_frame.id,
-            "filepath": filepath
+            "filepath": video_frame.filepath,
+            "size": size,
+            "sha256": sha256,
+            "deduplicated": deduplicated
         }
     except Exception as e:
         session.rollback()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
         raise HTTPException(status_code=400, detail=f"Error uploading video frame: {str(e)}")
 
+def parse_manifest(manifest: Optional[bytes]) -> List[VideoFrameManifestEntry]:
+    """Parse a batch manifest, a JSON list of frame metadata entries"""
+    if not manifest:
+        raise UploadError("Batch upload requires a manifest")
+    try:
+        entries = json.loads(manifest)
+        if not isinstance(entries, list):
+            raise ValueError("expected a list of frames")
+        return [VideoFrameManifestEntry(**entry) for entry in entries]
+    except (TypeError, ValueError) as e:
+        raise UploadError(f"Invalid manifest: {e}")
+
+async def save_batch_files(files: List[UploadFile]) -> Dict[str, Tuple[str, int, str]]:
+    """Stream multipart frame files to the store's temp directory concurrently"""
+    names = [file.filename for file in files]
+    if len(set(names)) != len(names):
+        raise UploadError("Batch file names must be unique")
+    for name in names:
+        get_upload_extension(name)
+    
+    semaphore = asyncio.Semaphore(settings.batch_upload_concurrency)
+    
+    async def save(file: UploadFile):
+        async with semaphore:
+            return await save_upload_to_temp(file, frame_store.tmp_dir)
+    
+    results = await asyncio.gather(*(save(file) for file in files), return_exceptions=True)
+    saved = {
+        name: result for name, result in zip(names, results)
+        if not isinstance(result, BaseException)
+    }
+    for result in results:
+        if isinstance(result, BaseException):
+            remove_temp_files(saved)
+            raise result
+    return saved
+
+@router.post("/video-frames/batch")
+async def upload_video_frame_batch(
+    files: List[UploadFile] = File(..., description="Frame files, or one tar archive of frames and manifest.json"),
+    manifest: Optional[str] = Form(None, description="JSON list of {filename, chainage, camera_id, timestamp, frame_number}"),
+    session: Session = Depends(get_session)
+):
+    """Upload many video frames and create their records in one transaction"""
+    saved: Dict[str, Tuple[str, int, str]] = {}
+    try:
+        if len(files) > settings.batch_upload_max_frames:
+            raise UploadError(
+                f"Batch exceeds the maximum of {settings.batch_upload_max_frames} frames",
+                status_code=413
+            )
+        
+        if len(files) == 1 and is_tar_upload(files[0].filename):
+            # Archives are read sequentially, so extract in one worker thread
+            archive_manifest, saved = await asyncio.to_thread(
+                extract_tar_to_temp, files[0].file, frame_store.tmp_dir,
+                settings.batch_upload_max_frames
+            )
+            entries = parse_manifest(manifest.encode() if manifest else archive_manifest)
+        else:
+            entries = parse_manifest(manifest.encode() if manifest else None)
+            saved = await save_batch_files(files)
+        
+        listed = {entry.filename for entry in entries}
+        missing = sorted(listed - set(saved))
+        unlisted = sorted(set(saved) - listed)
+        if missing:
+            raise UploadError(f"Manifest lists files not uploaded: {', '.join(missing[:10])}")
+        if unlisted:
+            raise UploadError(f"Files missing from manifest: {', '.join(unlisted[:10])}")
+    except UploadError as e:
+        remove_temp_files(saved)
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except BaseException:
+        remove_temp_files(saved)
+        raise
+    
+    try:
+        # Reference every file and insert every record before a single commit
+        timestamp = datetime.utcnow()
+        extensions = {}
+        new_files = set()
+        video_frames = []
+        for entry in entries:
+            _, size, sha256 = saved[entry.filename]
+            blob = frame_store.acquire(
+                session, sha256, size, os.path.splitext(entry.filename)[1].lower().lstrip(".")
+            )
+            extensions[entry.filename] = blob.extension
+            if blob.refcount == 1:
+                new_files.add(sha256)
+            video_frames.append(VideoFrame(
+                timestamp=entry.timestamp or timestamp,
+                chainage=entry.chainage,
+                camera_id=entry.camera_id,
+                filepath=frame_store.object_path(sha256, blob.extension),
+                frame_number=entry.frame_number,
+                sha256=sha256,
+                file_size=size
+            ))
+        
+        session.add_all(video_frames)
+        session.flush()
+        # Read back before commit expires the rows, avoiding a reload per frame
+        stored = [
+            (video_frame.id, video_frame.chainage, video_frame.filepath, video_frame.sha256)
+            for video_frame in video_frames
+        ]
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        remove_temp_files(saved)
+        raise HTTPException(status_code=400, detail=f"Error uploading video frame batch: {str(e)}")
+    
+    for filename, (temp_path, _, sha256) in saved.items():
+        frame_store.store(temp_path, sha256, extensions[filename])
+    deduplicated = len(stored) - len(new_files)
+    await update_chainage_index(
+        video_frame_index, [(video_frame_id, chainage, None) for video_frame_id, chainage, _, _ in stored]
+    )
+    for _, _, filepath, sha256 in stored:
+        if sha256 in new_files:
+            new_files.discard(sha256)
+            thumbnail_generator.schedule(filepath)
+    
+    return {
+        "message": "Video frame batch uploaded successfully",
+        "count": len(stored),
+        "video_frame_ids": [video_frame_id for video_frame_id, _, _, _ in stored],
+        "deduplicated": deduplicated
+    }
+
 @router.get("/video-frames", response_model=List[VideoFrameResponse])
 async def get_video_frames(
     start_chainage: Optional[float] = Query(None, description="Start chainage in meters"),
@@ -112,6 +285,83 @@ async def get_video_frames(
     video_frames = query.all()
     return video_frames
 
+def filter_annotations(
+    query, label: Optional[str], min_confidence: Optional[float],
+    start_chainage: Optional[float], end_chainage: Optional[float], camera_id: Optional[str]
+):
+    """Apply the shared annotation filters, all evaluated in SQL"""
+    if label is not None:
+        query = query.filter(FrameAnnotation.label == label)
+    if min_confidence is not None:
+        query = query.filter(FrameAnnotation.confidence >= min_confidence)
+    if start_chainage is not None:
+        query = query.filter(FrameAnnotation.chainage >= start_chainage)
+    if end_chainage is not None:
+        query = query.filter(FrameAnnotation.chainage <= end_chainage)
+    if camera_id is not None:
+        query = query.filter(FrameAnnotation.camera_id == camera_id)
+    return query
+
+@router.get("/frame-annotations", response_model=List[FrameAnnotationResponse])
+async def get_frame_annotations(
+    label: Optional[str] = Query(None, description="Detection label, e.g. rail_wear"),
+    min_confidence: Optional[float] = Query(None, description="Minimum detection confidence"),
+    start_chainage: Optional[float] = Query(None, description="Start chainage in meters"),
+    end_chainage: Optional[float] = Query(None, description="End chainage in meters"),
+    camera_id: Optional[str] = Query(None, description="Filter by camera ID"),
+    limit: int = Query(1000, description="Maximum number of records to return"),
+    offset: int = Query(0, description="Number of records to skip"),
+    session: Session = Depends(get_session)
+):
+    """Get frame detections filtered by label, confidence and chainage, along the track"""
+    query = filter_annotations(
+        session.query(FrameAnnotation), label, min_confidence, start_chainage, end_chainage, camera_id
+    )
+    annotations = query.order_by(FrameAnnotation.chainage, FrameAnnotation.id).offset(offset).limit(limit).all()
+    return [annotation_response(annotation) for annotation in annotations]
+
+@router.get("/frame-annotations/labels", response_model=List[FrameAnnotationLabelStats])
+async def get_frame_annotation_labels(
+    start_chainage: Optional[float] = Query(None, description="Start chainage in meters"),
+    end_chainage: Optional[float] = Query(None, description="End chainage in meters"),
+    camera_id: Optional[str] = Query(None, description="Filter by camera ID"),
+    session: Session = Depends(get_session)
+):
+    """Get detection counts per label"""
+    query = filter_annotations(
+        session.query(
+            FrameAnnotation.label,
+            func.count(FrameAnnotation.id),
+            func.count(func.distinct(FrameAnnotation.video_frame_id)),
+            func.max(FrameAnnotation.confidence)
+        ), None, None, start_chainage, end_chainage, camera_id
+    )
+    return [
+        {"label": label, "count": count, "frames": frames, "max_confidence": max_confidence}
+        for label, count, frames, max_confidence
+        in query.group_by(FrameAnnotation.label).order_by(func.count(FrameAnnotation.id).desc())
+    ]
+
+@router.get("/video-frames/annotated", response_model=List[VideoFrameResponse])
+async def get_annotated_video_frames(
+    label: Optional[str] = Query(None, description="Detection label, e.g. rail_wear"),
+    min_confidence: Optional[float] = Query(None, description="Minimum detection confidence"),
+    start_chainage: Optional[float] = Query(None, description="Start chainage in meters"),
+    end_chainage: Optional[float] = Query(None, description="End chainage in meters"),
+    camera_id: Optional[str] = Query(None, description="Filter by camera ID"),
+    limit: int = Query(100, description="Maximum number of records to return"),
+    offset: int = Query(0, description="Number of records to skip"),
+    session: Session = Depends(get_session)
+):
+    """Get video frames with at least one matching detection, along the track"""
+    matching = filter_annotations(
+        session.query(FrameAnnotation.video_frame_id),
+        label, min_confidence, start_chainage, end_chainage, camera_id
+    )
+    return session.query(VideoFrame).filter(
+        VideoFrame.id.in_(matching.scalar_subquery())
+    ).order_by(VideoFrame.chainage, VideoFrame.id).offset(offset).limit(limit).all()
+
 @router.get("/video-frames/{video_frame_id}", response_model=VideoFrameResponse)
 async def get_video_frame(
     video_frame_id: int,
@@ -125,6 +375,90 @@ async def get_video_frame(
     
     return video_frame
 
+@router.api_route("/video-frames/{video_frame_id}/file", methods=["GET", "HEAD"])
+async def get_video_frame_file(
+    video_frame_id: int,
+    request: Request,
+    session: Session = Depends(get_session)
+):
+    """Get the stored file of a video frame, with ETag, Range and caching support"""
+    video_frame = session.query(VideoFrame).filter(VideoFrame.id == video_frame_id).first()
+    if not video_frame:
+        raise HTTPException(status_code=404, detail="Video frame not found")
+    
+    # The file of a segment frame is the whole video, send the decoded frame
+    if video_frame.segment_id is not None:
+        return RedirectResponse(
+            str(request.url_for("get_video_frame_image", video_frame_id=video_frame_id)),
+            status_code=307
+        )
+    
+    try:
+        return file_response(request, video_frame.filepath, video_frame.sha256)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Video frame file not found")
+
+@router.api_route("/video-frames/{video_frame_id}/image", methods=["GET", "HEAD"])
+async def get_video_frame_image(
+    video_frame_id: int,
+    request: Request,
+    size: str = Query("original", description=f"Image size: original, {', '.join(IMAGE_SIZES)}"),
+    session: Session = Depends(get_session)
+):
+    """Get a video frame image, downscaled for previews and filmstrips"""
+    if size != "original" and size not in IMAGE_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown image size '{size}'")
+    
+    video_frame = session.query(VideoFrame).filter(VideoFrame.id == video_frame_id).first()
+    if not video_frame:
+        raise HTTPException(status_code=404, detail="Video frame not found")
+    if not os.path.exists(video_frame.filepath):
+        raise HTTPException(status_code=404, detail="Video frame file not found")
+    
+    if video_frame.segment_id is not None:
+        return await segment_frame_response(request, video_frame, size, session)
+    
+    if size == "original":
+        return file_response(request, video_frame.filepath, video_frame.sha256)
+    
+    if not is_image(video_frame.filepath):
+        raise HTTPException(status_code=415, detail="Video frame is not an image")
+    
+    # Render on demand if the background render has not finished or never ran
+    path = derived_path(video_frame.filepath, size)
+    if not os.path.exists(path):
+        try:
+            path = (await thumbnail_generator.generate(video_frame.filepath))[size]
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error generating {size} image: {str(e)}")
+    
+    # Derived sizes of a content-addressed frame are as immutable as the frame
+    content_hash = f"{video_frame.sha256}-{size}" if video_frame.sha256 else None
+    return file_response(request, path, content_hash, media_type="image/jpeg")
+
+async def segment_frame_response(
+    request: Request, video_frame: VideoFrame, size: str, session: Session
+):
+    """Decode a frame of a video segment, or take it from the frame cache"""
+    segment = session.query(VideoSegment).filter(VideoSegment.id == video_frame.segment_id).first()
+    if not segment:
+        raise HTTPException(status_code=404, detail="Video segment not found")
+    
+    # Decoded frames never change, so revalidation needs no decode
+    content_hash = f"{segment.sha256}-{video_frame.pts}-{size}"
+    if request.headers.get("if-none-match"):
+        response = content_response(request, b"", content_hash)
+        if response.status_code == 304:
+            return response
+    
+    try:
+        content = await segment_decoder.frame(
+            segment.filepath, video_frame.pts, video_frame.keyframe_pts, IMAGE_SIZES.get(size)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error decoding video frame: {str(e)}")
+    return content_response(request, content, content_hash)
+
 @router.put("/video-frames/{video_frame_id}/annotations")
 async def update_video_frame_annotations(
     video_frame_id: int,
@@ -141,11 +475,14 @@ async def update_video_frame_annotations(
     video_frame.annotations = annotations
     video_frame.confidence = confidence
     video_frame.processed = True
+    detections = replace_frame_annotations(
+        session, [(video_frame.id, video_frame.chainage, video_frame.camera_id, annotations)]
+    )
     
     session.commit()
     session.refresh(video_frame)
     
-    return {"message": "Video frame annotations updated successfully"}
+    return {"message": "Video frame annotations updated successfully", "detections": detections}
 
 @router.get("/video-frames/chainage/{chainage}", response_model=List[VideoFrameResponse])
 async def get_video_frames_at_chainage(
@@ -154,13 +491,44 @@ async def get_video_frames_at_chainage(
     session: Session = Depends(get_session)
 ):
     """Get video frames at a specific chainage with tolerance"""
+    if not video_frame_index.complete:
+        return session.query(VideoFrame).filter(
+            VideoFrame.chainage >= chainage - tolerance,
+            VideoFrame.chainage <= chainage + tolerance
+        ).order_by(VideoFrame.timestamp.desc()).all()
+    
+    video_frame_ids = video_frame_index.within(chainage, tolerance)
+    if not video_frame_ids:
+        return []
+    
     video_frames = session.query(VideoFrame).filter(
-        VideoFrame.chainage >= chainage - tolerance,
-        VideoFrame.chainage <= chainage + tolerance
+        VideoFrame.id.in_(video_frame_ids)
     ).order_by(VideoFrame.timestamp.desc()).all()
     
     return video_frames
 
+@router.get("/video-frames/nearest/{chainage}", response_model=List[VideoFrameResponse])
+async def get_nearest_video_frames(
+    chainage: float,
+    k: int = Query(5, ge=1, le=100, description="Number of frames to return"),
+    session: Session = Depends(get_session)
+):
+    """Get the video frames closest to a chainage, closest first"""
+    if not video_frame_index.complete:
+        return session.query(VideoFrame).order_by(
+            func.abs(VideoFrame.chainage - chainage)
+        ).limit(k).all()
+    
+    nearest = video_frame_index.nearest(chainage, k)
+    if not nearest:
+        return []
+    
+    video_frames = session.query(VideoFrame).filter(
+        VideoFrame.id.in_([video_frame_id for video_frame_id, _ in nearest])
+    ).all()
+    order = {video_frame_id: rank for rank, (video_frame_id, _) in enumerate(nearest)}
+    return sorted(video_frames, key=lambda video_frame: order[video_frame.id])
+
 @router.get("/cameras", response_model=List[str])
 async def get_camera_list(session: Session = Depends(get_session)):
     """Get list of all camera IDs that have captured frames"""
@@ -178,14 +546,188 @@ async def delete_video_frame(
     if not video_frame:
         raise HTTPException(status_code=404, detail="Video frame not found")
     
-    # Delete file if it exists
-    if os.path.exists(video_frame.filepath):
+    # Stored files are shared, so only drop this frame's reference. Frames of
+    # a video segment go with the segment.
+    unreferenced_path = None
+    if video_frame.segment_id is not None:
+        pass
+    elif video_frame.sha256:
+        unreferenced_path = frame_store.release(session, video_frame.sha256)
+    elif os.path.exists(video_frame.filepath):
         try:
             os.remove(video_frame.filepath)
+            remove_derived(video_frame.filepath)
         except Exception as e:
             print(f"Warning: Could not delete file {video_frame.filepath}: {e}")
     
     session.delete(video_frame)
     session.commit()
+    await update_chainage_index(video_frame_index, removed=[video_frame_id])
+    
+    if unreferenced_path:
+        try:
+            with frame_store.claim_unreferenced(session, [unreferenced_path]) as paths:
+                for path in paths:
+                    if os.path.exists(path):
+                        os.remove(path)
+                    remove_derived(path)
+        except Exception as e:
+            print(f"Warning: Could not delete file {unreferenced_path}: {e}")
     
     return {"message": "Video frame deleted successfully"}
+
+@router.post("/video-segments/upload", response_model=VideoSegmentResponse)
+async def upload_video_segment(
+    file: UploadFile = File(...),
+    camera_id: str = Query(..., description="Camera ID that recorded the segment"),
+    start_chainage: float = Query(..., description="Track chainage of the first frame"),
+    end_chainage: float = Query(..., description="Track chainage of the last frame"),
+    start_time: Optional[datetime] = Query(None, description="Timestamp of the first frame"),
+    session: Session = Depends(get_session)
+):
+    """Upload a video segment and index its frames for on-demand decoding"""
+    try:
+        extension = get_upload_extension(file.filename)
+        if extension not in VIDEO_EXTENSIONS:
+            raise UploadError(f"Video segments must be one of {', '.join(sorted(VIDEO_EXTENSIONS))}",
+                              status_code=415)
+        temp_path, size, sha256 = await save_upload_to_temp(
+            file, frame_store.tmp_dir, settings.max_segment_size
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    try:
+        # Read the packet index in a worker, no frames are decoded
+        index = await segment_decoder.index(temp_path)
+    except Exception as e:
+        os.remove(temp_path)
+        raise HTTPException(status_code=400, detail=f"Error indexing video segment: {str(e)}")
+    
+    try:
+        blob = frame_store.acquire(session, sha256, size, extension)
+        filepath = frame_store.object_path(sha256, blob.extension)
+        frames = index["frames"]
+        start_time = start_time or datetime.utcnow()
+        segment = VideoSegment(
+            camera_id=camera_id,
+            filepath=filepath,
+            sha256=sha256,
+            file_size=size,
+            start_timestamp=start_time,
+            start_chainage=start_chainage,
+            end_chainage=end_chainage,
+            frame_count=len(frames),
+            fps=index["fps"],
+            width=index["width"],
+            height=index["height"],
+            codec=index["codec"]
+        )
+        session.add(segment)
+        session.flush()
+        
+        # One row per frame, so chainage queries find segment frames too
+        step = (end_chainage - start_chainage) / max(len(frames) - 1, 1)
+        video_frames = [
+            VideoFrame(
+                timestamp=start_time + timedelta(seconds=seconds),
+                chainage=start_chainage + step * frame_number,
+                camera_id=camera_id,
+                filepath=filepath,
+                frame_number=frame_number,
+                segment_id=segment.id,
+                pts=pts,
+                keyframe_pts=keyframe_pts
+            )
+            for frame_number, (pts, keyframe_pts, seconds) in enumerate(frames)
+        ]
+        session.add_all(video_frames)
+        session.flush()
+        indexed = [(video_frame.id, video_frame.chainage) for video_frame in video_frames]
+        session.commit()
+        session.refresh(segment)
+    except Exception as e:
+        session.rollback()
+        os.remove(temp_path)
+        raise HTTPException(status_code=400, detail=f"Error uploading video segment: {str(e)}")
+    
+    frame_store.store(temp_path, sha256, blob.extension)
+    await update_chainage_index(
+        video_frame_index, [(video_frame_id, chainage, None) for video_frame_id, chainage in indexed]
+    )
+    
+    return segment
+
+@router.get("/video-segments", response_model=List[VideoSegmentResponse])
+async def get_video_segments(
+    camera_id: Optional[str] = Query(None, description="Filter by camera ID"),
+    limit: int = Query(100, description="Maximum number of records to return"),
+    offset: int = Query(0, description="Number of records to skip"),
+    session: Session = Depends(get_session)
+):
+    """Get video segments, newest first"""
+    query = session.query(VideoSegment)
+    if camera_id is not None:
+        query = query.filter(VideoSegment.camera_id == camera_id)
+    return query.order_by(VideoSegment.start_timestamp.desc()).offset(offset).limit(limit).all()
+
+@router.get("/video-segments/{segment_id}", response_model=VideoSegmentResponse)
+async def get_video_segment(
+    segment_id: int,
+    session: Session = Depends(get_session)
+):
+    """Get a specific video segment by ID"""
+    segment = session.query(VideoSegment).filter(VideoSegment.id == segment_id).first()
+    if not segment:
+        raise HTTPException(status_code=404, detail="Video segment not found")
+    return segment
+
+@router.api_route("/video-segments/{segment_id}/frames/{frame_number}", methods=["GET", "HEAD"])
+async def get_video_segment_frame(
+    segment_id: int,
+    frame_number: int,
+    request: Request,
+    size: str = Query("original", description=f"Image size: original, {', '.join(IMAGE_SIZES)}"),
+    session: Session = Depends(get_session)
+):
+    """Get one frame of a video segment as a JPEG"""
+    if size != "original" and size not in IMAGE_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown image size '{size}'")
+    
+    video_frame = session.query(VideoFrame).filter(
+        VideoFrame.segment_id == segment_id,
+        VideoFrame.frame_number == frame_number
+    ).first()
+    if not video_frame:
+        raise HTTPException(status_code=404, detail="Video frame not found")
+    
+    return await segment_frame_response(request, video_frame, size, session)
+
+@router.delete("/video-segments/{segment_id}")
+async def delete_video_segment(
+    segment_id: int,
+    session: Session = Depends(get_session)
+):
+    """Delete a video segment, its frame records and its file once unreferenced"""
+    segment = session.query(VideoSegment).filter(VideoSegment.id == segment_id).first()
+    if not segment:
+        raise HTTPException(status_code=404, detail="Video segment not found")
+    
+    video_frame_ids = [
+        row[0] for row in session.query(VideoFrame.id).filter(VideoFrame.segment_id == segment_id)
+    ]
+    session.query(VideoFrame).filter(VideoFrame.segment_id == segment_id).delete(
+        synchronize_session=False
+    )
+    unreferenced_path = frame_store.release(session, segment.sha256)
+    session.delete(segment)
+    session.commit()
+    await update_chainage_index(video_frame_index, removed=video_frame_ids)
+    
+    if unreferenced_path:
+        try:
+            frame_store.remove_unreferenced(session, unreferenced_path)
+        except Exception as e:
+            print(f"Warning: Could not delete file {unreferenced_path}: {e}")
+    
+    return {"message": "Video segment deleted successfully", "frames_deleted": len(video_frame_ids)}
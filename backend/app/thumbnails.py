@@ -0,0 +1,117 @@
+"""
+ITMS Frame Thumbnails
+Generates downscaled copies of video frames in a process pool so filmstrips
+along the chainage axis do not need full-size images
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from app.config import settings
+
+# Longest edge in pixels of each derived size, largest first so every level
+# is downscaled from the one before it rather than from the original
+IMAGE_SIZES = {"preview": 640, "thumb": 160}
+
+# Frame file types that can be downscaled
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png"}
+
+DERIVED_QUALITY = 80
+
+def is_image(filepath: str) -> bool:
+    return os.path.splitext(filepath)[1].lower().lstrip(".") in IMAGE_EXTENSIONS
+
+def derived_path(filepath: str, size: str) -> str:
+    """Get the path of a derived size, stored beside the original"""
+    return f"{os.path.splitext(filepath)[0]}.{size}.jpg"
+
+def remove_derived(filepath: str) -> int:
+    """Unlink the derived sizes of a removed frame file, returning the count"""
+    removed = 0
+    for size in IMAGE_SIZES:
+        try:
+            os.remove(derived_path(filepath, size))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def render_pyramid(filepath: str) -> Dict[str, str]:
+    """Write every derived size of an image, run in a worker process"""
+    from PIL import Image
+
+    paths = {}
+    with Image.open(filepath) as original:
+        # JPEGs decode straight to a reduced scale no smaller than the largest size
+        original.draft("RGB", (max(IMAGE_SIZES.values()),) * 2)
+        image = original.convert("RGB")
+        for size, edge in IMAGE_SIZES.items():
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            path = derived_path(filepath, size)
+            temp_path = f"{path}.{os.getpid()}.part"
+            image.save(temp_path, "JPEG", quality=DERIVED_QUALITY, optimize=True)
+            os.replace(temp_path, path)
+            paths[size] = path
+    return paths
+
+class ThumbnailGenerator:
+    """Runs render_pyramid off the event loop, once per file at a time"""
+
+    def __init__(self, workers: int = settings.thumbnail_workers):
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.generated = 0
+        self.failed = 0
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # Spawned workers avoid forking the server's threads and sockets
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    async def generate(self, filepath: str) -> Dict[str, str]:
+        """Render the derived sizes of a frame, sharing any render in progress"""
+        future = self.pending.get(filepath)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.get_executor(), render_pyramid, filepath)
+            self.pending[filepath] = future
+            future.add_done_callback(lambda _: self.pending.pop(filepath, None))
+        try:
+            paths = await asyncio.shield(future)
+        except BrokenProcessPool:
+            # A worker died, start a fresh pool on the next render
+            self.failed += 1
+            self.shutdown()
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        self.generated += 1
+        return paths
+
+    def schedule(self, filepath: str):
+        """Render the derived sizes of a new frame in the background"""
+        if is_image(filepath):
+            asyncio.create_task(self.generate_quietly(filepath))
+
+    async def generate_quietly(self, filepath: str):
+        try:
+            await self.generate(filepath)
+        except Exception as e:
+            print(f"❌ Error generating thumbnails for {filepath}: {e}")
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+# Global thumbnail generator instance
+thumbnail_generator = ThumbnailGenerator()
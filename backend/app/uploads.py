@@ -0,0 +1,222 @@
+"""
+ITMS Upload Handling
+Streams uploaded files to disk in chunks without blocking the event loop,
+enforcing the size limit and hashing the content while writing, including
+frame batches sent as tar archives. Upload routes are also limited by
+request size before the body is read
+"""
+
+import hashlib
+import os
+import tarfile
+import uuid
+from typing import BinaryIO, Dict, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+
+# Bytes read from the upload per chunk
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# Archive extensions accepted by batch uploads
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz")
+
+# Member of a batch archive holding the frame metadata
+MANIFEST_NAME = "manifest.json"
+
+# Allowance for multipart boundaries, part headers and small form fields
+# on top of the file size limit of a request
+MULTIPART_OVERHEAD = 1024 * 1024
+
+class UploadError(ValueError):
+    """Rejected upload, status_code is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+class RequestTooLarge(HTTPException):
+    """Upload body crossed its limit while streaming.
+
+    An HTTPException, so FastAPI answers 413 when it is raised while the
+    form is parsed rather than reporting a malformed body.
+    """
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"Request body exceeds the maximum of {limit} bytes")
+
+class UploadSizeLimitMiddleware:
+    """Limit request bodies of upload routes before they reach the form parser.
+
+    Starlette spools a whole multipart body to disk before the endpoint
+    runs, so size checks while copying the upload come too late to protect
+    disk and bandwidth. Requests declaring a larger Content-Length are
+    rejected before the body is read, and bodies without one are cut off
+    as soon as they cross the limit.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = {path: limit + MULTIPART_OVERHEAD for path, limit in limits.items()}
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(
+                {"detail": f"Request body exceeds the maximum of {limit} bytes"}, status_code=413
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise RequestTooLarge(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+def get_upload_extension(filename: str) -> str:
+    """Get the lower-case extension of an upload, checked against allowed_file_types"""
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if extension not in settings.allowed_file_types:
+        raise UploadError(
+            f"File type '{extension or 'none'}' not allowed, expected one of "
+            f"{', '.join(settings.allowed_file_types)}",
+            status_code=415
+        )
+    return extension
+
+async def save_upload_to_temp(
+    file: UploadFile, directory: str, max_size: int = settings.max_file_size
+) -> Tuple[str, int, str]:
+    """Write an upload to a new temporary file in directory.
+
+    Returns the temporary path, size and SHA-256 hex digest. Uploads larger
+    than max_size are aborted as soon as the limit is crossed and the
+    partial file is removed.
+    """
+    await aiofiles.os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".{uuid.uuid4().hex}.part")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadError(
+                        f"File exceeds the maximum size of {max_size} bytes", status_code=413
+                    )
+                digest.update(chunk)
+                await buffer.write(chunk)
+    except BaseException:
+        try:
+            await aiofiles.os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    return temp_path, size, digest.hexdigest()
+
+def is_tar_upload(filename: str) -> bool:
+    return (filename or "").lower().endswith(TAR_EXTENSIONS)
+
+def write_stream_to_temp(
+    source: BinaryIO, directory: str, max_size: int = settings.max_file_size
+) -> Tuple[str, int, str]:
+    """Blocking counterpart of save_upload_to_temp for file objects"""
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".{uuid.uuid4().hex}.part")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, "wb") as buffer:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadError(
+                        f"File exceeds the maximum size of {max_size} bytes", status_code=413
+                    )
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    return temp_path, size, digest.hexdigest()
+
+def extract_tar_to_temp(
+    fileobj: BinaryIO, directory: str, max_files: int,
+    max_size: int = settings.max_file_size
+) -> Tuple[Optional[bytes], Dict[str, Tuple[str, int, str]]]:
+    """Stream the frames of a tar archive to temporary files in one pass.
+
+    Returns the manifest content, if the archive has one, and the temporary
+    path, size and SHA-256 of each frame keyed by member name. Any temporary
+    files written are removed if the archive is rejected.
+    """
+    manifest = None
+    extracted: Dict[str, Tuple[str, int, str]] = {}
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                name = os.path.normpath(member.name)
+                source = archive.extractfile(member)
+                if os.path.basename(name) == MANIFEST_NAME:
+                    manifest = source.read(max_size + 1)
+                    if len(manifest) > max_size:
+                        raise UploadError("Manifest is too large", status_code=413)
+                    continue
+
+                get_upload_extension(name)
+                if name in extracted:
+                    raise UploadError(f"Duplicate file '{name}' in archive")
+                if len(extracted) >= max_files:
+                    raise UploadError(
+                        f"Batch exceeds the maximum of {max_files} frames", status_code=413
+                    )
+                extracted[name] = write_stream_to_temp(source, directory, max_size)
+    except tarfile.TarError as e:
+        remove_temp_files(extracted)
+        raise UploadError(f"Invalid tar archive: {e}")
+    except BaseException:
+        remove_temp_files(extracted)
+        raise
+
+    return manifest, extracted
+
+def remove_temp_files(uploads: Dict[str, Tuple[str, int, str]]):
+    """Remove temporary files that were not moved into place"""
+    for temp_path, _, _ in uploads.values():
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
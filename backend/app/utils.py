@@ -12,6 +12,8 @@ from fastapi.responses import StreamingResponse
 import pandas as pd
 import numpy as np
 
+from app.models import DefectType
+
 def generate_timestamp() -> str:
     """Generate ISO format timestamp"""
     return datetime.utcnow().isoformat()
@@ -59,6 +61,22 @@ def detect_anomalies(data: List[float], threshold: float = 2.0) -> List[int]:
     z_scores = np.abs((data_array - np.mean(data_array)) / np.std(data_array))
     return np.where(z_scores > threshold)[0].tolist()
 
+def get_defect_type(measurement_type: str, deviation: float) -> DefectType:
+    """Get the defect type reported for an out-of-range measurement"""
+    if measurement_type == 'gauge':
+        return DefectType.GAUGE_EXCESS if deviation > 0 else DefectType.GAUGE_DEFICIENCY
+    
+    defect_types = {
+        'alignment': DefectType.ALIGNMENT_FAULT,
+        'lateral': DefectType.ALIGNMENT_FAULT,
+        'vertical': DefectType.VERTICAL_FAULT,
+        'profile': DefectType.VERTICAL_FAULT,
+        'twist': DefectType.TWIST_FAULT,
+        'cant': DefectType.CANT_FAULT,
+        'level': DefectType.CANT_FAULT,
+    }
+    return defect_types.get(measurement_type, DefectType.VIBRATION_EXCESS)
+
 def format_chainage(chainage: float) -> str:
     """Format chainage for display"""
     if chainage < 1000:
@@ -245,18 +263,10 @@ def cleanup_old_files(directory: str, days: int = 30) -> int:
     if not os.path.exists(directory):
         return 0
     
-    cutoff_date = datetime.now() - timedelta(days=days)
-    deleted_count = 0
+    from app.retention import scan_files, unlink_files
     
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if os.path.getmtime(file_path) < cutoff_date.timestamp():
-                try:
-                    os.remove(file_path)
-                    deleted_count += 1
-                except OSError:
-                    pass
+    cutoff_date = datetime.now() - timedelta(days=days)
+    deleted_count, _ = unlink_files(scan_files(directory, cutoff_date.timestamp()))
     
     return deleted_count
 
@@ -0,0 +1,191 @@
+"""
+ITMS Video Segments
+Indexes stored video files by frame and decodes individual frames on demand
+in a process pool, keeping recently decoded frames in a bounded LRU cache
+"""
+
+import asyncio
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+# Frame file types stored as segments rather than single frames
+VIDEO_EXTENSIONS = {"mp4", "avi", "mov"}
+
+# Frames after the requested one that are encoded while the decoder is
+# already positioned there, for clients stepping through a segment
+PREFETCH_FRAMES = 4
+
+DECODED_QUALITY = 90
+
+def index_segment(filepath: str) -> Dict[str, Any]:
+    """Read the packet index of a video without decoding, run in a worker process.
+
+    Frames are numbered in presentation order. Each gets its pts, the pts of
+    the keyframe to seek to before decoding it, and its offset in seconds.
+    """
+    import av
+
+    with av.open(filepath) as container:
+        if not container.streams.video:
+            raise ValueError("File has no video stream")
+        stream = container.streams.video[0]
+        packets = sorted(
+            (packet.pts, packet.is_keyframe)
+            for packet in container.demux(stream) if packet.pts is not None
+        )
+        if not packets:
+            raise ValueError("Video stream has no frames")
+
+        frames = []
+        keyframe_pts = packets[0][0]
+        for pts, is_keyframe in packets:
+            if is_keyframe:
+                keyframe_pts = pts
+            frames.append((pts, keyframe_pts, float((pts - packets[0][0]) * stream.time_base)))
+
+        return {
+            "frames": frames,
+            "fps": float(stream.average_rate or 0),
+            "width": stream.codec_context.width,
+            "height": stream.codec_context.height,
+            "codec": stream.codec_context.name
+        }
+
+def decode_frames(filepath: str, pts: int, keyframe_pts: int, max_edge: Optional[int],
+                  prefetch: int = PREFETCH_FRAMES) -> List[Tuple[int, bytes]]:
+    """Decode the frame at pts and up to prefetch following ones as JPEGs.
+
+    Seeks to the keyframe first, so only one group of pictures is decoded.
+    Runs in a worker process.
+    """
+    import av
+    from PIL import Image
+
+    decoded = []
+    with av.open(filepath) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        container.seek(keyframe_pts, stream=stream, backward=True)
+        for frame in container.decode(stream):
+            if frame.pts is None or frame.pts < pts:
+                continue
+            image = frame.to_image()
+            if max_edge:
+                image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=DECODED_QUALITY)
+            decoded.append((frame.pts, buffer.getvalue()))
+            if len(decoded) > prefetch:
+                break
+
+    if not decoded or decoded[0][0] != pts:
+        raise ValueError(f"Frame at pts {pts} not found")
+    return decoded
+
+class FrameCache:
+    """LRU cache of encoded frames bounded by total size in bytes"""
+
+    def __init__(self, max_bytes: int = settings.decoded_frame_cache_bytes):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Tuple, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self.entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+class SegmentDecoder:
+    """Runs segment indexing and frame decoding off the event loop"""
+
+    def __init__(self, workers: int = settings.video_decode_workers):
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.cache = FrameCache()
+        self.pending: Dict[Tuple, asyncio.Future] = {}
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # Spawned workers avoid forking the server's threads and sockets
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    async def run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.get_executor(), function, *args)
+        except BrokenProcessPool:
+            # A worker died, start a fresh pool on the next call
+            self.shutdown()
+            raise
+
+    async def index(self, filepath: str) -> Dict[str, Any]:
+        return await self.run(index_segment, filepath)
+
+    async def frame(self, filepath: str, pts: int, keyframe_pts: int,
+                    max_edge: Optional[int] = None) -> bytes:
+        """Get a frame as JPEG bytes, decoding it unless cached"""
+        key = (filepath, pts, max_edge)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Share a decode in progress for the same frame
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                self.run(decode_frames, filepath, pts, keyframe_pts, max_edge)
+            )
+            self.pending[key] = future
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+
+        decoded = await asyncio.shield(future)
+        for frame_pts, content in decoded:
+            self.cache.put((filepath, frame_pts, max_edge), content)
+        return decoded[0][1]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "decoding": len(self.pending), "cache": self.cache.get_stats()}
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+# Global segment decoder instance
+segment_decoder = SegmentDecoder()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+ITMS Broadcast Benchmark
+Measures real-time fan-out latency with many simulated WebSocket clients,
+one of which is slow, to check that a slow consumer does not delay others
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.config import settings  # noqa: E402
+from app.realtime import ConnectionManager  # noqa: E402
+
+class FakeWebSocket:
+    """In-memory WebSocket recording the delivery time of each message"""
+
+    def __init__(self, send_delay: float = 0.0):
+        self.send_delay = send_delay
+        self.delivery_times = []
+        # JSON clients, no columnar subprotocol requested
+        self.scope = {"type": "websocket", "subprotocols": []}
+
+    async def accept(self, subprotocol: str = None):
+        pass
+
+    async def send_text(self, text: str):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.delivery_times.append(time.perf_counter())
+
+    async def close(self, code: int = 1000):
+        pass
+
+async def run(clients: int, messages: int, interval: float, slow_delay: float, policy: str):
+    manager = ConnectionManager()
+    sockets = [FakeWebSocket() for _ in range(clients - 1)]
+    slow_socket = FakeWebSocket(slow_delay)
+    for websocket in sockets + [slow_socket]:
+        await manager.connect(websocket)
+        manager.connections[websocket].policy = policy
+    await asyncio.sleep(0.1)
+    for websocket in sockets + [slow_socket]:
+        websocket.delivery_times.clear()
+
+    sent_times = []
+    call_latencies = []
+    for i in range(messages):
+        timestamp = datetime.now(timezone.utc).isoformat()
+        samples = [{"chainage": i + j / 10, "value": 1.676, "timestamp": timestamp} for j in range(10)]
+        sent_times.append(time.perf_counter())
+        await manager.broadcast_sensor_data(
+            [dict(sample, sensor_id="gauge_1", type="gauge") for sample in samples]
+        )
+        call_latencies.append(time.perf_counter() - sent_times[-1])
+        await asyncio.sleep(interval)
+    await asyncio.sleep(0.5)
+
+    delivery_latencies = [
+        delivered - sent
+        for websocket in sockets
+        for sent, delivered in zip(sent_times, websocket.delivery_times)
+    ]
+    slow_connection = manager.connections.get(slow_socket)
+
+    print(f"📊 {clients} clients, {messages} messages, slow client policy: {policy}")
+    print(f"   broadcast call  p50 {statistics.median(call_latencies) * 1000:.3f} ms"
+          f"  max {max(call_latencies) * 1000:.3f} ms")
+    print(f"   delivery        p50 {statistics.median(delivery_latencies) * 1000:.3f} ms"
+          f"  p99 {statistics.quantiles(delivery_latencies, n=100)[98] * 1000:.3f} ms")
+    print(f"   fast clients received {min(len(ws.delivery_times) for ws in sockets)}/{messages}")
+    if slow_connection is not None:
+        print(f"   slow client received {len(slow_socket.delivery_times)}, "
+              f"dropped {slow_connection.messages_dropped}")
+    else:
+        print(f"   slow client disconnected after {len(slow_socket.delivery_times)} messages")
+
+    for websocket in list(manager.connections):
+        manager.disconnect(websocket)
+
+def main():
+    parser = argparse.ArgumentParser(description="ITMS WebSocket broadcast benchmark")
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.005, help="Seconds between broadcasts")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="Send delay of the slow client")
+    parser.add_argument("--policy", default="drop_oldest",
+                        choices=["drop_oldest", "coalesce", "disconnect"])
+    args = parser.parse_args()
+
+    # Every simulated client must be admitted, whatever the server limit
+    settings.max_websocket_connections = max(settings.max_websocket_connections, max(args.clients))
+
+    for clients in args.clients:
+        asyncio.run(run(clients, args.messages, args.interval, args.slow_delay, args.policy))
+
+if __name__ == "__main__":
+    main()